@@ -2,15 +2,45 @@
 Make api awesomeness
 '''
 # Import Python libs
+import collections
+import copy
 import inspect
+import sys
+import threading
+import time
 
 # Import Salt libs
 import salt.log  # pylint: disable=W0611
+import salt.auth
 import salt.client
+import salt.client.ssh
+import salt.roster
 import salt.runner
 import salt.wheel
 import salt.utils
-from salt.exceptions import SaltException, EauthAuthenticationError
+import salt.utils.args
+import salt.utils.event
+from salt.utils.event import tagify
+from salt.exceptions import (SaltException, EauthAuthenticationError,
+        SaltClientError, SaltSystemExit)
+
+# Import salt-api libs
+import saltapi.acl
+import saltapi.cache
+import saltapi.coalesce
+import saltapi.collector
+import saltapi.pipeline
+import saltapi.pool
+import saltapi.procpool
+import saltapi.scheduler
+import saltapi.utils
+
+# The positional arguments of LocalClient.cmd
+CMD_ARGS = ('tgt', 'fun', 'arg', 'timeout', 'expr_form', 'ret', 'kwarg')
+
+# The positional arguments of LocalClient.run_job
+RUN_JOB_ARGS = ('tgt', 'fun', 'arg', 'expr_form', 'ret', 'timeout', 'kwarg')
+
 
 class APIClient(object):
     '''
@@ -24,6 +54,13 @@ class APIClient(object):
     def __init__(self, opts):
         self.opts = opts
 
+    @property
+    def pool(self):
+        '''
+        The :py:class:`~saltapi.pool.ClientPool` shared by this process
+        '''
+        return saltapi.pool.get_pool(self.opts)
+
     def run(self, low):
         '''
         Execute the specified function in the specified client by passing the
@@ -36,22 +73,215 @@ class APIClient(object):
             raise EauthAuthenticationError(
                     'No authentication credentials given')
 
+        # Turn away calls the master would refuse before they reach it
+        saltapi.acl.check(self.opts, low)
+
         l_fun = getattr(self, low['client'])
-        f_call = salt.utils.format_call(l_fun, low)
+        f_call = saltapi.utils.format_call(l_fun, low)
+        args, kwargs = f_call.get('args', ()), f_call.get('kwargs', {})
+
+        cache = saltapi.cache.get_cache(self.opts)
+        cached = cache is not None and cache.cacheable(low)
+        coalesced = (low['client'] in saltapi.coalesce.CLIENTS
+                and self.opts.get('api_single_flight', False))
+
+        if not (cached or coalesced):
+            return self._dispatch(low['client'], l_fun, args, kwargs)
+
+        key = saltapi.coalesce.request_key(low, self.opts)
+
+        if cached:
+            ret = cache.get(key)
+            if ret is not None:
+                return ret
+            generation = cache.generation
+
+        # Identical requests already in flight share a single job
+        if coalesced:
+            ret = saltapi.coalesce.get_single_flight().do(key, self._dispatch,
+                    (low['client'], l_fun, args, kwargs))
+        else:
+            ret = self._dispatch(low['client'], l_fun, args, kwargs)
+
+        if cached:
+            cache.set(key, low['fun'], ret, generation)
 
-        ret = l_fun(*f_call.get('args', ()), **f_call.get('kwargs', {}))
         return ret
 
+    def _dispatch(self, client, fun, args, kwargs):
+        '''
+        Call a client interface once the dispatch scheduler admits it
+
+        :raises Overloaded: if the scheduler turns the call away
+        '''
+        scheduler = saltapi.scheduler.get_scheduler(self.opts)
+        if scheduler is None:
+            return fun(*args, **kwargs)
+
+        return scheduler.call(client, fun, args, kwargs)
+
+    def run_many(self, lowstate):
+        '''
+        Execute a list of lowstate chunks and return the results in the same
+        order
+
+        Chunks are run one after another by default. With
+        ``api_run_many_threads`` set in the Salt master config, independent
+        chunks of one request are run at the same time on up to that many
+        threads started for the request. A chunk that includes ``ordered:
+        True`` is order-dependent: it starts only after every chunk before it
+        has finished and every chunk after it waits for it to finish.
+
+        >>> client.run_many([
+        ...     {'client': 'local', 'tgt': 'web*', 'fun': 'test.ping', ...},
+        ...     {'client': 'local', 'tgt': 'db*', 'fun': 'test.ping', ...},
+        ...     {'client': 'runner', 'fun': 'jobs.list_jobs', 'ordered': True,
+        ...         ...},
+        ... ])
+
+        A chunk may also use the results of earlier chunks (see
+        :py:mod:`saltapi.pipeline`); it is order-dependent as above.
+
+        A client return that is an iterator (e.g. from
+        :py:meth:`local_batch`) is expanded in place into one result per item.
+        '''
+        return list(self.run_iter(lowstate))
+
+    def run_iter(self, lowstate):
+        '''
+        Execute a list of lowstate chunks as :py:meth:`run_many` does and
+        yield the result of each chunk as soon as it and every chunk before it
+        have finished
+
+        Chunks after the one being yielded are only started when the iterator
+        is advanced, unless they run at the same time as it.
+        '''
+        threads = self.opts.get('api_run_many_threads', 0)
+
+        # Split the lowstate into groups that may run at the same time
+        groups = [[]]
+        for chunk in lowstate:
+            chunk = dict(chunk)
+            if (chunk.pop('ordered', False) or not threads
+                    or saltapi.pipeline.has_refs(chunk)):
+                groups.extend([[chunk], []])
+            else:
+                groups[-1].append(chunk)
+
+        # The result of each chunk so far, for chunks that refer to them
+        results = []
+        for group in groups:
+            if len(group) > 1:
+                group_ret = self._run_concurrently(group, threads)
+            elif group and saltapi.pipeline.has_refs(group[0]):
+                chunk = saltapi.pipeline.resolve(group[0], results)
+                group_ret = [self._run_chunk(chunk)]
+            else:
+                group_ret = (self._run_chunk(chunk) for chunk in group)
+
+            for chunk_ret, expand in group_ret:
+                results.append(chunk_ret)
+                if expand:
+                    for ret in chunk_ret:
+                        yield ret
+                else:
+                    yield chunk_ret
+
+    def _run_concurrently(self, chunks, threads):
+        '''
+        Run chunks for :py:meth:`run_iter` on up to ``threads`` threads of
+        their own and yield the results in order as they become available
+
+        Chunks that have not started when a chunk fails are not run; the
+        error is raised once the results before it have been yielded.
+        '''
+        pending = collections.deque(enumerate(chunks))
+        results = [None] * len(chunks)
+        done = [threading.Event() for _ in chunks]
+
+        def skip():
+            # Mark every chunk that has not started as done without a result
+            while True:
+                try:
+                    num, _ = pending.popleft()
+                except IndexError:
+                    return
+                done[num].set()
+
+        def work():
+            while True:
+                try:
+                    num, chunk = pending.popleft()
+                except IndexError:
+                    return
+
+                try:
+                    results[num] = (True, self._run_chunk(chunk))
+                except Exception:
+                    results[num] = (False, sys.exc_info())
+                    skip()
+                done[num].set()
+
+        for _ in range(min(threads, len(chunks))):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for num in range(len(chunks)):
+                done[num].wait()
+                if results[num] is None:
+                    # Skipped after an earlier chunk failed; that error is
+                    # raised when its result is reached
+                    continue
+
+                success, ret = results[num]
+                results[num] = None
+                if not success:
+                    raise ret[0], ret[1], ret[2]
+                yield ret
+        finally:
+            skip()
+
+    def _run_chunk(self, low):
+        '''
+        Run a single chunk for :py:meth:`run_iter`
+
+        Iterators are consumed here so that the work is done by the thread
+        that runs the chunk.
+
+        :return: a tuple of the return and whether it came from an iterator
+        '''
+        ret = self.run(low)
+
+        if isinstance(ret, collections.Iterator):
+            return list(ret), True
+
+        return ret, False
+
     def local_async(self, *args, **kwargs):
         '''
         Run :ref:`execution modules <all-salt.modules>` asyncronously
 
-        Wraps :py:meth:`salt.client.LocalClient.run_job`.
+        Wraps :py:meth:`salt.client.LocalClient.run_job`. A ``jid`` may be
+        given for the job to be published under, so that its returns can be
+        subscribed to before it is published.
 
         :return: job ID
         '''
-        local = salt.client.get_local_client(self.opts['conf_file'])
-        return local.run_job(*args, **kwargs)
+        jid = kwargs.pop('jid', None)
+
+        with self.pool.client('local') as local:
+            if not jid:
+                return local.run_job(*args, **kwargs)
+
+            # run_job always leaves the jid to the master
+            kwargs.update(zip(RUN_JOB_ARGS, args))
+            arg = salt.utils.args.condition_input(kwargs.pop('arg', ()),
+                    kwargs.pop('kwarg', None))
+            timeout = local._get_timeout(kwargs.pop('timeout', None))
+            pub_data = local.pub(arg=arg, jid=jid, timeout=timeout, **kwargs)
+            return local._check_pub_data(pub_data)
 
     def local(self, *args, **kwargs):
         '''
@@ -61,8 +291,109 @@ class APIClient(object):
 
         :return: Returns the result from the execution module
         '''
-        local = salt.client.get_local_client(self.opts['conf_file'])
-        return local.cmd(*args, **kwargs)
+        if self.opts.get('api_return_collector', False):
+            return self._local_collect(*args, **kwargs)
+
+        with self.pool.client('local') as local:
+            return local.cmd(*args, **kwargs)
+
+    def _local_collect(self, *args, **kwargs):
+        '''
+        Publish a job and wait for its returns through the shared
+        :py:class:`~saltapi.collector.EventCollector` rather than a
+        per-call event subscription
+
+        ``timeout`` is the total time to wait for the returns; see
+        :py:mod:`saltapi.collector`.
+        '''
+        kwargs.update(zip(CMD_ARGS, args))
+        timeout = kwargs.pop('timeout', None) or self.opts['timeout']
+
+        # Subscribe before publishing so no return can be missed
+        collector = saltapi.collector.get_collector(self.opts)
+
+        with self.pool.client('local') as local:
+            pub_data = local.run_job(**kwargs)
+
+        if not pub_data:
+            return pub_data
+
+        return collector.wait(pub_data['jid'], pub_data['minions'], timeout)
+
+    def local_multi(self, *args, **kwargs):
+        '''
+        Run :ref:`execution modules <all-salt.modules>` syncronously on every
+        master listed in ``api_multi_masters``
+
+        Wraps :py:meth:`salt.client.LocalClient.cmd` once per master, with
+        the job published to every master at the same time.
+        ``api_multi_masters`` is a list of paths to master config files in the
+        Salt master config; it defaults to just this master.
+
+        A minion that returns through more than one master is included once,
+        with the return from the first master in the list.
+
+        An eauth token is only known to the master that issued it, so with
+        more than one master the chunk must include eauth credentials
+        (``eauth``, ``username`` and ``password``); each master checks them
+        itself and any token is not passed on.
+
+        :return: a dictionary with the merged returns of every minion under
+            ``minions`` and, under ``masters``, how long each master took, the
+            minions that returned through it and any error it raised
+        :raises EauthAuthenticationError: if there is more than one master and
+            no eauth credentials were given
+        '''
+        masters = (self.opts.get('api_multi_masters')
+                or [self.opts['conf_file']])
+
+        if len(masters) > 1:
+            if not all(kwargs.get(i) for i in ('eauth', 'username',
+                    'password')):
+                raise EauthAuthenticationError('local_multi needs eauth '
+                        'credentials (eauth, username and password); a '
+                        'token is only valid on the master that issued it')
+            kwargs.pop('token', None)
+
+        # master config path -> (seconds taken, return or None, error or None)
+        results = {}
+
+        def run(conf_file):
+            pool = saltapi.pool.get_pool(dict(self.opts, conf_file=conf_file))
+            start = time.time()
+            try:
+                with pool.client('local') as local:
+                    ret = local.cmd(*args, **kwargs)
+            except Exception as exc:
+                results[conf_file] = (time.time() - start, None, exc)
+            else:
+                results[conf_file] = (time.time() - start, ret, None)
+
+        threads = [threading.Thread(target=run, args=(conf_file,))
+                for conf_file in masters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        errors = [results[i][2] for i in masters if results[i][2] is not None]
+        if len(errors) == len(masters):
+            raise errors[0]
+
+        ret = {'minions': {}, 'masters': {}}
+        for conf_file in masters:
+            elapsed, master_ret, error = results[conf_file]
+            meta = ret['masters'][conf_file] = {'time': elapsed}
+
+            if error is not None:
+                meta['error'] = '{0}: {1}'.format(type(error).__name__, error)
+                continue
+
+            meta['minions'] = sorted(master_ret or {})
+            for minion, minion_ret in (master_ret or {}).items():
+                ret['minions'].setdefault(minion, minion_ret)
+
+        return ret
 
     def local_batch(self, *args, **kwargs):
         '''
@@ -75,8 +406,85 @@ class APIClient(object):
         :return: Returns the result from the exeuction module for each batch of
             returns
         '''
-        local = salt.client.get_local_client(self.opts['conf_file'])
-        return local.cmd_batch(*args, **kwargs)
+        # cmd_batch is a generator that runs as it is iterated, so the pooled
+        # client stays checked out until every batch has returned
+        with self.pool.client('local') as local:
+            for ret in local.cmd_batch(*args, **kwargs):
+                yield ret
+
+    def ssh(self, tgt, fun, arg=(), expr_form='glob', timeout=None,
+            **kwargs):
+        '''
+        Run :ref:`execution modules <all-salt.modules>` over salt-ssh on hosts
+        in the roster
+
+        Wraps :py:meth:`salt.client.ssh.SSH.run_iter`.
+
+        Up to ``ssh_max_procs`` hosts (default ``25``, from the Salt master
+        config) are run at the same time. ``timeout`` overrides
+        ``ssh_timeout``, the number of seconds allowed to connect to each
+        host.
+
+        The caller's credentials are checked here since salt-ssh does not go
+        through the master: the eauth user must be allowed to run ``fun`` on
+        every host in the roster that ``tgt`` matches.
+
+        :return: an iterator of ``{host: return}`` dictionaries in the order
+            the hosts finish
+        '''
+        if isinstance(arg, basestring):
+            arg = [arg]
+
+        opts = copy.deepcopy(self.opts)
+        opts['tgt'] = tgt
+        opts['selected_target_option'] = expr_form
+        opts['argv'] = [fun] + list(arg)
+        if not opts.get('roster'):
+            opts['roster'] = 'flat'
+        if timeout:
+            opts['ssh_timeout'] = timeout
+
+        self._ssh_authorize(opts, fun, kwargs)
+
+        return salt.client.ssh.SSH(opts).run_iter()
+
+    def _ssh_authorize(self, opts, fun, low):
+        '''
+        Check the credentials in ``low`` against the ``external_auth`` config
+        for an :py:meth:`ssh` call
+
+        Permissions are matched as for ``local`` calls, with target-scoped
+        entries matched against the names of the roster hosts the target
+        matches.
+
+        :param opts: the opts the call will be run with
+        :raises EauthAuthenticationError: if the credentials are invalid or do
+            not allow the call
+        :raises SaltClientError: if the target matches no host in the roster
+        '''
+        if 'token' not in low:
+            if not salt.auth.LoadAuth(self.opts).time_auth(low):
+                raise EauthAuthenticationError('Authentication failure')
+
+        # Tokens are validated when their permissions are looked up
+        perms = saltapi.acl.get_permissions(self.opts, low)
+        if perms is None:
+            # The master never sees salt-ssh calls to check them itself
+            raise EauthAuthenticationError(
+                    'salt-ssh calls cannot be authorized by ^ entries')
+
+        # Match the hosts salt-ssh will run on rather than the target itself,
+        # which may be a regular expression or any other kind of target
+        try:
+            hosts = salt.roster.Roster(opts, opts['roster']).targets(
+                    opts['tgt'], opts['selected_target_option'])
+        except SaltSystemExit as exc:
+            raise SaltClientError(str(exc))
+
+        if not perms.allows_targets(fun, sorted(hosts)):
+            raise EauthAuthenticationError(
+                    "Not authorized to run '{0}' over salt-ssh on '{1}'"
+                    .format(fun, opts['tgt']))
 
     def runner(self, fun, **kwargs):
         '''
@@ -86,8 +494,29 @@ class APIClient(object):
 
         :return: Returns the result from the runner module
         '''
-        runner = salt.runner.RunnerClient(self.opts)
-        return runner.low(fun, kwargs)
+        procpool = saltapi.procpool.get_process_pool(self.opts)
+        if procpool is not None:
+            return procpool.run('runner', fun, kwargs)
+
+        with self.pool.client('runner') as runner:
+            return runner.low(fun, kwargs)
+
+    def runner_async(self, fun, **kwargs):
+        '''
+        Run `runner modules <all-salt.runners>` asyncronously
+
+        Wraps :py:meth:`salt.runner.RunnerClient.async`.
+
+        The runner is started in a new process and its return is fired on the
+        event bus (see :ref:`events`) with the tag ``<tag>/ret``.
+
+        :return: a dictionary with the event tag of the runner job
+        '''
+        # The runner is not authenticated by the master
+        user = saltapi.acl.get_user(self.opts, kwargs)
+
+        with self.pool.client('runner') as runner:
+            return runner.async(fun, kwargs, user=user)
 
     def wheel(self, fun, **kwargs):
         '''
@@ -97,6 +526,55 @@ class APIClient(object):
 
         :return: Returns the result from the wheel module
         '''
+        procpool = saltapi.procpool.get_process_pool(self.opts)
+        if procpool is not None:
+            return procpool.run('wheel', fun, kwargs)
+
         kwargs['fun'] = fun
-        wheel = salt.wheel.Wheel(self.opts)
-        return wheel.master_call(**kwargs)
+        with self.pool.client('wheel') as wheel:
+            return wheel.master_call(**kwargs)
+
+    def wheel_async(self, fun, **kwargs):
+        '''
+        Run :ref:`wheel modules <all-salt.wheel>` asyncronously
+
+        The wheel function is called in a background thread through
+        :py:meth:`wheel` and its return is fired on the event bus (see
+        :ref:`events`) with the tag ``<tag>/ret``, as for
+        :py:meth:`runner_async`.
+
+        :return: a dictionary with the event tag and job ID of the wheel job
+        '''
+        user = saltapi.acl.get_user(self.opts, kwargs)
+        jid = salt.utils.gen_jid()
+        tag = tagify(jid, prefix='wheel')
+
+        thread = threading.Thread(target=self._wheel_async,
+                args=(fun, kwargs, tag, jid, user))
+        thread.daemon = True
+        thread.start()
+
+        return {'tag': tag, 'jid': jid}
+
+    def _wheel_async(self, fun, kwargs, tag, jid, user):
+        '''
+        Call a wheel function for :py:meth:`wheel_async` and fire its return
+        '''
+        event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+        data = {
+            'fun': 'wheel.{0}'.format(fun),
+            'jid': jid,
+            'user': user,
+        }
+        event.fire_event(data, tagify('new', base=tag))
+
+        try:
+            data['return'] = self._dispatch('wheel', self.wheel, (fun,),
+                    kwargs)
+            data['success'] = True
+        except Exception as exc:
+            data['return'] = 'Exception occured in wheel {0}: {1}: {2}'.format(
+                    fun, exc.__class__.__name__, exc)
+            data['success'] = False
+
+        event.fire_event(data, tagify('ret', base=tag))
@@ -0,0 +1,326 @@
+'''
+Check eauth permissions before a lowstate chunk reaches Salt
+
+The master checks every publish, runner and wheel call against the
+:conf_master:`external_auth` permissions of the caller, but only after the
+call has been sent to it. :py:class:`~saltapi.APIClient` checks each chunk
+against the same permissions first so that a call the master would refuse is
+turned away in-process.
+
+The permissions of a token are looked up once, when it is created by a
+netapi login or the first time it is seen, and compiled into
+:py:class:`Permissions`. As on the master, they are merged with the
+permissions of the groups the user is in; users only allowed through ``^``
+entries are left to the master. The check is deliberately conservative for
+``local`` calls: permissions that are scoped to a target are matched by the
+master against the minions the target resolves to, so a call is only turned
+away here when no permission could allow its function on any target.
+'''
+# Import python libs
+import collections
+import fnmatch
+import logging
+import re
+import threading
+import time
+
+# Import salt libs
+import salt.auth
+from salt.exceptions import EauthAuthenticationError
+
+# Import salt-api libs
+import saltapi.pipeline
+
+logger = logging.getLogger(__name__)
+
+# How many tokens to keep compiled permissions for
+MAX_TOKENS = 10000
+
+# Client interface -> the kind of permission it needs
+CLIENT_PERMS = {
+    'local': 'local',
+    'local_async': 'local',
+    'local_batch': 'local',
+    'local_multi': 'local',
+    'ssh': 'local',
+    'runner': 'runner',
+    'runner_async': 'runner',
+    'wheel': 'wheel',
+    'wheel_async': 'wheel',
+}
+
+# token -> (expiry time, Permissions)
+_tokens = collections.OrderedDict()
+_tokens_lock = threading.Lock()
+
+
+def _compile(regex):
+    '''
+    Compile a permission regex; an invalid one never matches
+    '''
+    try:
+        return re.compile(regex)
+    except re.error:
+        logger.error('Invalid regular expression in external_auth: %s', regex)
+        return None
+
+
+class Permissions(object):
+    '''
+    A user's ``external_auth`` permission list compiled for fast matching
+    '''
+    def __init__(self, perms):
+        # function regexes allowed on any target
+        self.funs = []
+        # (target glob, function regexes) allowed on matching targets
+        self.scoped = []
+        # names of the form '@runner' or '@jobs' allowed in full
+        self.specials = set()
+        # module name of a '@module' entry -> function regexes in it
+        self.special_funs = collections.defaultdict(list)
+
+        for perm in perms or []:
+            if isinstance(perm, basestring):
+                if perm.startswith('@'):
+                    self.specials.add(perm[1:])
+                else:
+                    self.funs.append(_compile(perm))
+            elif isinstance(perm, dict) and len(perm) == 1:
+                valid, funs = perm.items()[0]
+                if isinstance(funs, basestring):
+                    funs = [funs]
+                funs = [_compile(i) for i in funs or []]
+
+                if valid.startswith('@'):
+                    self.special_funs[valid[1:]].extend(funs)
+                else:
+                    self.scoped.append((valid, funs))
+
+        self.funs = [i for i in self.funs if i is not None]
+
+    @staticmethod
+    def _match(regexes, fun):
+        '''
+        Whether any regex matches the function
+        '''
+        return any(i.match(fun) for i in regexes if i is not None)
+
+    def may_allow_local(self, fun):
+        '''
+        Whether any permission could allow a ``local`` call of ``fun`` (or,
+        for compound calls, of any function in the list ``fun``)
+        '''
+        funs = fun if isinstance(fun, list) else [fun]
+        scoped = [regex for _, regexes in self.scoped for regex in regexes]
+
+        return any(self._match(self.funs, i) or self._match(scoped, i)
+                for i in funs)
+
+    def allows_targets(self, fun, hosts):
+        '''
+        Whether ``fun`` is allowed on every host in ``hosts``, matching
+        target-scoped permissions against the host names
+        '''
+        if self._match(self.funs, fun):
+            return True
+
+        return any(all(fnmatch.fnmatch(i, valid) for i in hosts)
+                and self._match(regexes, fun)
+                for valid, regexes in self.scoped)
+
+    def _allows_special(self, kind, fun):
+        '''
+        Whether a ``runner`` or ``wheel`` function is allowed
+        '''
+        comps = fun.split('.')
+        if len(comps) != 2:
+            return False
+        mod, name = comps
+
+        if self.specials.intersection([kind, kind + 's', mod]):
+            return True
+
+        return self._match(self.special_funs.get(mod, []), name)
+
+    def allows_runner(self, fun):
+        '''
+        Whether the runner function ``fun`` is allowed
+        '''
+        return self._allows_special('runner', fun)
+
+    def allows_wheel(self, fun):
+        '''
+        Whether the wheel function ``fun`` is allowed
+        '''
+        return self._allows_special('wheel', fun)
+
+
+def user_perms(opts, load):
+    '''
+    Return the permission list of a user, merged with the permissions of the
+    groups it is in, or ``None`` if it has none
+
+    As on the master, the ``*`` entry only applies to users that have no
+    entry of their own and are in no configured group (``name%``).
+    '''
+    users = (opts.get('external_auth') or {}).get(load.get('eauth')) or {}
+    name = load.get('username')
+
+    perms = None
+    if name in users:
+        perms = list(users[name] or [])
+
+    group_keys = [i for i in users if i.endswith('%')]
+    if group_keys:
+        groups = salt.auth.LoadAuth(opts).get_groups(load) or []
+        for key in group_keys:
+            if key[:-1] in groups:
+                perms = (perms or []) + list(users[key] or [])
+
+    if perms is None:
+        perms = users.get('*')
+    return perms
+
+
+def _in_db(opts, eauth):
+    '''
+    Whether ``external_auth`` has ``^`` entries, whose permissions only the
+    master can look up
+    '''
+    users = (opts.get('external_auth') or {}).get(eauth) or {}
+    return any(i.startswith('^') for i in users)
+
+
+def remember(token, perms, expire):
+    '''
+    Compile and keep the permissions of a newly created token; ``None``
+    keeps that only the master can check them
+    '''
+    now = time.time()
+    if perms is not None:
+        perms = Permissions(perms)
+
+    with _tokens_lock:
+        _tokens.pop(token, None)
+        _tokens[token] = (expire, perms)
+
+        while _tokens:
+            first_expire, _ = next(iter(_tokens.values()))
+            if first_expire > now and len(_tokens) <= MAX_TOKENS:
+                break
+            _tokens.popitem(last=False)
+
+
+def get_permissions(opts, low):
+    '''
+    Return the :py:class:`Permissions` of the caller of a lowstate chunk, or
+    ``None`` if only the master can check them because the caller is only
+    allowed through ``^`` entries
+
+    :raises EauthAuthenticationError: if the token is invalid or expired or
+        the user has no permissions configured
+    '''
+    if 'token' in low:
+        token = low['token']
+
+        with _tokens_lock:
+            entry = _tokens.get(token)
+
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+        tok_data = salt.auth.LoadAuth(opts).get_tok(token)
+        if not tok_data or tok_data.get('expire', 0) < time.time():
+            raise EauthAuthenticationError('Invalid or expired token')
+
+        load = {'eauth': tok_data['eauth'], 'username': tok_data['name']}
+    else:
+        load = low
+
+    perms = user_perms(opts, load)
+    if perms is None and not _in_db(opts, load.get('eauth')):
+        raise EauthAuthenticationError(
+                "No permissions for user '{0}'".format(load.get('username')))
+
+    if 'token' in low:
+        remember(low['token'], perms, tok_data['expire'])
+        with _tokens_lock:
+            return _tokens[low['token']][1]
+
+    if perms is None:
+        return None
+    return Permissions(perms)
+
+
+def get_user(opts, low):
+    '''
+    Return the name of the authenticated caller of a lowstate chunk, for
+    calls that Salt runs without authenticating them itself
+
+    :raises EauthAuthenticationError: if the token or the eauth credentials
+        are not valid
+    '''
+    auth = salt.auth.LoadAuth(opts)
+
+    if 'token' in low:
+        tok_data = auth.get_tok(low['token'])
+        if not tok_data or tok_data.get('expire', 0) < time.time():
+            raise EauthAuthenticationError('Invalid or expired token')
+        return tok_data['name']
+
+    if 'eauth' not in low or not auth.time_auth(low):
+        raise EauthAuthenticationError('Authentication failed')
+
+    return low['username']
+
+
+def check(opts, low, resolved=True):
+    '''
+    Turn away a lowstate chunk the master would refuse
+
+    Anything that is not a known client interface and a function name (or,
+    for ``local`` calls, a list of function names) is turned away.
+
+    :param resolved: whether the chunk's references to the results of earlier
+        chunks (see :py:mod:`saltapi.pipeline`) have been resolved. A chunk
+        that still has references is only let through when this is ``False``;
+        the caller must check it again once it is resolved.
+    :raises EauthAuthenticationError: if the caller is definitely not allowed
+        to make the call
+    '''
+    if not resolved and saltapi.pipeline.has_refs(low):
+        return
+
+    client = low.get('client')
+    kind = None
+    if isinstance(client, basestring):
+        kind = CLIENT_PERMS.get(client)
+    if kind is None:
+        raise EauthAuthenticationError(
+                'Unknown client interface {0!r}'.format(client))
+
+    fun = low.get('fun', '')
+    if kind == 'local' and isinstance(fun, list):
+        valid = all(isinstance(i, basestring) for i in fun)
+    else:
+        valid = isinstance(fun, basestring)
+    if not valid:
+        raise EauthAuthenticationError(
+                'Invalid function {0!r} for the {1} client'.format(fun, client))
+
+    perms = get_permissions(opts, low)
+    if perms is None:
+        # Left to the master
+        return
+
+    if kind == 'local':
+        allowed = perms.may_allow_local(fun)
+    elif kind == 'runner':
+        allowed = perms.allows_runner(fun)
+    else:
+        allowed = perms.allows_wheel(fun)
+
+    if not allowed:
+        raise EauthAuthenticationError(
+                "Not authorized to run '{0}' with the {1} client"
+                .format(fun, client))
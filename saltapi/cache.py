@@ -0,0 +1,257 @@
+'''
+A result cache for read-only execution functions
+
+Fleet-wide read queries such as ``grains.items`` are slow to answer and are
+sent over and over by dashboards and tooling. The result cache answers a
+repeated synchronous ``local`` request for an allowed function from memory.
+
+Entries expire after a per-function TTL and are evicted least-recently-used
+first once the cache holds too many entries or too much data. Entries are also
+dropped early when the master event bus shows the data may have changed:
+
+* A minion returns from a function that may change the cached data. By default
+  these are functions in the same module as the cached function plus anything
+  in ``saltutil`` or ``state``; for example, ``grains.setval`` or
+  ``saltutil.refresh_grains`` invalidate ``grains.items``. The cached
+  functions themselves and functions matching ``read_only`` (e.g.,
+  ``grains.get``) never invalidate. Only entries that include that minion are
+  dropped.
+* A minion key is accepted, rejected or deleted. Every entry is dropped since
+  the minions matched by a target may have changed.
+
+A return is not cached if an event that invalidates entries arrived while the
+function was running. Each caller gets its own copy of a cached return.
+
+Cached results are keyed by the full request and the caller's credentials, as
+for :py:mod:`single-flight <saltapi.coalesce>`.
+
+The cache is configured in the Salt master config:
+
+.. code-block:: yaml
+
+    api_result_cache:
+      # Function name: TTL in seconds
+      functions:
+        grains.items: 300
+        pkg.list_pkgs: 600
+        sys.doc: 3600
+      # Optional settings and their defaults
+      max_entries: 1000
+      max_size: 67108864
+      # Extra function globs whose returns invalidate a cached function
+      invalidate:
+        pkg.list_pkgs:
+          - cmd.run
+      # Function globs whose returns never invalidate; replaces the default
+      read_only:
+        - '*.get'
+        - '*.item'
+        - '*.items'
+'''
+# Import python libs
+import collections
+import copy
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+
+# Import salt-api libs
+import saltapi.collector
+
+logger = logging.getLogger(__name__)
+
+# Returns from these modules may change any cached data for a minion
+INVALIDATING_MODULES = ('saltutil', 'state')
+
+# Returns from functions matching these globs never invalidate
+READ_ONLY = ('*.get', '*.item', '*.items', '*.ls', '*.list', '*.list_*',
+        '*.show', '*.show_*', '*.version', '*.versions', 'sys.*', 'test.*')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(opts):
+    '''
+    Return the :py:class:`ResultCache` for the master config in ``opts`` or
+    ``None`` if the cache is not configured
+    '''
+    cache_opts = opts.get('api_result_cache')
+    if not cache_opts:
+        return None
+
+    key = opts.get('conf_file')
+
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or cache.pid != os.getpid():
+            cache = _caches[key] = ResultCache(opts, cache_opts)
+            cache.watch_events()
+
+    return cache
+
+
+class _Entry(object):
+    '''
+    A cached return
+    '''
+    __slots__ = ('fun', 'ret', 'expires', 'size', 'minions')
+
+    def __init__(self, fun, ret, ttl, size):
+        self.fun = fun
+        self.ret = ret
+        self.expires = time.time() + ttl
+        self.size = size
+        self.minions = set(ret) if isinstance(ret, dict) else set()
+
+
+class ResultCache(object):
+    '''
+    A TTL and LRU cache of ``local`` returns invalidated by master events
+    '''
+    def __init__(self, opts, cache_opts):
+        self.opts = opts
+        self.pid = os.getpid()
+
+        self.ttls = dict(cache_opts.get('functions', {}))
+        self.max_entries = cache_opts.get('max_entries', 1000)
+        self.max_size = cache_opts.get('max_size', 64 * 1024 * 1024)
+
+        # cached function -> function globs whose returns invalidate it
+        extra = cache_opts.get('invalidate', {})
+        self.invalidators = {}
+        for fun in self.ttls:
+            self.invalidators[fun] = (
+                    ['{0}.*'.format(fun.split('.', 1)[0])]
+                    + ['{0}.*'.format(i) for i in INVALIDATING_MODULES]
+                    + list(extra.get(fun, [])))
+        self.read_only = list(cache_opts.get('read_only', READ_ONLY))
+
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Bumped whenever entries are invalidated; see set()
+        self.generation = 0
+
+    def cacheable(self, low):
+        '''
+        Whether the return of a lowstate chunk may be cached
+        '''
+        return low.get('client') == 'local' and low.get('fun') in self.ttls
+
+    def get(self, key):
+        '''
+        Return the cached return for ``key`` or ``None``
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            if entry.expires < time.time():
+                self._size -= entry.size
+                return None
+
+            # Re-insert to mark as most recently used
+            self._entries[key] = entry
+            ret = entry.ret
+
+        # The caller may change the return it is given
+        return copy.deepcopy(ret)
+
+    def set(self, key, fun, ret, generation=None):
+        '''
+        Cache the return of ``fun`` under ``key``
+
+        Empty returns are not cached; they usually mean no minion answered in
+        time. Pass the :py:attr:`generation` read before ``fun`` was called so
+        that a return is not cached if entries were invalidated in the
+        meantime; it may already be stale.
+        '''
+        if not ret:
+            return
+
+        try:
+            size = len(json.dumps(ret, default=repr))
+        except (TypeError, ValueError):
+            return
+
+        if size > self.max_size:
+            return
+
+        ret = copy.deepcopy(ret)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._drop(key)
+            self._entries[key] = _Entry(fun, ret, self.ttls[fun], size)
+            self._size += size
+
+            while (len(self._entries) > self.max_entries
+                    or self._size > self.max_size):
+                _, entry = self._entries.popitem(last=False)
+                self._size -= entry.size
+
+    def _drop(self, key):
+        '''
+        Remove an entry; the lock must be held
+        '''
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def clear(self):
+        '''
+        Drop every entry
+        '''
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def invalidate(self, minion, fun):
+        '''
+        Drop entries that include ``minion`` and may be changed by a return
+        from ``fun``
+        '''
+        # Read-only functions never invalidate
+        if fun in self.ttls or any(fnmatch.fnmatch(fun, i)
+                for i in self.read_only):
+            return
+
+        stale = set(cached for cached, globs in self.invalidators.items()
+                if any(fnmatch.fnmatch(fun, i) for i in globs))
+        if not stale:
+            return
+
+        with self._lock:
+            self.generation += 1
+            for key, entry in list(self._entries.items()):
+                if entry.fun in stale and minion in entry.minions:
+                    self._drop(key)
+
+    def handle_event(self, tag, data):
+        '''
+        Invalidate entries based on an event from the master event bus
+        '''
+        if tag.startswith('salt/key'):
+            logger.debug('Minion keys changed; clearing the result cache')
+            self.clear()
+        elif isinstance(data, dict) and 'return' in data:
+            if 'id' in data and 'fun' in data:
+                self.invalidate(data['id'], data['fun'])
+
+    def watch_events(self):
+        '''
+        Feed master events to :py:meth:`handle_event` through the process's
+        shared :py:class:`~saltapi.collector.EventCollector`
+        '''
+        collector = saltapi.collector.get_collector(self.opts)
+        # Events may be missed while the collector reconnects
+        collector.add_listener(self.handle_event, reset=self.clear)
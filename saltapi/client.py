@@ -1,27 +1,415 @@
 '''
 The main entry point for salt-api
+
+Each netapi module is run in its own process under a :py:class:`Supervisor`,
+which restarts a module that crashes. Restarts are delayed with an exponential
+backoff so a module that cannot start does not spin. The backoff is
+configured in the Salt master config:
+
+api_restart_backoff : ``1``
+    Seconds to wait before the first restart of a crashed module; the wait
+    doubles with each crash in a row.
+api_restart_backoff_max : ``60``
+    The longest wait between restarts. A module that stays up for this long
+    is considered healthy again and its backoff is reset.
+api_reload_timeout : ``30``
+    Seconds a server process may spend finishing in-flight requests and
+    streams after a reload or shutdown before it is killed.
+
+Sending ``SIGHUP`` to ``salt-api`` reloads it without dropping connections.
+The master config is read again and each netapi module that supports it
+(``rest_cherrypy`` and ``rest_tornado``) starts new server processes with
+the new settings on the sockets it is already listening on. The old
+processes stop accepting connections and exit once their in-flight requests
+are done or ``api_reload_timeout`` has passed. Changing the address or port
+a module listens on, or enabling another module, still needs a restart.
 '''
 # Import python libs
 import logging
 import multiprocessing
+import os
+import signal
+import time
+
+# Import salt libs
+import salt.utils.event
+from salt.utils.event import tagify
 
 # Import salt-api libs
+import saltapi.config
 import saltapi.loader
 
 logger = logging.getLogger(__name__)
 
+# Set in a supervised process to tell the supervisor it is ready
+_ready = None
+
+
+def notify_ready():
+    '''
+    Tell the supervisor of this process that it is ready to serve requests
+
+    This does nothing in a process that is not supervised.
+    '''
+    if _ready is not None:
+        _ready.set()
+
+
+def _run_worker(target, args, ready):
+    '''
+    Run a supervised process with the default signal handlers rather than
+    the supervisor's
+    '''
+    global _ready
+    _ready = ready
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+        signal.signal(signum, signal.SIG_DFL)
+    # A process that does not support reloading carries on as it is
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    target(*args)
+
+
+class _Worker(object):
+    '''
+    A supervised process and its restart history
+    '''
+    def __init__(self, name, target, args):
+        self.name = name
+        self.target = target
+        self.args = args
+
+        self.process = None
+        self.ready = None
+        self.started = None
+        self.restarts = 0
+        # crashes in a row, for the backoff
+        self.crashes = 0
+        # when to restart after a crash
+        self.restart_at = None
+
+
+class Supervisor(object):
+    '''
+    Run processes and restart them when they crash
+
+    >>> supervisor = Supervisor(__opts__)
+    >>> supervisor.add('rest_cherrypy.start', start)
+    >>> supervisor.run()
+
+    :py:meth:`run` blocks until the supervisor receives ``SIGTERM`` or
+    ``SIGINT``; the signal is passed on to every process before it returns.
+    ``SIGUSR1`` logs the :py:meth:`status` of every process.
+
+    ``SIGHUP`` calls ``reload`` with the supervisor, which is expected to
+    :py:meth:`replace` the processes. Without a ``reload`` callable the
+    signal is passed on to every process instead.
+
+    A process calls :py:func:`notify_ready` once it accepts requests. When
+    every process is ready the supervisor tells its own supervisor and, if it
+    has a ``name``, fires a ``salt/netapi/<name>/ready`` event.
+    '''
+    def __init__(self, opts, reload=None, name=None):
+        self.opts = opts
+        self.name = name
+        self.backoff = opts.get('api_restart_backoff', 1)
+        self.backoff_max = opts.get('api_restart_backoff_max', 60)
+        self.reload_timeout = opts.get('api_reload_timeout', 30)
+        self.reload_callback = reload
+
+        self.workers = {}
+        # processes being replaced that keep serving until the new ones are
+        # ready, and when to stop waiting for that
+        self.replaced = []
+        self.replace_deadline = None
+        # (process, deadline) of replaced processes that are finishing up
+        self.retiring = []
+        self.all_ready = False
+        self.stopping = False
+        self.reloading = False
+
+    def add(self, name, target, args=()):
+        '''
+        Add a process to supervise; it is started by :py:meth:`run`
+        '''
+        self.workers[name] = _Worker(name, target, args)
+
+    def _start(self, worker):
+        '''
+        Start the process for a worker
+        '''
+        worker.ready = multiprocessing.Event()
+        worker.process = multiprocessing.Process(target=_run_worker,
+                args=(worker.target, worker.args, worker.ready),
+                name=worker.name)
+        worker.process.start()
+        worker.started = time.time()
+        worker.restart_at = None
+
+    def replace(self, workers):
+        '''
+        Start a new set of processes and retire the current ones
+
+        The current processes keep serving until every new one is ready, or
+        for up to ``api_reload_timeout`` seconds. They are then sent
+        ``SIGTERM`` and are killed if they have not exited within another
+        ``api_reload_timeout`` seconds.
+
+        :param workers: a list of ``(name, target, args)`` tuples as for
+            :py:meth:`add`
+        '''
+        old, self.workers = self.workers, {}
+        self.replaced.extend(i.process for i in old.values()
+                if i.process is not None)
+        self.replace_deadline = time.time() + self.reload_timeout
+        self.all_ready = False
+
+        for name, target, args in workers:
+            self.add(name, target, args)
+            self._start(self.workers[name])
+
+    def _is_ready(self):
+        '''
+        Whether every process has told the supervisor it is ready
+        '''
+        return all(i.process is not None and i.ready.is_set()
+                for i in self.workers.values())
+
+    def _check_ready(self, now):
+        '''
+        Retire replaced processes and report readiness once every process is
+        ready
+        '''
+        ready = self._is_ready()
+
+        if self.replaced and (ready or now >= self.replace_deadline):
+            if not ready:
+                logger.warning('New processes are not ready after %s '
+                        'seconds; retiring the old ones anyway',
+                        self.reload_timeout)
+
+            deadline = now + self.reload_timeout
+            for process in self.replaced:
+                if process.is_alive():
+                    process.terminate()
+                    self.retiring.append((process, deadline))
+            self.replaced = []
+
+        if ready and not self.all_ready:
+            self.all_ready = True
+            notify_ready()
+
+            if self.name is None:
+                logger.info('All processes are ready')
+            else:
+                logger.info("'%s' is ready", self.name)
+                self._fire(tagify([self.name, 'ready'], 'netapi'),
+                        self.status())
+
+    def _reap(self, now):
+        '''
+        Collect retired processes that have exited and kill those that are
+        past their deadline
+        '''
+        for process, deadline in list(self.retiring):
+            if process.is_alive() and now < deadline:
+                continue
+
+            if process.is_alive():
+                logger.warning("'%s' (%s) was still busy after %s seconds; "
+                        "killing it", process.name, process.pid,
+                        self.reload_timeout)
+                os.kill(process.pid, signal.SIGKILL)
+
+            process.join()
+            self.retiring.remove((process, deadline))
+
+    def _check(self, worker, now):
+        '''
+        Schedule or make the restart of a worker whose process has exited
+        '''
+        if worker.restart_at is not None:
+            if now >= worker.restart_at:
+                logger.info("Restarting '%s' api module", worker.name)
+                worker.restarts += 1
+                self._start(worker)
+                self._fire_restart(worker)
+            return
+
+        if worker.process is None or worker.process.is_alive():
+            return
+
+        exitcode = worker.process.exitcode
+        if exitcode == 0:
+            logger.info("'%s' api module exited", worker.name)
+            worker.process = None
+            return
+
+        if now - worker.started >= self.backoff_max:
+            worker.crashes = 0
+
+        delay = min(self.backoff * 2 ** worker.crashes, self.backoff_max)
+        worker.crashes += 1
+        worker.restart_at = now + delay
+
+        logger.error("'%s' api module exited with code %s; restarting in %s "
+                "seconds", worker.name, exitcode, delay)
+
+    def _fire_restart(self, worker):
+        '''
+        Announce a restart on the master event bus
+        '''
+        self._fire(tagify([worker.name, 'restart'], 'netapi'),
+                self.status()[worker.name])
+
+    def _fire(self, tag, data):
+        '''
+        Fire an event on the master event bus
+        '''
+        try:
+            event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+            event.fire_event(data, tag)
+        except Exception:
+            logger.debug('Unable to fire %s event', tag, exc_info=True)
+
+    def status(self):
+        '''
+        Return the pid, uptime in seconds and restart count of each process
+
+        :return: a dictionary of process name to status dictionary
+        '''
+        now = time.time()
+        ret = {}
+        for name, worker in self.workers.items():
+            alive = worker.process is not None and worker.process.is_alive()
+            ret[name] = {
+                'pid': worker.process.pid if alive else None,
+                'alive': alive,
+                'uptime': now - worker.started if alive else 0,
+                'ready': alive and worker.ready.is_set(),
+                'restarts': worker.restarts,
+            }
+        return ret
+
+    def _log_status(self, signum, frame):
+        '''
+        Log the status of every process
+        '''
+        for name, status in sorted(self.status().items()):
+            logger.warning('%s: %s', name, status)
+
+    def _signal_reload(self, signum, frame):
+        '''
+        Reload from the main loop rather than in the signal handler
+        '''
+        self.reloading = True
+
+    def _reload(self):
+        '''
+        Reload the processes; they are left as they are if that fails
+        '''
+        if self.reload_callback is None:
+            for worker in self.workers.values():
+                if worker.process is not None and worker.process.is_alive():
+                    os.kill(worker.process.pid, signal.SIGHUP)
+            return
+
+        try:
+            self.reload_callback(self)
+        except Exception:
+            logger.error('Unable to reload; the current processes are left '
+                    'running', exc_info=True)
+
+    def _signal_stop(self, signum, frame):
+        '''
+        Stop supervising when told to exit
+        '''
+        logger.info('Received signal %s; stopping api modules', signum)
+        self.stopping = True
+
+    def run(self):
+        '''
+        Start every process and keep them running until told to stop
+        '''
+        signal.signal(signal.SIGTERM, self._signal_stop)
+        signal.signal(signal.SIGINT, self._signal_stop)
+        signal.signal(signal.SIGUSR1, self._log_status)
+        signal.signal(signal.SIGHUP, self._signal_reload)
+
+        for worker in self.workers.values():
+            self._start(worker)
+
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                logger.info('Received SIGHUP; reloading')
+                self._reload()
+
+            now = time.time()
+            for worker in self.workers.values():
+                self._check(worker, now)
+            self._check_ready(now)
+            self._reap(now)
+            time.sleep(0.5)
+
+        self.stop()
+
+    def stop(self, timeout=None):
+        '''
+        Send ``SIGTERM`` to every process and wait up to ``timeout`` seconds
+        (by default ``api_reload_timeout``) for them to exit before killing
+        them
+        '''
+        if timeout is None:
+            timeout = self.reload_timeout
+
+        running = [i.process for i in self.workers.values()
+                if i.process is not None and i.process.is_alive()]
+        running.extend(process for process, _ in self.retiring
+                if process.is_alive())
+        running.extend(i for i in self.replaced if i.is_alive())
+
+        for process in running:
+            process.terminate()
+
+        deadline = time.time() + timeout
+        for process in running:
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                logger.error("'%s' did not exit; killing it", process.name)
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+
+
 class SaltAPIClient(object):
     '''
     '''
     def __init__(self, opts):
         self.opts = opts
 
+    def reload(self, supervisor):
+        '''
+        Check that the master config still loads and pass ``SIGHUP`` on to
+        the api modules so they reload it
+        '''
+        saltapi.config.api_config(self.opts['conf_file'])
+
+        for name, worker in supervisor.workers.items():
+            if worker.process is not None and worker.process.is_alive():
+                logger.info("Reloading '%s' api module", name)
+                os.kill(worker.process.pid, signal.SIGHUP)
+
     def run(self):
         '''
         Load and start all available api modules
         '''
         netapi = saltapi.loader.netapi(self.opts)
+        supervisor = Supervisor(self.opts, reload=self.reload)
+
         for fun in netapi:
             if fun.endswith('.start'):
                 logger.info("Starting '{0}' api module".format(fun))
-                multiprocessing.Process(target=netapi[fun]).start()
+                supervisor.add(fun, netapi[fun])
+
+        supervisor.run()
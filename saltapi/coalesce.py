@@ -0,0 +1,118 @@
+'''
+Coalesce identical in-flight lowstate requests
+
+Dashboards and monitoring tools tend to send the same request many times a
+second. With single-flight enabled, a synchronous request that is identical to
+one already in flight does not publish a new job; it waits for the job that is
+already running and returns the same result.
+
+Requests are identical when they describe the same job (client, target,
+function, arguments and any other options) and carry the same credentials, so
+a request is never answered with a result its caller would not have been
+authorized to see.
+
+Enable it in the Salt master config:
+
+api_single_flight : ``False``
+    Share one job between identical in-flight ``local`` requests.
+'''
+# Import python libs
+import hashlib
+import json
+import os
+import threading
+
+# The clients whose calls may be coalesced
+CLIENTS = ('local',)
+
+# Lowstate keys that carry credentials rather than describe the job
+AUTH_KEYS = ('token', 'eauth', 'username', 'password')
+
+
+def request_key(low, opts):
+    '''
+    Return a hash identifying the job described by ``low``, the credentials it
+    is run with and the master it is sent to
+
+    Omitted options hash the same as their defaults and list targets hash the
+    same in any order.
+    '''
+    job = dict((key, val) for key, val in low.items() if key not in AUTH_KEYS)
+    job.setdefault('expr_form', 'glob')
+    job.setdefault('arg', [])
+    job.setdefault('kwarg', {})
+
+    if job['expr_form'] == 'list' and isinstance(job.get('tgt'), list):
+        job['tgt'] = sorted(job['tgt'])
+
+    auth = [low.get(key) for key in AUTH_KEYS]
+
+    blob = json.dumps([opts.get('conf_file'), job, auth],
+            sort_keys=True, default=repr)
+    return hashlib.sha1(blob).hexdigest()
+
+
+class _Call(object):
+    '''
+    A call in flight and its eventual outcome
+    '''
+    def __init__(self):
+        self.done = threading.Event()
+        self.ret = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Run at most one call per key at a time; concurrent callers with the same
+    key wait for and share the outcome of the call already running
+    '''
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fun, args=(), kwargs=None):
+        '''
+        Call ``fun`` with ``args`` and ``kwargs`` unless a call for ``key`` is
+        already in flight, then return its return or raise its exception
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.ret
+
+        try:
+            call.ret = fun(*args, **(kwargs or {}))
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.ret
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    '''
+    Return the :py:class:`SingleFlight` shared by this process
+    '''
+    global _single_flight
+
+    with _single_flight_lock:
+        if _single_flight is None or _single_flight[0] != os.getpid():
+            _single_flight = (os.getpid(), SingleFlight())
+
+    return _single_flight[1]
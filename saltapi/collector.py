@@ -0,0 +1,250 @@
+'''
+A single master event subscription shared by everything in a salt-api process
+
+:py:meth:`LocalClient.cmd <salt.client.LocalClient.cmd>` opens an event
+subscription for each call and checks every event on the bus for its own job
+ID. With many threads waiting on jobs, every event is unpacked and checked
+once per thread. The :py:class:`EventCollector` instead reads the bus once in
+a background thread and routes job returns to the callers waiting on that job
+through an index keyed by job ID. Other consumers of the event bus in the
+process (such as the :py:mod:`result cache <saltapi.cache>`) register as
+listeners rather than opening subscriptions of their own.
+
+Synchronous ``local`` calls use the collector when it is enabled in the Salt
+master config:
+
+api_return_collector : ``False``
+    Wait for the returns of ``local`` calls through the shared collector.
+
+    With the collector, ``timeout`` is the total time a call waits for every
+    targeted minion to return. Unlike :py:meth:`LocalClient.cmd
+    <salt.client.LocalClient.cmd>`, the wait is not extended while minions
+    report the job as still running, so ``timeout`` must cover the slowest
+    expected return; minions that have not returned by then are left out.
+'''
+# Import python libs
+import collections
+import logging
+import os
+import threading
+import time
+
+# Import salt libs
+import salt.utils.event
+
+logger = logging.getLogger(__name__)
+
+# How long returns for a job nobody is waiting on yet are kept. A job can
+# return before the caller that published it starts waiting. At most
+# EARLY_MAX jobs and EARLY_MAX_RETURNS returns in total are kept; the oldest
+# jobs are dropped first.
+EARLY_TTL = 10
+EARLY_MAX = 10000
+EARLY_MAX_RETURNS = 100000
+
+# The most seconds to wait for a new subscription to reach the event
+# publisher, and how often to probe it
+SUBSCRIBE_TIMEOUT = 5
+PROBE_INTERVAL = 0.1
+
+_collectors = {}
+_collectors_lock = threading.Lock()
+
+
+def get_collector(opts):
+    '''
+    Return the running :py:class:`EventCollector` for the master config in
+    ``opts``
+    '''
+    key = opts.get('conf_file')
+
+    with _collectors_lock:
+        collector = _collectors.get(key)
+        if collector is None or collector.pid != os.getpid():
+            collector = _collectors[key] = EventCollector(opts)
+            collector.start()
+
+    return collector
+
+
+class _Waiter(object):
+    '''
+    A caller waiting on the returns of a job
+    '''
+    def __init__(self, minions):
+        self.minions = set(minions)
+        self.ret = {}
+        self.done = threading.Event()
+
+        if not self.minions:
+            self.done.set()
+
+    def add(self, data):
+        '''
+        Record a return event for the job
+        '''
+        self.ret[data['id']] = data['return']
+        if self.minions.issubset(self.ret):
+            self.done.set()
+
+
+class EventCollector(object):
+    '''
+    Read the master event bus in one thread and route events to waiters and
+    listeners
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.pid = os.getpid()
+
+        # jid -> _Waiter
+        self._waiters = {}
+        # jid -> (time first seen, [return events]) for jobs not waited on
+        self._early = collections.OrderedDict()
+        self._early_returns = 0
+        # (callback(tag, data), reset callback or None)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback, reset=None):
+        '''
+        Call ``callback(tag, data)`` for every event on the bus
+
+        :param reset: called without arguments when events may have been
+            missed because the connection to the bus was lost
+        '''
+        with self._lock:
+            self._listeners.append((callback, reset))
+
+    def start(self):
+        '''
+        Subscribe to the bus and start routing events in a daemon thread
+
+        The subscription is made before returning so that no event published
+        after this call is missed.
+        '''
+        event = self._connect()
+
+        thread = threading.Thread(target=self._run, args=(event,),
+                name='api-event-collector')
+        thread.daemon = True
+        thread.start()
+
+    def _connect(self):
+        '''
+        Connect to the bus and return the event object once the subscription
+        has reached the publisher
+
+        A ZeroMQ subscription takes a moment to reach the publisher and events
+        published meanwhile are not received. A probe event is fired until it
+        comes back; events read while waiting for it are routed as usual.
+        '''
+        event = salt.utils.event.get_event('master', opts=self.opts)
+        event.subscribe()
+
+        tag = 'salt/api/collector/{0}/{1}'.format(self.pid, id(self))
+        deadline = time.time() + SUBSCRIBE_TIMEOUT
+        while time.time() < deadline:
+            try:
+                event.fire_event({}, tag)
+            except Exception:
+                logger.debug('Could not fire an event on the master event bus',
+                        exc_info=True)
+
+            data = event.get_event(wait=PROBE_INTERVAL, full=True)
+            while data:
+                if data.get('tag') == tag:
+                    return event
+                self._route(data.get('tag', ''), data.get('data'))
+                data = event.get_event(wait=PROBE_INTERVAL, full=True)
+
+        logger.warning('Could not confirm the subscription to the master event '
+                'bus; returns published now may be missed')
+        return event
+
+    def _run(self, event):
+        '''
+        Read the event bus forever, reconnecting after errors
+        '''
+        while True:
+            try:
+                while True:
+                    data = event.get_event(wait=5, full=True)
+                    if data:
+                        self._route(data.get('tag', ''), data.get('data'))
+            except Exception:
+                logger.error('Error reading the master event bus',
+                        exc_info=True)
+
+                for _, reset in list(self._listeners):
+                    if reset is not None:
+                        reset()
+
+                time.sleep(5)
+                event = self._connect()
+
+    def _route(self, tag, data):
+        '''
+        Hand an event to the waiter for its job and to every listener
+        '''
+        if (isinstance(data, dict) and 'jid' in data and 'id' in data
+                and 'return' in data):
+            self._route_return(data)
+
+        for callback, _ in list(self._listeners):
+            try:
+                callback(tag, data)
+            except Exception:
+                logger.error('Error in event listener %r', callback,
+                        exc_info=True)
+
+    def _route_return(self, data):
+        '''
+        Hand a job return to its waiter or keep it until one arrives
+        '''
+        jid = data['jid']
+        now = time.time()
+
+        with self._lock:
+            waiter = self._waiters.get(jid)
+            if waiter is not None:
+                waiter.add(data)
+                return
+
+            self._early.setdefault(jid, (now, []))[1].append(data)
+            self._early_returns += 1
+
+            while self._early:
+                first, _ = next(iter(self._early.values()))
+                if (first > now - EARLY_TTL
+                        and len(self._early) <= EARLY_MAX
+                        and self._early_returns <= EARLY_MAX_RETURNS):
+                    break
+                _, (_, returns) = self._early.popitem(last=False)
+                self._early_returns -= len(returns)
+
+    def wait(self, jid, minions, timeout):
+        '''
+        Wait for the returns of a job
+
+        :param minions: the minions expected to return
+        :param timeout: the most seconds to wait in total for all of them
+        :return: a dictionary of minion ID to return for the minions that
+            returned in time
+        '''
+        waiter = _Waiter(minions)
+
+        with self._lock:
+            self._waiters[jid] = waiter
+            returns = self._early.pop(jid, (None, []))[1]
+            self._early_returns -= len(returns)
+            for data in returns:
+                waiter.add(data)
+
+        try:
+            waiter.done.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters.pop(jid, None)
+
+        return dict(waiter.ret)
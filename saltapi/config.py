@@ -1,9 +1,34 @@
 '''
 Manage configuration files in salt-api
+
+Parsing the master config and its includes is slow, so each config is parsed
+once and the result is shared: every call for the same file in a process
+returns the same opts dictionary, and a snapshot of it is kept on disk so a
+new process can skip parsing too. A snapshot is used only while the config
+file, its included files and the directories they are included from are
+unchanged and for the same Salt and salt-api versions.
+
+The shared opts dictionary must be treated as read-only; copy it before
+changing anything in it.
 '''
+# Import python libs
+import cPickle as pickle
+import errno
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import threading
 
 # Import salt libs
 import salt.config
+import salt.version
+
+# Import salt-api libs
+import saltapi.version
+
+log = logging.getLogger(__name__)
 
 DEFAULT_API_OPTS = {
     # ----- Salt master settings overridden by Salt-API --------------------->
@@ -12,15 +37,195 @@ DEFAULT_API_OPTS = {
     # <---- Salt master settings overridden by Salt-API ----------------------
 }
 
+# Where config snapshots are kept on disk
+SNAPSHOT_DIR = os.path.join(salt.config.DEFAULT_MASTER_OPTS['cachedir'],
+        'api_config')
 
-def api_config(path):
+# (kind, path) -> (fingerprint, opts)
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def _parse_master(path):
     '''
     Read in the salt master config file and add additional configs that
     need to be stubbed out for salt-api
     '''
     # Let's grab a copy of salt's master default opts
-    defaults = salt.config.DEFAULT_MASTER_OPTS
+    defaults = dict(salt.config.DEFAULT_MASTER_OPTS)
     # Let's override them with salt-api's required defaults
     defaults.update(DEFAULT_API_OPTS)
 
     return salt.config.master_config(path, defaults=defaults)
+
+
+def _parse_client(path):
+    '''
+    Read in the salt master config file for use with Salt's clients
+    '''
+    return salt.config.client_config(path)
+
+
+PARSERS = {
+    'master': _parse_master,
+    'client': _parse_client,
+}
+
+
+def _sources(kind, path, opts):
+    '''
+    Return the files and directories a parsed config was read from
+    '''
+    sources = [path]
+
+    includes = opts.get('include') or []
+    if isinstance(includes, basestring):
+        includes = [includes]
+
+    for include in [opts.get('default_include')] + list(includes):
+        if not include:
+            continue
+
+        include = os.path.expanduser(include)
+        if not os.path.isabs(include):
+            include = os.path.join(os.path.dirname(path), include)
+
+        # Files added to or removed from the directory change its mtime
+        sources.append(os.path.dirname(include))
+        sources.extend(sorted(glob.glob(include)))
+
+    if kind == 'client':
+        sources.append(os.path.expanduser('~/.salt'))
+        if opts.get('token_file'):
+            sources.append(opts['token_file'])
+
+    return sources
+
+
+def _fingerprint(sources):
+    '''
+    Return the mtime of each source, or ``None`` for missing ones
+    '''
+    ret = []
+    for source in sources:
+        try:
+            ret.append((source, os.stat(source).st_mtime))
+        except OSError:
+            ret.append((source, None))
+    return ret
+
+
+def _is_current(fingerprint):
+    '''
+    Whether none of the sources of a snapshot have changed
+    '''
+    return _fingerprint([i[0] for i in fingerprint]) == fingerprint
+
+
+def _versions():
+    '''
+    The versions a snapshot is only valid for
+    '''
+    return (salt.version.__version__, saltapi.version.__version__)
+
+
+def _snapshot_path(kind, path):
+    '''
+    Return the on-disk location of the snapshot of a config
+    '''
+    return os.path.join(SNAPSHOT_DIR, '{0}-{1}.p'.format(kind,
+            hashlib.sha1(path).hexdigest()))
+
+
+def _read_snapshot(kind, path):
+    '''
+    Return the fingerprint and opts of a current on-disk snapshot or ``None``
+    '''
+    snapshot_path = _snapshot_path(kind, path)
+
+    try:
+        with open(snapshot_path, 'rb') as fp_:
+            # Only trust a snapshot nobody else could have written
+            stat = os.fstat(fp_.fileno())
+            if stat.st_uid != os.getuid() or stat.st_mode & 0022:
+                return None
+
+            versions, fingerprint, opts = pickle.load(fp_)
+    except IOError as exc:
+        if exc.errno != errno.ENOENT:
+            log.debug('Unable to read config snapshot %s', snapshot_path,
+                    exc_info=True)
+        return None
+    except Exception:
+        log.debug('Ignoring invalid config snapshot %s', snapshot_path,
+                exc_info=True)
+        return None
+
+    if versions != _versions() or not _is_current(fingerprint):
+        return None
+
+    return fingerprint, opts
+
+
+def _write_snapshot(kind, path, fingerprint, opts):
+    '''
+    Save a snapshot to disk; failing to is not an error
+    '''
+    tmp_path = None
+    try:
+        if not os.path.isdir(SNAPSHOT_DIR):
+            os.makedirs(SNAPSHOT_DIR, 0700)
+
+        fd_, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR)
+        with os.fdopen(fd_, 'wb') as fp_:
+            pickle.dump((_versions(), fingerprint, opts), fp_,
+                    pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, _snapshot_path(kind, path))
+    except Exception:
+        log.debug('Unable to save config snapshot for %s', path,
+                exc_info=True)
+
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_config(kind, path):
+    '''
+    Return the shared opts dictionary for a config file
+
+    :param kind: ``master`` for the salt-api config or ``client`` for the
+        config used by Salt's clients
+    :param path: the path to the Salt master config file
+    '''
+    path = os.path.abspath(path)
+    key = (kind, path)
+
+    with _snapshots_lock:
+        entry = _snapshots.get(key)
+        if entry is not None and _is_current(entry[0]):
+            return entry[1]
+
+        entry = _read_snapshot(kind, path)
+        if entry is None:
+            opts = PARSERS[kind](path)
+            entry = (_fingerprint(_sources(kind, path, opts)), opts)
+            _write_snapshot(kind, path, *entry)
+
+        _snapshots[key] = entry
+        return entry[1]
+
+
+def api_config(path):
+    '''
+    Read in the salt master config file and add additional configs that
+    need to be stubbed out for salt-api
+    '''
+    return get_config('master', path)
+
+
+def client_config(path):
+    '''
+    Read in the salt master config file as :py:func:`salt.config.client_config`
+    does
+    '''
+    return get_config('client', path)
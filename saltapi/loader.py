@@ -9,12 +9,37 @@ import salt.loader
 import saltapi
 
 
+# netapi module -> the master config section that enables it
+NETAPI_MANIFEST = {
+    'rest_cherrypy': 'rest_cherrypy',
+    'rest_tornado': 'rest_tornado',
+    'rest_wsgi': 'rest_wsgi',
+}
+
+
+def unconfigured_netapis(opts):
+    '''
+    Return the names of the netapi modules in the manifest whose config
+    section is missing from ``opts``
+    '''
+    return set(name for name, key in NETAPI_MANIFEST.items()
+            if not opts.get(key))
+
+
 def netapi(opts):
     '''
     Return the network api functions
+
+    Modules in :py:data:`NETAPI_MANIFEST` that are not configured are skipped
+    without being imported, so their dependencies are not loaded into the
+    salt-api process. Other modules are imported and decide in
+    ``__virtual__`` whether to load.
     '''
+    disabled = set(opts.get('disable_netapis') or [])
+    disabled.update(unconfigured_netapis(opts))
+
     load = salt.loader._create_loader(
-            opts,
+            dict(opts, disable_netapis=sorted(disabled)),
             'netapi',
             'netapi',
             base_path=os.path.dirname(saltapi.__file__)
@@ -34,7 +34,7 @@ def __virtual__():
         # run the module and increase logging severity to be helpful
 
         # Everything looks good; return the module name
-        if not cpy_error and 'port' in mod_opts:
+        if not cpy_error and ('port' in mod_opts or 'socket_path' in mod_opts):
             return True
 
         # CherryPy wasn't imported; explain why
@@ -51,9 +51,9 @@ def __virtual__():
                     __name__, error_msg)
 
         # Missing port config
-        if not 'port' in mod_opts:
-            logger.error("Not loading '%s'. 'port' not specified in config",
-                    __name__)
+        if not 'port' in mod_opts and not 'socket_path' in mod_opts:
+            logger.error("Not loading '%s'. 'port' or 'socket_path' not "
+                    "specified in config", __name__)
 
     return False
 
@@ -69,6 +69,40 @@ def verify_certs(*args):
         if not os.path.exists(arg):
             raise Exception(msg.format(arg))
 
+def configure_ssl(apiopts):
+    '''
+    Set up the CherryPy server for SSL unless it is disabled
+
+    :return: ``False`` if SSL is enabled but not configured
+    '''
+    if apiopts.get('disable_ssl', False):
+        return True
+
+    if not 'ssl_crt' in apiopts or not 'ssl_key' in apiopts:
+        logger.error("Not starting '%s'. Options 'ssl_crt' and "
+                "'ssl_key' are required if SSL is not disabled.",
+                __name__)
+
+        return False
+
+    verify_certs(apiopts['ssl_crt'], apiopts['ssl_key'])
+
+    import saltapi.netutil
+    from . import ssl_adapter
+
+    cherrypy.server.ssl_module = 'builtin'
+    cherrypy.server.ssl_certificate = apiopts['ssl_crt']
+    cherrypy.server.ssl_private_key = apiopts['ssl_key']
+
+    # One context for every connection so that sessions can be resumed
+    context = saltapi.netutil.ssl_context(apiopts['ssl_crt'],
+            apiopts['ssl_key'], ciphers=apiopts.get('ssl_ciphers'),
+            tickets=apiopts.get('ssl_session_tickets', True))
+    if context is not None:
+        cherrypy.server.ssl_module = ssl_adapter.NAME
+        cherrypy.server.ssl_context = context
+    return True
+
 def start():
     '''
     Start the server loop
@@ -76,23 +110,109 @@ def start():
     from . import app
     root, apiopts, conf = app.get_app(__opts__)
 
-    if not apiopts.get('disable_ssl', False):
-        if not 'ssl_crt' in apiopts or not 'ssl_key' in apiopts:
-            logger.error("Not starting '%s'. Options 'ssl_crt' and "
-                    "'ssl_key' are required if SSL is not disabled.",
-                    __name__)
-
-            return None
-
-        verify_certs(apiopts['ssl_crt'], apiopts['ssl_key'])
-
-        cherrypy.server.ssl_module = 'builtin'
-        cherrypy.server.ssl_certificate = apiopts['ssl_crt']
-        cherrypy.server.ssl_private_key = apiopts['ssl_key']
+    if not configure_ssl(apiopts):
+        return None
+
+    # Development mode reloads the process so it always runs single-process
+    if not apiopts.get('debug', False):
+        return start_workers(root, apiopts, conf)
+
+    # Fork the runner and wheel workers before any thread is started
+    import saltapi.procpool
+    saltapi.procpool.get_process_pool(__opts__)
+
+    if apiopts.get('warmup', False):
+        import saltapi.warmup
+        saltapi.warmup.warm_up(__opts__)
+
+    if 'socket_path' in apiopts:
+        import saltapi.netutil
+        from . import server
+        # CherryPy replaces any file at the path and makes it world-writable
+        saltapi.netutil.remove_stale_socket(apiopts['socket_path'])
+        cherrypy.server.httpserver, cherrypy.server.bind_addr = \
+                cherrypy.server.httpserver_from_self()
+        cherrypy.server.httpserver.wsgi_app = server.unix_socket_app(
+                cherrypy.server.httpserver.wsgi_app)
+        mode = saltapi.netutil.file_mode(apiopts.get('socket_mode', 0660))
+        cherrypy.engine.subscribe('start',
+                lambda: os.chmod(apiopts['socket_path'], mode), priority=80)
 
     def signal_handler(*args):
         cherrypy.engine.exit()
         sys.exit(0)
     signal.signal(signal.SIGINT, signal_handler)
 
+    from . import server
+    server.ignore_sighup()
+
     cherrypy.quickstart(root, apiopts.get('root_prefix', '/'), conf)
+
+def _address(apiopts):
+    '''
+    Return what the server listens on: a Unix socket path or a host and port
+    '''
+    if 'socket_path' in apiopts:
+        return apiopts['socket_path']
+    return (apiopts.get('host', '0.0.0.0'), apiopts['port'])
+
+def _workers(sock, root, apiopts, conf, opts):
+    '''
+    Return the name, target and args of each worker process
+    '''
+    from . import server
+
+    return [('{0}-worker-{1}'.format(__name__, num), server.serve,
+                (sock, root, apiopts.get('root_prefix', '/'), conf, opts,
+                    apiopts.get('warmup', False)))
+            for num in range(apiopts.get('workers', 1))]
+
+def start_workers(root, apiopts, conf):
+    '''
+    Bind the listening socket and run supervised worker processes that all
+    serve the already-loaded app from it
+
+    On ``SIGHUP`` the config is read again and a new set of workers with the
+    new app takes over the socket while the old workers finish their
+    requests.
+    '''
+    from . import app
+    import saltapi.client
+    import saltapi.config
+    import saltapi.netutil
+
+    address = _address(apiopts)
+    if 'socket_path' in apiopts:
+        sock = saltapi.netutil.bind_unix_socket(address,
+                apiopts.get('socket_mode', 0660),
+                apiopts.get('socket_queue_size', 30))
+    else:
+        sock = saltapi.netutil.bind_socket(address[0], address[1],
+                apiopts.get('socket_queue_size', 30))
+
+    def reload(supervisor):
+        opts = saltapi.config.api_config(__opts__['conf_file'])
+        root, apiopts, conf = app.get_app(opts)
+
+        if _address(apiopts) != address:
+            logger.warning("'%s' keeps listening on %s; changing the "
+                    "address needs a restart", __name__, address)
+
+        if not configure_ssl(apiopts):
+            return
+
+        logger.info("Starting new '%s' workers", __name__)
+        supervisor.replace(_workers(sock, root, apiopts, conf, opts))
+
+    supervisor = saltapi.client.Supervisor(__opts__, reload=reload,
+            name=__name__)
+    for name, target, args in _workers(sock, root, apiopts, conf, __opts__):
+        supervisor.add(name, target, args)
+
+    logger.info("Starting %s '%s' workers on %s",
+            apiopts.get('workers', 1), __name__, address)
+    try:
+        supervisor.run()
+    finally:
+        if 'socket_path' in apiopts:
+            os.remove(address)
@@ -42,6 +42,13 @@ A REST API for Salt
         The socket interface for the HTTP server to listen on.
 
         .. versionadded:: 0.8.2
+    socket_path
+        Listen on a Unix socket at this path instead of ``host`` and ``port``,
+        e.g. for a reverse proxy on the same machine. A socket file left
+        behind by an earlier run is removed. SSL still applies unless
+        ``disable_ssl`` is set.
+    socket_mode : ``0660``
+        The permissions of the ``socket_path`` file.
     debug : ``False``
         Starts the web server in development mode. It will reload itself when
         the underlying code is changed and will output more debugging info.
@@ -49,6 +56,13 @@ A REST API for Salt
         The path to a SSL certificate. (See below)
     ssl_key
         The path to the private key for your SSL certificate. (See below)
+    ssl_ciphers
+        The OpenSSL cipher list to offer. By default only ECDHE and DHE
+        ciphers are offered, ECDHE first, and the server's order is used.
+    ssl_session_tickets : ``True``
+        Issue TLS session tickets so that a client that reconnects can resume
+        its session instead of making a full handshake. Sessions are also
+        cached by each worker process.
     disable_ssl
         A flag to disable SSL. Warning: your Salt authentication credentials
         will be sent in the clear!
@@ -110,6 +124,34 @@ A REST API for Salt
         for serving multiple applications from the same URL.
 
         .. versionadded:: 0.8.4
+    workers : ``1``
+        The number of server processes to run. The app is loaded once and each
+        process accepts connections from the same listening socket, so
+        requests are spread across CPU cores. A process that crashes is
+        restarted. Ignored in ``debug`` mode.
+
+        Sessions are stored in files under ``session_path`` so that a session
+        token works in any process and survives a reload (``SIGHUP``).
+    session_path : ``<cachedir>/rest_cherrypy_sessions``
+        The directory to store sessions in. Sessions are kept in memory in
+        ``debug`` mode.
+    warmup : ``False``
+        Connect to the master, load the runner and wheel modules, read the
+        eauth tokens and list the minions before accepting requests, so the
+        first requests after a (re)start are not slow. See
+        :py:mod:`saltapi.warmup`.
+    stream_response : ``False``
+        Send the results of lowstate calls as each chunk finishes, with
+        chunked transfer encoding, rather than build the whole response
+        first. The output is the same JSON, YAML or MessagePack but it is
+        encoded one chunk, and one minion within a chunk, at a time. This
+        keeps memory use down for calls with large returns, such as
+        ``grains.items`` on many minions. MessagePack output starts once
+        every chunk has finished.
+
+        Headers are sent once the first chunk has finished, so an error in a
+        later chunk cannot change the status code. The error message is sent
+        in place of that chunk's return and the remaining chunks are not run.
 
 .. _rest_cherrypy-auth:
 
@@ -136,13 +178,18 @@ requests to the URLs detailed below.
 .. admonition:: Content negotiation
 
     This REST interface is flexible in what data formats it will accept as well
-    as what formats it will return (e.g., JSON, YAML, x-www-form-urlencoded).
+    as what formats it will return (e.g., JSON, YAML, MessagePack,
+    x-www-form-urlencoded).
 
     * Specify the format of data in the request body by including the
       :mailheader:`Content-Type` header.
     * Specify the desired data format for the response body with the
       :mailheader:`Accept` header.
 
+    MessagePack (``application/msgpack``) is the format Salt uses internally;
+    it is smaller than JSON and quicker to encode and decode, which matters
+    for large returns.
+
 Data sent in :http:method:`post` and :http:method:`put` requests  must be in
 the format of a list of lowstate dictionaries. This allows multiple commands to
 be executed in a single HTTP request.
@@ -172,6 +219,17 @@ The following example (in JSON format) causes Salt to execute two commands::
         "jid": "20130603122505459265"
     }]
 
+Commands in the list are executed in order and their results are returned in
+the same order. With ``api_run_many_threads`` set in the Salt master config,
+up to that many commands of one request are executed at the same time; a
+command that depends on the commands before it (e.g., a job lookup) should
+then include ``"ordered": true`` so it does not start until the commands
+before it have finished.
+
+A command may also use the results of the commands before it in the same
+request, for example to target only the minions that returned ``true`` from an
+earlier command. See :py:mod:`saltapi.pipeline` for the syntax.
+
 .. admonition:: x-www-form-urlencoded
 
     Sending JSON or YAML in the request body is simple and most flexible,
@@ -214,6 +272,8 @@ import itertools
 import functools
 import logging
 import json
+import os
+import struct
 import time
 from multiprocessing import Process, Pipe
 
@@ -225,10 +285,13 @@ import yaml
 # Import Salt libs
 import salt
 import salt.auth
+import salt.payload
 import salt.utils.event
 
 # Import salt-api libs
 import saltapi
+import saltapi.acl
+import saltapi.scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -299,6 +362,9 @@ def salt_auth_tool():
     # Session is authenticated; inform caches
     cherrypy.response.headers['Cache-Control'] = 'private'
 
+# Salt's own msgpack serializer
+serial = salt.payload.Serial('msgpack')
+
 # Be conservative in what you send
 # Maps Content-Type to serialization functions; this is a tuple of tuples to
 # preserve order of preference.
@@ -306,8 +372,186 @@ ct_out_map = (
     ('application/json', json.dumps),
     ('application/x-yaml', functools.partial(
         yaml.safe_dump, default_flow_style=False)),
+    ('application/msgpack', serial.dumps),
+    ('application/x-msgpack', serial.dumps),
+)
+
+# How much encoded output to collect before writing it out when streaming
+STREAM_BUFFER_SIZE = 64 * 1024
+
+def _buffered(parts, size=STREAM_BUFFER_SIZE):
+    '''
+    Join small strings into writes of about ``size`` bytes
+    '''
+    buf, buf_len = [], 0
+    for part in parts:
+        buf.append(part)
+        buf_len += len(part)
+        if buf_len >= size:
+            yield ''.join(buf)
+            buf, buf_len = [], 0
+
+    if buf:
+        yield ''.join(buf)
+
+def _json_chunk(chunk):
+    '''
+    Encode one lowstate return as JSON, a minion at a time
+    '''
+    if not isinstance(chunk, dict):
+        yield json.dumps(chunk)
+        return
+
+    # Each pair is encoded by json.dumps so keys that are not strings are
+    # converted exactly as it converts them
+    yield '{'
+    for i, (key, value) in enumerate(chunk.items()):
+        yield '{0}{1}'.format(', ' if i else '',
+                json.dumps({key: value})[1:-1])
+    yield '}'
+
+def json_stream(ret):
+    '''
+    Encode a response as the same JSON :py:func:`json.dumps` gives, one
+    lowstate return at a time
+    '''
+    yield '{'
+    for i, (key, value) in enumerate(ret.items()):
+        if i:
+            yield ', '
+
+        if key != 'return':
+            yield json.dumps({key: value})[1:-1]
+            continue
+
+        yield '{0}: ['.format(json.dumps(key))
+        for j, chunk in enumerate(value):
+            if j:
+                yield ', '
+            for part in _json_chunk(chunk):
+                yield part
+        yield ']'
+    yield '}'
+
+# The line width yaml.safe_dump wraps long scalars at by default
+YAML_WIDTH = 80
+
+def _yaml_chunk(chunk):
+    '''
+    Encode one lowstate return as an item of a YAML list, a minion at a time
+    '''
+    if not isinstance(chunk, dict) or not chunk:
+        yield yaml.safe_dump([chunk], default_flow_style=False)
+        return
+
+    # Each minion is dumped two columns to the left of where it ends up, so
+    # lines are wrapped two columns earlier to wrap where safe_dump would
+    for i, (key, value) in enumerate(sorted(chunk.items())):
+        lines = yaml.safe_dump({key: value}, default_flow_style=False,
+                width=YAML_WIDTH - 2).splitlines(True)
+        yield ('  ' if i else '- ') + lines[0]
+        for line in lines[1:]:
+            yield '  ' + line
+
+def yaml_stream(ret):
+    '''
+    Encode a response as the same YAML :py:func:`yaml.safe_dump` gives, one
+    lowstate return at a time
+    '''
+    for key, value in sorted(ret.items()):
+        if key != 'return':
+            yield yaml.safe_dump({key: value}, default_flow_style=False)
+            continue
+
+        empty = True
+        for chunk in value:
+            if empty:
+                yield 'return:\n'
+                empty = False
+            for part in _yaml_chunk(chunk):
+                yield part
+
+        if empty:
+            yield 'return: []\n'
+
+def _msgpack_header(size, fixtype, type16, type32):
+    '''
+    Return the MessagePack header of an array or map of ``size`` items
+    '''
+    if size < 16:
+        return chr(fixtype | size)
+    elif size < 2 ** 16:
+        return struct.pack('>BH', type16, size)
+    return struct.pack('>BI', type32, size)
+
+def msgpack_stream(ret):
+    '''
+    Encode a response as the same MessagePack :py:data:`serial` gives, one
+    minion at a time
+
+    A MessagePack array starts with its length, so every lowstate return is
+    collected before the first is written.
+    '''
+    yield _msgpack_header(len(ret), 0x80, 0xde, 0xdf)
+    for key, value in ret.items():
+        yield serial.dumps(key)
+
+        if key != 'return':
+            yield serial.dumps(value)
+            continue
+
+        chunks = list(value)
+        yield _msgpack_header(len(chunks), 0x90, 0xdc, 0xdd)
+        for chunk in chunks:
+            if not isinstance(chunk, dict):
+                yield serial.dumps(chunk)
+                continue
+
+            yield _msgpack_header(len(chunk), 0x80, 0xde, 0xdf)
+            for minion, minion_ret in chunk.items():
+                yield serial.dumps(minion)
+                yield serial.dumps(minion_ret)
+
+# Maps Content-Type to functions that encode a response incrementally when
+# stream_response is on; in the same order as ct_out_map
+ct_stream_map = (
+    ('application/json', json_stream),
+    ('application/x-yaml', yaml_stream),
+    ('application/msgpack', msgpack_stream),
+    ('application/x-msgpack', msgpack_stream),
 )
 
+def _primed(chunks):
+    '''
+    Run an iterator of lowstate returns up to its first return, so that errors
+    in validating the request and in the first chunk are raised before the
+    response starts
+    '''
+    chunks = iter(chunks)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter([])
+    return itertools.chain([first], chunks)
+
+def _stream_errors(chunks):
+    '''
+    Send an error message in place of a lowstate return that fails once the
+    response has started
+    '''
+    try:
+        for chunk in chunks:
+            yield chunk
+    except Exception as exc:
+        import traceback
+
+        logger.error("Error while streaming response for: %s",
+                cherrypy.request.path_info, exc_info=True)
+
+        yield ('{0}'.format(traceback.format_exc(exc))
+                if cherrypy.config['debug']
+                else "An unexpected error occurred")
+
 def hypermedia_handler(*args, **kwargs):
     '''
     Determine the best output format based on the Accept header, execute the
@@ -320,11 +564,25 @@ def hypermedia_handler(*args, **kwargs):
     # Execute the real handler. Handle or pass-through any errors we know how
     # to handle (auth & HTTP errors). Reformat any errors we don't know how to
     # handle as a data structure.
+    stream = False
     try:
         cherrypy.response.processors = dict(ct_out_map) # handlers may modify this
         ret = cherrypy.serving.request._hypermedia_inner_handler(*args, **kwargs)
+
+        if (cherrypy.config['apiopts'].get('stream_response', False)
+                and isinstance(ret, dict) and isinstance(ret.get('return'),
+                    (list, collections.Iterator))):
+            ret['return'] = _stream_errors(_primed(ret['return']))
+            stream = True
     except salt.exceptions.EauthAuthenticationError:
         raise cherrypy.InternalRedirect('/login')
+    except saltapi.scheduler.Overloaded as exc:
+        cherrypy.response.status = 503
+        cherrypy.response.headers['Retry-After'] = str(exc.retry_after)
+
+        ret = {
+            'status': cherrypy.response.status,
+            'return': '{0}'.format(exc)}
     except cherrypy.CherryPyException:
         raise
     except Exception as exc:
@@ -347,6 +605,11 @@ def hypermedia_handler(*args, **kwargs):
 
     # Transform the output from the handler into the requested output format
     cherrypy.response.headers['Content-Type'] = best
+
+    if stream:
+        cherrypy.response.stream = True
+        return _buffered(dict(ct_stream_map)[best](ret))
+
     out = cherrypy.response.processors[best]
     return out(ret)
 
@@ -425,6 +688,21 @@ def yaml_processor(entity):
         raise cherrypy.HTTPError(400, 'Invalid YAML document')
 
 
+@process_request_body
+def msgpack_processor(entity):
+    '''
+    Unserialize raw POST data in MessagePack format to a Python data
+    structure.
+
+    :param entity: raw POST data
+    '''
+    body = entity.fp.read()
+    try:
+        cherrypy.serving.request.unserialized_data = serial.loads(body)
+    except ValueError:
+        raise cherrypy.HTTPError(400, 'Invalid MessagePack document')
+
+
 @process_request_body
 def text_processor(entity):
     '''
@@ -458,6 +736,8 @@ def hypermedia_in():
         'application/json': json_processor,
         'application/x-yaml': yaml_processor,
         'text/yaml': yaml_processor,
+        'application/msgpack': msgpack_processor,
+        'application/x-msgpack': msgpack_processor,
         'text/plain': text_processor,
     }
 
@@ -554,8 +834,7 @@ class LowDataAdapter(object):
         if type(lowstate) != list:
             raise cherrypy.HTTPError(400, 'Lowstates must be a list')
 
-        # Make any requested additions or modifications to each lowstate, then
-        # execute each one and yield the result.
+        # Make any requested additions or modifications to each lowstate
         for chunk in lowstate:
             if token:
                 chunk['token'] = token
@@ -568,14 +847,23 @@ class LowDataAdapter(object):
             if 'arg' in chunk and not isinstance(chunk['arg'], list):
                 chunk['arg'] = [chunk['arg']]
 
-            ret = self.api.run(chunk)
+        # Execute the chunks and yield the results in order as they finish.
+        # Iterator returns are already expanded.
+        for ret in self.api.run_iter(lowstate):
+            yield ret
 
-            # Sometimes Salt gives us a return and sometimes an iterator
-            if isinstance(ret, collections.Iterator):
-                for i in ret:
-                    yield i
-            else:
-                yield ret
+    def lowstate_returns(self, client=None, token=None):
+        '''
+        Return the results of :py:meth:`exec_lowstate` for the ``return`` key
+        of a response
+
+        With ``stream_response`` on they are left as an iterator, for the
+        response to be sent as each chunk finishes.
+        '''
+        ret = self.exec_lowstate(client=client, token=token)
+        if not cherrypy.config['apiopts'].get('stream_response', False):
+            ret = list(ret)
+        return ret
 
     def GET(self):
         '''
@@ -610,8 +898,10 @@ class LowDataAdapter(object):
 
         # Grab all available client interfaces
         clients = [name for name, _ in inspect.getmembers(saltapi.APIClient,
-            predicate=inspect.ismethod) if not name.startswith('__')]
-        clients.remove('run') # run method calls client interfaces
+            predicate=inspect.ismethod) if not name.startswith('_')]
+        # run methods call client interfaces
+        clients.remove('run')
+        clients.remove('run_many')
 
         return {
             'return': "Welcome",
@@ -677,8 +967,8 @@ class LowDataAdapter(object):
                 ms-4: true
         '''
         return {
-            'return': list(self.exec_lowstate(
-                token=cherrypy.session.get('token')))
+            'return': self.lowstate_returns(
+                token=cherrypy.session.get('token')),
         }
 
 
@@ -729,8 +1019,8 @@ class Minions(LowDataAdapter):
             'client': 'local', 'tgt': mid or '*', 'fun': 'grains.items',
         }]
         return {
-            'return': list(self.exec_lowstate(
-                token=cherrypy.session.get('token'))),
+            'return': self.lowstate_returns(
+                token=cherrypy.session.get('token')),
         }
 
     def POST(self, **kwargs):
@@ -1040,7 +1330,8 @@ class Login(LowDataAdapter):
 
         # Grab eauth config for the current backend for the current user
         try:
-            perms = self.opts['external_auth'][token['eauth']][token['name']]
+            perms = saltapi.acl.user_perms(self.opts, dict(creds,
+                    eauth=token['eauth'], username=token['name']))
         except (AttributeError, IndexError):
             logger.debug("Configuration for external_auth malformed for "\
                 "eauth '{0}', and user '{1}'."
@@ -1048,6 +1339,9 @@ class Login(LowDataAdapter):
             raise cherrypy.HTTPError(500,
                 'Configuration for external_auth could not be read.')
 
+        # Compile the permissions now so calls are checked without a lookup
+        saltapi.acl.remember(token['token'], perms, token['expire'])
+
         return {'return': [{
             'token': cherrypy.session.id,
             'expire': token['expire'],
@@ -1138,7 +1432,7 @@ class Run(LowDataAdapter):
                 ms-4: true
         '''
         return {
-            'return': list(self.exec_lowstate()),
+            'return': self.lowstate_returns(),
         }
 
 
@@ -1727,6 +2021,7 @@ class API(object):
             'global': {
                 'server.socket_host': self.apiopts.get('host', '0.0.0.0'),
                 'server.socket_port': self.apiopts.get('port', 8000),
+                'server.socket_file': self.apiopts.get('socket_path'),
                 'server.thread_pool': self.apiopts.get('thread_pool', 100),
                 'server.socket_queue_size': self.apiopts.get('queue_size', 30),
                 'max_request_body_size': self.apiopts.get('max_request_body_size', 1048576),
@@ -1744,6 +2039,21 @@ class API(object):
 
         if self.apiopts.get('debug', False) == False:
             conf['global']['environment'] = 'production'
+            # Let workers finish their requests when they are replaced
+            conf['global']['server.shutdown_timeout'] = self.opts.get(
+                    'api_reload_timeout', 30)
+
+            # Share sessions between worker processes and across reloads
+            session_path = self.apiopts.get('session_path',
+                    os.path.join(self.opts['cachedir'],
+                        'rest_cherrypy_sessions'))
+            if not os.path.isdir(session_path):
+                os.makedirs(session_path, 0700)
+
+            conf['/'].update({
+                'tools.sessions.storage_type': 'file',
+                'tools.sessions.storage_path': session_path,
+            })
 
         # Serve static media if the directory has been set in the configuration
         if 'static' in self.apiopts:
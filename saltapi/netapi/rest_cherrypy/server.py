@@ -0,0 +1,133 @@
+'''
+Run the CherryPy HTTP server on a socket inherited from a parent process
+
+This is used to run several ``rest_cherrypy`` worker processes that all
+accept connections from one listening socket (see the ``workers`` setting).
+'''
+# Import python libs
+import socket
+import threading
+import time
+
+# Import CherryPy libs
+import cherrypy
+import cherrypy.process.servers
+from cherrypy._cpwsgi_server import CPWSGIServer
+
+# Import salt-api libs
+import saltapi.client
+import saltapi.procpool
+import saltapi.warmup
+
+
+def unix_socket_app(app):
+    '''
+    Wrap a WSGI app to give requests from a Unix socket a port; CherryPy
+    fails on the empty ``SERVER_PORT`` its server sets for them
+    '''
+    def wrapper(environ, start_response):
+        if not environ.get('SERVER_PORT'):
+            environ['SERVER_PORT'] = '0'
+        return app(environ, start_response)
+    return wrapper
+
+
+class InheritedSocketServer(CPWSGIServer):
+    '''
+    A CherryPy WSGI server that serves on an already-listening socket rather
+    than binding its own
+    '''
+    def __init__(self, sock, server_adapter=cherrypy.server):
+        self.inherited_socket = sock
+        self.accepting = True
+        self.accept_stopped = threading.Event()
+        CPWSGIServer.__init__(self, server_adapter)
+
+        if sock.family == socket.AF_UNIX:
+            # Given the path to start with, the server would remove the
+            # socket file and make a new one world-writable; bind() sets it
+            self.bind_addr = ('localhost', 0)
+            self.wsgi_app = unix_socket_app(self.wsgi_app)
+
+    def tick(self):
+        '''
+        Accept a connection unless the server is stopping
+        '''
+        if self.accepting:
+            return CPWSGIServer.tick(self)
+
+        self.accept_stopped.set()
+        time.sleep(0.1)
+
+    def stop(self):
+        '''
+        Stop accepting connections, then stop the server
+
+        The server drops a connection it accepts once it is stopping. That
+        is meant for its own connection to wake up ``accept()``, but with a
+        shared socket it may be a client's that another process could have
+        served, so accepting is stopped first.
+        '''
+        self.accepting = False
+        # accept() times out after a second
+        self.accept_stopped.wait(2)
+
+        CPWSGIServer.stop(self)
+
+    def bind(self, family, type, proto=0):
+        '''
+        Use the inherited socket
+        '''
+        self.socket = self.inherited_socket
+
+        if self.socket.family == socket.AF_UNIX:
+            self.bind_addr = self.socket.getsockname()
+
+        if self.ssl_adapter is not None:
+            self.socket = self.ssl_adapter.bind(self.socket)
+
+
+def ignore_sighup():
+    '''
+    Keep CherryPy from handling ``SIGHUP``
+
+    ``salt-api`` passes ``SIGHUP`` on to a module to reload it. CherryPy's
+    own handler would restart the process in place instead, so the signal
+    is left ignored as the supervisor set it.
+    '''
+    signal_handler = getattr(cherrypy.engine, 'signal_handler', None)
+    if signal_handler is not None:
+        signal_handler.handlers.pop('SIGHUP', None)
+
+
+def serve(sock, root, script_name, conf, opts, warmup=False):
+    '''
+    Serve the app on the inherited socket until the engine exits
+
+    :param opts: the master config
+    :param warmup: whether to :py:func:`warm up <saltapi.warmup.warm_up>`
+        before accepting connections
+    '''
+    # Fork the runner and wheel workers before any thread is started
+    saltapi.procpool.get_process_pool(opts)
+
+    if warmup:
+        saltapi.warmup.warm_up(opts)
+
+    # The default server would bind the port itself; its check that the port
+    # is free would also fail since the socket is already listening
+    cherrypy.server.unsubscribe()
+
+    httpserver = InheritedSocketServer(sock)
+    adapter = cherrypy.process.servers.ServerAdapter(cherrypy.engine,
+            httpserver, None)
+    adapter.subscribe()
+
+    # Once the server has started (priority 75)
+    cherrypy.engine.subscribe('start', saltapi.client.notify_ready,
+            priority=80)
+
+    # The supervisor replaces workers on reload rather than signalling them
+    ignore_sighup()
+
+    cherrypy.quickstart(root, script_name, conf)
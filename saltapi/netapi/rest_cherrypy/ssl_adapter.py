@@ -0,0 +1,51 @@
+'''
+A CherryPy SSL adapter that wraps connections with one shared SSL context
+
+CherryPy's ``builtin`` adapter calls :py:func:`ssl.wrap_socket` for each
+connection, which builds a new context every time so a client can never
+resume an earlier TLS session. This adapter wraps every connection with the
+context from :py:func:`saltapi.netutil.ssl_context` instead.
+'''
+# Import python libs
+import ssl
+import sys
+
+# Import CherryPy libs
+from cherrypy import wsgiserver
+from cherrypy.wsgiserver.ssl_builtin import BuiltinSSLAdapter
+
+# The name to give as ``server.ssl_module``
+NAME = 'saltapi_context'
+
+
+class ContextSSLAdapter(BuiltinSSLAdapter):
+    '''
+    Wrap connections with the SSL context set as ``server.ssl_context``
+    '''
+    context = None
+
+    def wrap(self, sock):
+        '''
+        Wrap and return the given socket, plus WSGI environ entries
+        '''
+        try:
+            sslsock = self.context.wrap_socket(sock, server_side=True,
+                    do_handshake_on_connect=True)
+        except ssl.SSLError as exc:
+            if exc.errno == ssl.SSL_ERROR_EOF:
+                # The engine checking that the port is open
+                return None, {}
+            elif exc.errno == ssl.SSL_ERROR_SSL:
+                if 'http request' in str(exc):
+                    # The client is speaking HTTP to an HTTPS server
+                    raise wsgiserver.NoSSLError
+                elif 'unknown protocol' in str(exc):
+                    return None, {}
+            raise
+
+        return sslsock, self.get_environ(sslsock)
+
+
+# Register the adapter where CherryPy looks adapters up by name
+_wsgiserver = sys.modules[wsgiserver.get_ssl_adapter_class.__module__]
+_wsgiserver.ssl_adapters[NAME] = ContextSSLAdapter
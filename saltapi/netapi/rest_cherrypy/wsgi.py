@@ -45,6 +45,7 @@ An example Apache virtual host configuration::
 # pylint: disable=C0103
 
 import os
+import threading
 
 import cherrypy
 
@@ -53,9 +54,9 @@ def bootstrap_app():
     Grab the opts dict of the master config by trying to import Salt
     '''
     from saltapi.netapi.rest_cherrypy import app
-    import salt.config
+    import saltapi.config
 
-    __opts__ = salt.config.client_config(
+    __opts__ = saltapi.config.client_config(
             os.environ.get('SALT_MASTER_CONFIG', '/etc/salt/master'))
     return app.get_app(__opts__)
 
@@ -67,12 +68,21 @@ def get_application(*args):
     installation
     '''
     opts_tuple = args
+    # Whether the app has been mounted; it is set up on the first request.
+    # Concurrent first requests on a threaded server wait for one to mount it.
+    mounted = []
+    mount_lock = threading.Lock()
 
     def wsgi_app(environ, start_response):
-        root, _, conf = opts_tuple or bootstrap_app()
-        cherrypy.config.update({'environment': 'embedded'})
+        if not mounted:
+            with mount_lock:
+                if not mounted:
+                    root, _, conf = opts_tuple or bootstrap_app()
+                    cherrypy.config.update({'environment': 'embedded'})
+
+                    cherrypy.tree.mount(root, '/', conf)
+                    mounted.append(True)
 
-        cherrypy.tree.mount(root, '/', conf)
         return cherrypy.tree(environ, start_response)
 
     return wsgi_app
@@ -1,5 +1,8 @@
 import hashlib
 import logging
+import os
+import signal
+import time
 
 __virtualname__ = 'rest_tornado'
 
@@ -8,6 +11,8 @@ logger = logging.getLogger(__virtualname__)
 try:
     import tornado.httpserver
     import tornado.ioloop
+    import tornado.netutil
+    import tornado.process
     import tornado.web
     import tornado.gen
 
@@ -16,31 +21,29 @@ except ImportError as err:
     has_tornado = False
     logger.info('ImportError! {}'.format(str(err)))
 
-import salt.auth
-
-
 
 def __virtual__():
     mod_opts = __opts__.get(__virtualname__, {})
 
-    if has_tornado and 'port' in mod_opts:
+    if has_tornado and ('port' in mod_opts or 'socket_path' in mod_opts):
         return __virtualname__
 
     return False
 
 
-def start():
+def get_application(opts, hub_path=None):
     '''
-    Start the saltnado!
+    Return the saltnado application for the master config in ``opts``
+
+    :param hub_path: the socket of the event hub to take events from rather
+        than subscribing to the master event bus
     '''
+    import salt.auth
     from . import saltnado
 
-    mod_opts = __opts__.get(__virtualname__, {})
-
-    if 'num_processes' not in mod_opts:
-        mod_opts['num_processes'] = 1
+    mod_opts = opts.get(__virtualname__, {})
 
-    token_pattern = r"([0-9A-Fa-f]{%s})" % len(getattr(hashlib, __opts__.get('hash_type', 'md5'))().hexdigest())
+    token_pattern = r"([0-9A-Fa-f]{%s})" % len(getattr(hashlib, opts.get('hash_type', 'md5'))().hexdigest())
 
     all_events_pattern = r"/all_events/{}".format(token_pattern)
     formatted_events_pattern = r"/formatted_events/{}".format(token_pattern)
@@ -65,12 +68,25 @@ def start():
         (formatted_events_pattern, saltnado.FormattedEventsHandler),
     ], debug=mod_opts.get('debug', False))
 
-    application.opts = __opts__
+    application.opts = opts
     application.mod_opts = mod_opts
-    application.auth = salt.auth.LoadAuth(__opts__)
-    application.event_listener = saltnado.EventListener(mod_opts, __opts__)
+    application.auth = salt.auth.LoadAuth(opts)
+    if hub_path is None:
+        application.event_listener = saltnado.EventListener(mod_opts, opts)
+    else:
+        application.event_listener = saltnado.HubEventListener(mod_opts,
+                opts, hub_path)
+    # requests being handled, so a replaced process knows when it is done
+    application.requests_in_flight = 0
+
+    return application
+
 
-    # the kwargs for the HTTPServer
+def get_server_kwargs(mod_opts):
+    '''
+    Return the kwargs for the HTTPServer or ``None`` if SSL is enabled but not
+    configured
+    '''
     kwargs = {}
     if not mod_opts.get('disable_ssl', False):
         if 'ssl_crt' not in mod_opts:
@@ -79,6 +95,17 @@ def start():
                     __name__)
 
             return None
+        import saltapi.netutil
+
+        # One context for every connection so that sessions can be resumed
+        context = saltapi.netutil.ssl_context(mod_opts['ssl_crt'],
+                mod_opts.get('ssl_key') or None,
+                ciphers=mod_opts.get('ssl_ciphers'),
+                tickets=mod_opts.get('ssl_session_tickets', True))
+        if context is not None:
+            kwargs['ssl_options'] = context
+            return kwargs
+
         # cert is required, key may be optional
         # https://docs.python.org/2/library/ssl.html#ssl.wrap_socket
         ssl_opts = {'certfile': mod_opts['ssl_crt']}
@@ -86,17 +113,183 @@ def start():
             ssl_opts.update({'keyfile': mod_opts['ssl_key']})
         kwargs['ssl_options'] = ssl_opts
 
+    return kwargs
+
+
+def _drain(http_server, application, timeout):
+    '''
+    Stop accepting connections and stop the IOLoop once the requests in
+    progress are done or ``timeout`` seconds have passed
+    '''
+    http_server.stop()
+
+    io_loop = tornado.ioloop.IOLoop.instance()
+    deadline = time.time() + timeout
+
+    def check():
+        if application.requests_in_flight <= 0 or time.time() >= deadline:
+            io_loop.stop()
+        else:
+            io_loop.add_timeout(time.time() + 0.5, check)
+
+    check()
+
+
+def serve(sockets, opts, kwargs, hub_path=None):
+    '''
+    Serve the application on sockets inherited from the parent process until
+    told to stop with ``SIGTERM``
+    '''
+    import saltapi.client
+    import saltapi.procpool
+    import saltapi.warmup
+
+    # Fork the runner and wheel workers before any thread is started
+    saltapi.procpool.get_process_pool(opts)
+
+    if opts.get(__virtualname__, {}).get('warmup', False):
+        saltapi.warmup.warm_up(opts)
+
+    application = get_application(opts, hub_path)
+
     http_server = tornado.httpserver.HTTPServer(application, **kwargs)
+    http_server.add_sockets(sockets)
+    saltapi.client.notify_ready()
+
+    io_loop = tornado.ioloop.IOLoop.instance()
+    io_loop.add_callback(application.event_listener.iter_events)
+
+    def stop(signum, frame):
+        io_loop.add_callback_from_signal(_drain, http_server, application,
+                opts.get('api_reload_timeout', 30))
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    io_loop.start()
+
+
+def start():
+    '''
+    Start the saltnado!
+    '''
+    mod_opts = __opts__.get(__virtualname__, {})
+
+    kwargs = get_server_kwargs(mod_opts)
+    if kwargs is None:
+        return None
+
+    import saltapi.netutil
+
+    address = _address(mod_opts)
     try:
-        http_server.bind(mod_opts['port'])
-        http_server.start(mod_opts['num_processes'])
+        if 'socket_path' in mod_opts:
+            sockets = [saltapi.netutil.bind_unix_socket(address,
+                    mod_opts.get('socket_mode', 0660))]
+            # as bind_sockets() leaves them, for the IOLoop
+            sockets[0].setblocking(0)
+        else:
+            sockets = tornado.netutil.bind_sockets(address[1], address[0])
     except:
-        print 'Rest_tornado unable to bind to port {0}'.format(mod_opts['port'])
+        print 'Rest_tornado unable to bind to {0}'.format(address)
         raise SystemExit(1)
-    tornado.ioloop.IOLoop.instance().add_callback(application.event_listener.iter_events)
 
+    try:
+        # Development mode reloads the process so it always runs
+        # single-process
+        if mod_opts.get('debug', False):
+            try:
+                serve(sockets, __opts__, kwargs)
+            except KeyboardInterrupt:
+                raise SystemExit(0)
+            return
+
+        start_workers(sockets, mod_opts, kwargs)
+    finally:
+        if 'socket_path' in mod_opts:
+            os.remove(address)
+
+
+def _address(mod_opts):
+    '''
+    Return what the server listens on: a Unix socket path or a host and port
+    '''
+    if 'socket_path' in mod_opts:
+        return mod_opts['socket_path']
+    return (mod_opts.get('host'), mod_opts['port'])
+
+
+def _num_processes(mod_opts):
+    '''
+    Return the number of worker processes to run
+    '''
+    return (mod_opts.get('num_processes', 1)
+            or tornado.process.cpu_count())
+
+
+def _workers(sockets, opts, kwargs, hub_sock=None):
+    '''
+    Return the name, target and args of each worker process and of the event
+    hub if there is one
+    '''
+    from . import event_hub
+
+    hub_path = None
+    workers = []
+    if hub_sock is not None:
+        hub_path = hub_sock.getsockname()
+        workers.append(('{0}-event-hub'.format(__name__), event_hub.serve,
+                (opts, hub_sock)))
+
+    num_processes = _num_processes(opts.get(__virtualname__, {}))
+    workers.extend(('{0}-worker-{1}'.format(__name__, num), serve,
+                (sockets, opts, kwargs, hub_path))
+            for num in range(num_processes))
+
+    return workers
+
+
+def start_workers(sockets, mod_opts, kwargs):
+    '''
+    Run supervised worker processes that all serve from the listening sockets
+
+    On ``SIGHUP`` the config is read again and a new set of workers takes
+    over the sockets while the old workers finish their requests.
+    '''
+    import saltapi.client
+    import saltapi.config
+    import saltapi.netutil
+
+    address = _address(mod_opts)
+
+    # Several workers share one subscription to the event bus through the hub
+    hub_sock = None
+    if _num_processes(mod_opts) > 1:
+        hub_sock = saltapi.netutil.bind_unix_socket(
+                mod_opts.get('event_hub_socket', os.path.join(
+                    __opts__['sock_dir'], 'rest_tornado_event_hub.ipc')))
+
+    def reload(supervisor):
+        opts = saltapi.config.api_config(__opts__['conf_file'])
+        mod_opts = opts.get(__virtualname__, {})
+
+        if _address(mod_opts) != address:
+            logger.warning("'%s' keeps listening on %s; changing the "
+                    "address needs a restart", __name__, address)
+
+        kwargs = get_server_kwargs(mod_opts)
+        if kwargs is None:
+            return
+
+        logger.info("Starting new '%s' workers", __name__)
+        supervisor.replace(_workers(sockets, opts, kwargs, hub_sock))
+
+    supervisor = saltapi.client.Supervisor(__opts__, reload=reload,
+            name=__name__)
+    for name, target, args in _workers(sockets, __opts__, kwargs, hub_sock):
+        supervisor.add(name, target, args)
 
     try:
-        tornado.ioloop.IOLoop.instance().start()
-    except KeyboardInterrupt:
-        raise SystemExit(0)
+        supervisor.run()
+    finally:
+        if hub_sock is not None:
+            os.remove(hub_sock.getsockname())
@@ -0,0 +1,212 @@
+'''
+Relay master events to the rest_tornado worker processes
+
+When ``rest_tornado`` runs more than one process (``num_processes``), a hub
+process reads the master event bus once and relays events to the workers over
+a Unix socket, rather than every worker subscribing to the bus itself. Each
+worker subscribes to the tag prefixes its requests are waiting on and is only
+sent the events whose tags match, so the cost of reading the bus does not grow
+with the number of workers.
+
+Messages in both directions are serialized with
+:py:class:`salt.payload.Serial` and prefixed with their length as a 4-byte
+big-endian integer. A worker sends ``['sub', <prefix>]`` and
+``['unsub', <prefix>]``; the hub sends ``{'tag': <tag>, 'data': <data>}``.
+'''
+# Import python libs
+import errno
+import logging
+import select
+import signal
+import socket
+import struct
+import threading
+
+# Import salt libs
+import salt.payload
+
+# Import salt-api libs
+import saltapi.client
+import saltapi.collector
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+
+# Seconds a worker may take to read an event before it is disconnected
+SEND_TIMEOUT = 5
+
+
+def pack(serial, msg):
+    '''
+    Serialize a message with its length prefix
+    '''
+    body = serial.dumps(msg)
+    return HEADER.pack(len(body)) + body
+
+
+def unpack(serial, buf):
+    '''
+    Split the complete messages off the front of a buffer
+
+    :return: a list of messages and the rest of the buffer
+    '''
+    msgs = []
+    while len(buf) >= HEADER.size:
+        size, = HEADER.unpack_from(buf)
+        if len(buf) < HEADER.size + size:
+            break
+
+        msgs.append(serial.loads(buf[HEADER.size:HEADER.size + size]))
+        buf = buf[HEADER.size + size:]
+
+    return msgs, buf
+
+
+class _Client(object):
+    '''
+    A connected worker and the tag prefixes it subscribed to
+    '''
+    def __init__(self, conn):
+        self.conn = conn
+        self.prefixes = set()
+        self.buf = ''
+        self.send_lock = threading.Lock()
+
+
+class EventHub(object):
+    '''
+    Accept worker connections on a listening Unix socket and send each worker
+    the master events it subscribed to
+
+    :py:meth:`run` blocks until the hub receives ``SIGTERM`` or ``SIGINT``.
+    The hub then stops accepting connections and keeps sending events to the
+    workers that are still connected until they disconnect.
+    '''
+    def __init__(self, opts, sock):
+        self.opts = opts
+        self.listener = sock
+        self.serial = salt.payload.Serial(opts)
+
+        # socket -> _Client
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.stopping = False
+
+    def publish(self, tag, data):
+        '''
+        Send an event to every worker subscribed to a prefix of its tag
+        '''
+        with self.lock:
+            clients = [i for i in self.clients.values()
+                    if any(tag.startswith(prefix) for prefix in i.prefixes)]
+
+        if not clients:
+            return
+
+        frame = pack(self.serial, {'tag': tag, 'data': data})
+        for client in clients:
+            try:
+                with client.send_lock:
+                    client.conn.sendall(frame)
+            except socket.error:
+                logger.warning('Disconnecting a worker that is not reading '
+                        'events')
+                # The main loop sees the shutdown and drops the client
+                try:
+                    client.conn.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def _accept(self):
+        '''
+        Accept a worker connection
+        '''
+        try:
+            conn, _ = self.listener.accept()
+        except socket.error:
+            return
+
+        conn.settimeout(SEND_TIMEOUT)
+        with self.lock:
+            self.clients[conn] = _Client(conn)
+
+    def _drop(self, client):
+        '''
+        Forget a disconnected worker
+        '''
+        with self.lock:
+            self.clients.pop(client.conn, None)
+        client.conn.close()
+
+    def _read(self, client):
+        '''
+        Apply the subscription changes sent by a worker
+        '''
+        try:
+            data = client.conn.recv(4096)
+        except socket.error:
+            data = ''
+
+        if not data:
+            self._drop(client)
+            return
+
+        try:
+            msgs, client.buf = unpack(self.serial, client.buf + data)
+            with self.lock:
+                for action, prefix in msgs:
+                    if action == 'sub':
+                        client.prefixes.add(prefix)
+                    elif action == 'unsub':
+                        client.prefixes.discard(prefix)
+        except (TypeError, ValueError):
+            logger.error('Disconnecting a worker that sent an invalid '
+                    'message', exc_info=True)
+            self._drop(client)
+
+    def _signal_stop(self, signum, frame):
+        '''
+        Stop accepting connections when told to exit
+        '''
+        self.stopping = True
+
+    def run(self):
+        '''
+        Relay events until told to stop and every worker has disconnected
+        '''
+        saltapi.collector.get_collector(self.opts).add_listener(self.publish)
+        saltapi.client.notify_ready()
+
+        while not self.stopping or self.clients:
+            if self.stopping and self.listener is not None:
+                self.listener.close()
+                self.listener = None
+
+            socks = list(self.clients)
+            if self.listener is not None:
+                socks.append(self.listener)
+
+            try:
+                readable, _, _ = select.select(socks, [], [], 0.5)
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for sock in readable:
+                if sock is self.listener:
+                    self._accept()
+                elif sock in self.clients:
+                    self._read(self.clients[sock])
+
+
+def serve(opts, sock):
+    '''
+    Run the event hub on a listening socket inherited from the parent process
+    '''
+    hub = EventHub(opts, sock)
+    signal.signal(signal.SIGTERM, hub._signal_stop)
+    signal.signal(signal.SIGINT, hub._signal_stop)
+
+    hub.run()
@@ -284,8 +284,30 @@ add the following to your salt master config file.
         # no need to specify ssl_key if cert and key
         # are in one single file
         ssl_key: /etc/pki/api/certs/server.key
+        # OpenSSL cipher list; ECDHE and DHE ciphers only by default
+        # ssl_ciphers: 'ECDHE+AESGCM:ECDHE+AES'
+        # let reconnecting clients resume their TLS session with a ticket
+        ssl_session_tickets: True
         debug: False
         disable_ssl: False
+        # number of server processes; 0 for one per CPU
+        num_processes: 1
+        # listen on a Unix socket instead of the port, e.g. behind a local
+        # reverse proxy; a stale socket file is removed
+        # socket_path: /var/run/salt-api/rest_tornado.sock
+        # socket_mode: '0660'
+        # connect to the master and load tokens before accepting requests;
+        # see saltapi.warmup
+        warmup: False
+
+With more than one process, a separate hub process reads the master event bus
+and relays events to the server processes over a Unix socket at
+``event_hub_socket`` (``<sock_dir>/rest_tornado_event_hub.ipc`` by default).
+
+Requests and responses may be JSON, YAML or MessagePack
+(``application/msgpack``), chosen with the :mailheader:`Content-Type` and
+:mailheader:`Accept` headers. MessagePack is what Salt uses internally and is
+the quickest to encode and decode for large returns.
 
 '''
 
@@ -315,35 +337,40 @@ from copy import copy
 
 import time
 
+import socket
 import sys
 
 import tornado.httpserver
 import tornado.ioloop
+import tornado.iostream
 import tornado.web
 import tornado.gen
 import tornado.websocket
 from tornado.concurrent import Future
+import event_hub
 import event_processor
 
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import math
-import functools
 import json
-import yaml
-import zmq
 import fnmatch
 
 # salt imports
 import saltapi
+import saltapi.acl
+import saltapi.pipeline
+import saltapi.pool
+import saltapi.scheduler
+import saltapi.utils
 import salt.utils
 import salt.utils.event
 from salt.utils.event import tagify
-import salt.client
-import salt.runner
 import salt.auth
+import salt.payload
+from salt.exceptions import EauthAuthenticationError, SaltInvocationError
 
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
 
 '''
 The clients rest_cherrypi supports. We want to mimic the interface, but not
@@ -353,21 +380,80 @@ The clients rest_cherrypi supports. We want to mimic the interface, but not
  - "local_async" (done)
  - "local_batch" (done)
 
+# agentless
+ - "ssh" (done, in a thread)
+
 # master side
  - "runner" (done)
+ - "runner_async" (done)
  - "wheel" (need async api...)
+ - "wheel_async" (done)
 '''
 
 
-# TODO: refreshing clients using cachedict
-saltclients = {'local': salt.client.get_local_client().run_job,
-               # not the actual client we'll use.. but its what we'll use to get args
-               'local_batch': salt.client.get_local_client().cmd_batch,
-               'local_async': salt.client.get_local_client().run_job,
-               'runner': salt.runner.RunnerClient(salt.config.master_config('/etc/salt/master')).async,
+# client name -> (pooled Salt client type, method on that client)
+saltclients = {'local': ('local', 'run_job'),
+               # not the actual method we'll call.. but its what we'll use to get args
+               'local_batch': ('local', 'cmd_batch'),
+               'local_async': ('local', 'run_job'),
+               'runner': ('runner', 'async'),
+               'runner_async': ('runner', 'async'),
+               # a kind of None calls the method of saltapi.APIClient
+               'wheel_async': (None, 'wheel_async'),
+               # run in a thread through saltapi.APIClient.ssh
+               'ssh': (None, None),
                }
 
 
+def format_call(client, chunk):
+    '''
+    Map a lowstate chunk onto the arguments of the method backing ``client``
+    '''
+    kind, method = saltclients[client]
+    return saltapi.utils.format_call(
+            getattr(saltapi.pool.CLIENT_CLASSES[kind], method), chunk)
+
+
+def yaml_dump(data):
+    '''
+    Serialize data to YAML; PyYAML is only imported once YAML is requested
+    '''
+    import yaml
+    return yaml.safe_dump(data, default_flow_style=False)
+
+
+def yaml_load(data):
+    '''
+    Deserialize YAML data; PyYAML is only imported once YAML is sent
+    '''
+    import yaml
+    return yaml.safe_load(data)
+
+
+# Salt's own msgpack serializer
+serial = salt.payload.Serial('msgpack')
+
+
+def run_in_thread(opts, fun, *args):
+    '''
+    Call a blocking function on the shared thread pool and return a future
+    resolved with its return on the IOLoop
+    '''
+    future = Future()
+    io_loop = tornado.ioloop.IOLoop.instance()
+
+    def run():
+        try:
+            ret = fun(*args)
+        except Exception as exc:
+            io_loop.add_callback(future.set_exception, exc)
+        else:
+            io_loop.add_callback(future.set_result, ret)
+
+    saltapi.pool.get_thread_pool(opts).apply_async(run)
+    return future
+
+
 AUTH_TOKEN_HEADER = 'X-Auth-Token'
 AUTH_COOKIE_NAME = 'session_id'
 
@@ -404,10 +490,36 @@ class EventListener():
         # request_obj -> list of (tag, future)
         self.request_map = defaultdict(list)
 
+        # tag prefix -> number of requests holding it
+        self.holds = defaultdict(int)
+        # request_obj -> list of tag prefixes it holds
+        self.request_holds = defaultdict(list)
+        # held tag prefix -> events that came while nothing waited on it
+        self.pending = defaultdict(deque)
+
+    def hold(self, request, tag):
+        '''
+        Keep events with the tag prefix for `request` until it is done
+        waiting, including events that come before it waits on them
+        '''
+        self.holds[tag] += 1
+        self.request_holds[request].append(tag)
+
+    def release(self, request):
+        '''
+        Drop the tag prefixes held for `request`
+        '''
+        for tag in self.request_holds.pop(request, []):
+            self.holds[tag] -= 1
+            if self.holds[tag] == 0:
+                del self.holds[tag]
+                self.pending.pop(tag, None)
+
     def clean_timeout_futures(self, request):
         '''
         Remove all futures that were waiting for request `request` since it is done waiting
         '''
+        self.release(request)
         if request not in self.request_map:
             return
         for tag, future in self.request_map[request]:
@@ -434,26 +546,49 @@ class EventListener():
                 response = future.result()
                 self.io_loop.add_callback(callback, response)
             future.add_done_callback(handle_future)
+
+        # an event that came before anything waited on its held prefix
+        if self.pending.get(tag):
+            future.set_result(self.pending[tag].popleft())
+            return future
+
         # add this tag and future to the callbacks
         self.tag_map[tag].append(future)
         self.request_map[request].append((tag, future))
 
         return future
 
+    def dispatch(self, data):
+        '''
+        Resolve the futures waiting on a prefix of the event's tag
+        '''
+        waited = set()
+        for tag_prefix, futures in self.tag_map.items():
+            if data['tag'].startswith(tag_prefix):
+                for future in futures:
+                    if future.done():
+                        continue
+                    future.set_result(data)
+                del self.tag_map[tag_prefix]
+                waited.add(tag_prefix)
+
+        # keep the event for held prefixes nothing was waiting on
+        for tag_prefix in self.holds:
+            if (data['tag'].startswith(tag_prefix)
+                    and tag_prefix not in waited):
+                self.pending[tag_prefix].append(data)
+
     def iter_events(self):
         '''
         Iterate over all events that could happen
         '''
+        # Already imported by salt.utils.event; deferred here with the rest
+        # of the event handling
+        import zmq
+
         try:
             data = self.event.get_event_noblock()
-            # see if we have any futures that need this info:
-            for tag_prefix, futures in self.tag_map.items():
-                if data['tag'].startswith(tag_prefix):
-                    for future in futures:
-                        if future.done():
-                            continue
-                        future.set_result(data)
-                    del self.tag_map[tag_prefix]
+            self.dispatch(data)
 
             # call yourself back!
             tornado.ioloop.IOLoop.instance().add_callback(self.iter_events)
@@ -471,6 +606,116 @@ class EventListener():
             tornado.ioloop.IOLoop.instance().add_timeout(time.time() + 0.1, self.iter_events)
 
 
+class HubEventListener(EventListener):
+    '''
+    An EventListener that is sent events by the rest_tornado
+    :py:mod:`event hub <saltapi.netapi.rest_tornado.event_hub>` rather than
+    subscribing to the master event bus itself
+
+    The hub is told which tag prefixes are being waited on or held, so only
+    those events are sent to this process. A request holds the prefix of a
+    job's returns from before the job is published until it is done, so no
+    return is lost between subscribing and waiting on it.
+    '''
+    def __init__(self, mod_opts, opts, path):
+        self.mod_opts = mod_opts
+        self.opts = opts
+        self.path = path
+        self.serial = salt.payload.Serial(opts)
+
+        # tag -> list of futures
+        self.tag_map = defaultdict(list)
+
+        # request_obj -> list of (tag, future)
+        self.request_map = defaultdict(list)
+
+        # tag prefix -> number of requests holding it
+        self.holds = defaultdict(int)
+        # request_obj -> list of tag prefixes it holds
+        self.request_holds = defaultdict(list)
+        # held tag prefix -> events that came while nothing waited on it
+        self.pending = defaultdict(deque)
+
+        self.stream = None
+        self.connected = False
+        # tag prefixes the hub is sending events for
+        self.subscribed = set()
+
+    def _sync_subscriptions(self):
+        '''
+        Tell the hub about tag prefixes that are newly or no longer waited on
+        or held
+        '''
+        if not self.connected:
+            return
+
+        wanted = set(self.tag_map) | set(self.holds)
+        for prefix in wanted - self.subscribed:
+            self.stream.write(event_hub.pack(self.serial, ['sub', prefix]))
+        for prefix in self.subscribed - wanted:
+            self.stream.write(event_hub.pack(self.serial, ['unsub', prefix]))
+        self.subscribed = wanted
+
+    def get_event(self, request, tag='', callback=None):
+        future = EventListener.get_event(self, request, tag=tag,
+                callback=callback)
+        self._sync_subscriptions()
+        return future
+
+    def hold(self, request, tag):
+        EventListener.hold(self, request, tag)
+        self._sync_subscriptions()
+
+    def release(self, request):
+        EventListener.release(self, request)
+        self._sync_subscriptions()
+
+    def clean_timeout_futures(self, request):
+        EventListener.clean_timeout_futures(self, request)
+        self._sync_subscriptions()
+
+    def dispatch(self, data):
+        EventListener.dispatch(self, data)
+        self._sync_subscriptions()
+
+    def iter_events(self):
+        '''
+        Connect to the hub and read events from it, reconnecting if the
+        connection is lost
+        '''
+        self.stream = tornado.iostream.IOStream(
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+        self.stream.set_close_callback(self._on_close)
+        self.stream.connect(self.path, self._on_connect)
+
+    def _on_connect(self):
+        self.connected = True
+        self.subscribed = set()
+        self._sync_subscriptions()
+        self.stream.read_bytes(event_hub.HEADER.size, self._on_header)
+
+    def _on_header(self, header):
+        size, = event_hub.HEADER.unpack(header)
+        self.stream.read_bytes(size, self._on_event)
+
+    def _on_event(self, body):
+        try:
+            self.dispatch(self.serial.loads(body))
+        except Exception:
+            logger.error('Error handling an event from the event hub',
+                    exc_info=True)
+        self.stream.read_bytes(event_hub.HEADER.size, self._on_header)
+
+    def _on_close(self):
+        if self.connected:
+            logger.warning('Lost the connection to the event hub; '
+                    'reconnecting')
+        self.connected = False
+        # TODO: configurable timeout
+        tornado.ioloop.IOLoop.instance().add_timeout(time.time() + 1,
+                self.iter_events)
+
+
 # TODO: move to a utils function within salt-- the batching stuff is a bit tied together
 def get_batch_size(batch, num_minions):
     '''
@@ -495,10 +740,17 @@ def get_batch_size(batch, num_minions):
 class BaseSaltAPIHandler(tornado.web.RequestHandler):
     ct_out_map = (
         ('application/json', json.dumps),
-        ('application/x-yaml', functools.partial(
-            yaml.safe_dump, default_flow_style=False)),
+        ('application/x-yaml', yaml_dump),
+        ('application/msgpack', serial.dumps),
+        ('application/x-msgpack', serial.dumps),
     )
 
+    def initialize(self):
+        '''
+        Count the request as in flight until it finishes
+        '''
+        self.application.requests_in_flight += 1
+
     def _verify_client(self, client):
         '''
         Verify that the client is in fact one we have
@@ -519,6 +771,54 @@ class BaseSaltAPIHandler(tornado.web.RequestHandler):
         else:
             return self.get_cookie(AUTH_COOKIE_NAME)
 
+    def call_client(self, client, *args, **kwargs):
+        '''
+        Call the method backing ``client`` on a client from the shared pool,
+        or on a :py:class:`saltapi.APIClient` for clients that salt-api runs
+        itself
+        '''
+        kind, method = saltclients[client]
+        return self.call_method(client, kind, method, *args, **kwargs)
+
+    def call_method(self, client, kind, method, *args, **kwargs):
+        '''
+        Call ``method`` on a client of ``kind`` from the shared pool, or on a
+        :py:class:`saltapi.APIClient` if ``kind`` is ``None``, counting the
+        call against ``client`` in the dispatch scheduler
+        '''
+        opts = self.application.opts
+
+        # The IOLoop must never block so calls are not queued by the dispatch
+        # scheduler; they are turned away if they cannot run right now
+        scheduler = saltapi.scheduler.get_scheduler(opts)
+        if scheduler is not None:
+            try:
+                scheduler.acquire(saltapi.scheduler.client_type(client),
+                        block=False)
+            except saltapi.scheduler.Overloaded as exc:
+                self.retry_after = exc.retry_after
+                raise tornado.web.HTTPError(503, str(exc))
+
+        try:
+            if kind is None:
+                return getattr(saltapi.APIClient(opts), method)(*args,
+                        **kwargs)
+
+            with saltapi.pool.get_pool(opts).client(kind) as salt_client:
+                return getattr(salt_client, method)(*args, **kwargs)
+        finally:
+            if scheduler is not None:
+                scheduler.release(saltapi.scheduler.client_type(client))
+
+    def write_error(self, status_code, **kwargs):
+        '''
+        Tell clients turned away by the dispatch scheduler when to retry
+        '''
+        if status_code == 503 and getattr(self, 'retry_after', None):
+            self.set_header('Retry-After', str(self.retry_after))
+
+        super(BaseSaltAPIHandler, self).write_error(status_code, **kwargs)
+
     def _verify_auth(self):
         '''
         Boolean wether the request is auth'd
@@ -565,6 +865,8 @@ class BaseSaltAPIHandler(tornado.web.RequestHandler):
         # timeout all the futures
         self.timeout_futures()
 
+        self.application.requests_in_flight -= 1
+
     def on_connection_close(self):
         '''
         If the client disconnects, lets close out
@@ -599,10 +901,10 @@ class BaseSaltAPIHandler(tornado.web.RequestHandler):
         ct_in_map = {
             'application/x-www-form-urlencoded': self._form_loader,
             'application/json': json.loads,
-            'application/x-yaml': functools.partial(
-                yaml.safe_load, default_flow_style=False),
-            'text/yaml': functools.partial(
-                yaml.safe_load, default_flow_style=False),
+            'application/x-yaml': yaml_load,
+            'text/yaml': yaml_load,
+            'application/msgpack': serial.loads,
+            'application/x-msgpack': serial.loads,
             # because people are terrible and dont mean what they say
             'text/plain': json.loads
         }
@@ -669,13 +971,18 @@ class SaltAuthHandler(BaseSaltAPIHandler):
 
         # Grab eauth config for the current backend for the current user
         try:
-            perms = self.application.opts['external_auth'][token['eauth']][token['name']]
+            perms = saltapi.acl.user_perms(self.application.opts, dict(creds,
+                    eauth=token['eauth'], username=token['name']))
         except (AttributeError, IndexError):
             logging.debug("Configuration for external_auth malformed for "
                          "eauth '{0}', and user '{1}'."
                          .format(token.get('eauth'), token.get('name')), exc_info=True)
             # TODO better error -- 'Configuration for external_auth could not be read.'
             self.send_error(500)
+            return
+
+        # Compile the permissions now so calls are checked without a lookup
+        saltapi.acl.remember(token['token'], perms, token['expire'])
 
         ret = {'return': [{
             'token': token['token'],
@@ -724,11 +1031,14 @@ class SaltAPIHandler(BaseSaltAPIHandler):
 
         client = self.get_arguments('client')[0]
         self._verify_client(client)
-        self.disbatch(client)
+        return self.disbatch(client)
 
     def disbatch(self, client):
         '''
         Disbatch a lowstate job to the appropriate client
+
+        Chunks may use the results of the chunks before them (see
+        :py:mod:`saltapi.pipeline`).
         '''
         self.client = client
 
@@ -738,14 +1048,63 @@ class SaltAPIHandler(BaseSaltAPIHandler):
                 self.set_status(401)
                 self.finish()
                 return
-        # disbatch to the correct handler
+
+            # turn away calls the master would refuse before they reach it;
+            # chunks with references are checked again once resolved
+            try:
+                saltapi.acl.check(self.application.opts,
+                        dict(low, client=client, token=self.token),
+                        resolved=False)
+            except EauthAuthenticationError:
+                self.set_status(401)
+                self.finish()
+                return
+
+        # disbatch to the correct handler; return any future so errors raised
+        # while it runs (e.g. a 503 from the dispatch scheduler) are handled
         try:
-            getattr(self, '_disbatch_{0}'.format(self.client))()
+            return getattr(self, '_disbatch_{0}'.format(self.client))()
         except AttributeError:
             # TODO set the right status... this means we didn't implement it...
             self.set_status(500)
             self.finish()
 
+    def _get_user(self):
+        '''
+        Return the name of the user the request's token belongs to, for
+        runner jobs, which the master does not authenticate
+        '''
+        try:
+            return saltapi.acl.get_user(self.application.opts,
+                    {'token': self.token})
+        except EauthAuthenticationError as exc:
+            raise tornado.web.HTTPError(401, str(exc))
+
+    def _resolve(self, chunk, results):
+        '''
+        Replace references to the results of earlier chunks in a chunk (see
+        :py:mod:`saltapi.pipeline`) and check the permissions of the resolved
+        chunk, which may name a different function than the one checked
+        before it ran
+        '''
+        refs = saltapi.pipeline.has_refs(chunk)
+
+        try:
+            chunk = saltapi.pipeline.resolve(chunk, results)
+        except SaltInvocationError as exc:
+            raise tornado.web.HTTPError(400, str(exc))
+
+        if not refs:
+            return chunk
+
+        try:
+            saltapi.acl.check(self.application.opts,
+                    dict(chunk, client=self.client, token=self.token))
+        except EauthAuthenticationError as exc:
+            raise tornado.web.HTTPError(401, str(exc))
+
+        return chunk
+
     @tornado.gen.coroutine
     def _disbatch_local_batch(self):
         '''
@@ -754,7 +1113,8 @@ class SaltAPIHandler(BaseSaltAPIHandler):
         self.ret = []
 
         for chunk in self.lowstate:
-            f_call = salt.utils.format_call(saltclients['local_batch'], chunk)
+            chunk = self._resolve(chunk, self.ret)
+            f_call = format_call('local_batch', chunk)
 
             timeout = float(chunk.get('timeout', self.application.opts['timeout']))
             # set the timeout
@@ -762,10 +1122,10 @@ class SaltAPIHandler(BaseSaltAPIHandler):
 
             # ping all the minions (to see who we have to talk to)
             # TODO: actually ping them all? this just gets the pub data
-            minions = saltclients['local'](chunk['tgt'],
-                                           'test.ping',
-                                           [],
-                                           expr_form=f_call['kwargs']['expr_form'])['minions']
+            minions = self.call_client('local', chunk['tgt'],
+                                       'test.ping',
+                                       [],
+                                       expr_form=f_call['kwargs']['expr_form'])['minions']
 
             chunk_ret = {}
             maxflight = get_batch_size(f_call['kwargs']['batch'], len(minions))
@@ -778,7 +1138,7 @@ class SaltAPIHandler(BaseSaltAPIHandler):
                     f_call['args'][0] = minion_id
                     # TODO: list??
                     f_call['kwargs']['expr_form'] = 'glob'
-                    pub_data = saltclients['local'](*f_call.get('args', ()), **f_call.get('kwargs', {}))
+                    pub_data = self.call_client('local', *f_call.get('args', ()), **f_call.get('kwargs', {}))
                     print pub_data
                     tag = tagify([pub_data['jid'], 'ret', minion_id], 'job')
                     future = self.application.event_listener.get_event(self, tag=tag)
@@ -810,9 +1170,9 @@ class SaltAPIHandler(BaseSaltAPIHandler):
         self.ret = []
 
         for chunk in self.lowstate:
+            chunk = self._resolve(chunk, self.ret)
             timeout = float(chunk.get('timeout', self.application.opts['timeout']))
             # set the timeout
-            tornado.ioloop.IOLoop.instance().add_timeout(time.time() + timeout, self.timeout_futures)
             timeout_obj = tornado.ioloop.IOLoop.instance().add_timeout(time.time() + timeout, self.timeout_futures)
 
             # TODO: not sure why.... we already verify auth, probably for ACLs
@@ -821,12 +1181,17 @@ class SaltAPIHandler(BaseSaltAPIHandler):
 
             chunk_ret = {}
 
-            f_call = salt.utils.format_call(saltclients[self.client], chunk)
-            # fire a job off
-            pub_data = saltclients[self.client](*f_call.get('args', ()), **f_call.get('kwargs', {}))
+            # hold the tag of the job's returns before it is published and
+            # until the request is done, so no return is missed
+            jid = salt.utils.gen_jid()
+            tag = tagify([jid, 'ret'], 'job')
+            self.application.event_listener.hold(self, tag)
 
-            # get the tag that we are looking for
-            tag = tagify([pub_data['jid'], 'ret'], 'job')
+            f_call = format_call(self.client, chunk)
+            # fire a job off
+            pub_data = self.call_method(self.client, None, 'local_async',
+                    *f_call.get('args', ()),
+                    **dict(f_call.get('kwargs', {}), jid=jid))
 
             minions_remaining = pub_data['minions']
 
@@ -853,9 +1218,10 @@ class SaltAPIHandler(BaseSaltAPIHandler):
         '''
         ret = []
         for chunk in self.lowstate:
-            f_call = salt.utils.format_call(saltclients[self.client], chunk)
+            chunk = self._resolve(chunk, ret)
+            f_call = format_call(self.client, chunk)
             # fire a job off
-            pub_data = saltclients[self.client](*f_call.get('args', ()), **f_call.get('kwargs', {}))
+            pub_data = self.call_client(self.client, *f_call.get('args', ()), **f_call.get('kwargs', {}))
             ret.append(pub_data)
 
         self.write(self.serialize({'return': ret}))
@@ -868,13 +1234,14 @@ class SaltAPIHandler(BaseSaltAPIHandler):
         '''
         self.ret = []
         for chunk in self.lowstate:
+            chunk = self._resolve(chunk, self.ret)
             timeout = float(chunk.get('timeout', self.application.opts['timeout']))
             # set the timeout
-            tornado.ioloop.IOLoop.instance().add_timeout(time.time() + timeout, self.timeout_futures)
             timeout_obj = tornado.ioloop.IOLoop.instance().add_timeout(time.time() + timeout, self.timeout_futures)
 
             f_call = {'args': [chunk['fun'], chunk]}
-            pub_data = saltclients[self.client](chunk['fun'], chunk)
+            pub_data = self.call_client(self.client, chunk['fun'], chunk,
+                    user=self._get_user())
             tag = pub_data['tag'] + '/ret'
             try:
                 event = yield self.application.event_listener.get_event(self, tag=tag)
@@ -890,6 +1257,72 @@ class SaltAPIHandler(BaseSaltAPIHandler):
         self.finish()
 
 
+    def _disbatch_runner_async(self):
+        '''
+        Disbatch runner client_async commands
+        '''
+        ret = []
+        for chunk in self.lowstate:
+            chunk = self._resolve(chunk, ret)
+            ret.append(self.call_client(self.client, chunk['fun'], chunk,
+                    user=self._get_user()))
+
+        self.write(self.serialize({'return': ret}))
+        self.finish()
+
+    def _disbatch_wheel_async(self):
+        '''
+        Disbatch wheel client_async commands
+        '''
+        ret = []
+        for chunk in self.lowstate:
+            chunk = self._resolve(chunk, ret)
+            # wheel calls are authorized by the master
+            chunk['token'] = self.token
+            kwargs = dict(chunk)
+            kwargs.pop('client', None)
+            fun = kwargs.pop('fun')
+            ret.append(self.call_client(self.client, fun, **kwargs))
+
+        self.write(self.serialize({'return': ret}))
+        self.finish()
+
+
+    @tornado.gen.coroutine
+    def _disbatch_ssh(self):
+        '''
+        Disbatch salt-ssh commands
+
+        salt-ssh blocks while it runs so each chunk is run on the shared
+        thread pool; the returns of every host are merged into one dictionary.
+        '''
+        client = saltapi.APIClient(self.application.opts)
+
+        def run(chunk):
+            chunk_ret = {}
+            for host_ret in client.run(chunk):
+                chunk_ret.update(host_ret)
+            return chunk_ret
+
+        self.ret = []
+        for chunk in self.lowstate:
+            chunk = self._resolve(chunk, self.ret)
+            chunk['client'] = 'ssh'
+            chunk['token'] = self.token
+            try:
+                chunk_ret = yield run_in_thread(self.application.opts, run,
+                        chunk)
+            except EauthAuthenticationError:
+                raise tornado.web.HTTPError(401)
+            except saltapi.scheduler.Overloaded as exc:
+                self.retry_after = exc.retry_after
+                raise tornado.web.HTTPError(503, str(exc))
+            self.ret.append(chunk_ret)
+
+        self.write(self.serialize({'return': self.ret}))
+        self.finish()
+
+
 class MinionSaltAPIHandler(SaltAPIHandler):
     '''
     Handler for /minion requests
@@ -905,7 +1338,7 @@ class MinionSaltAPIHandler(SaltAPIHandler):
         self.lowstate = [{
             'client': 'local', 'tgt': mid or '*', 'fun': 'grains.items',
         }]
-        self.disbatch('local')
+        return self.disbatch('local')
 
     @tornado.web.asynchronous
     def post(self):
@@ -917,7 +1350,7 @@ class MinionSaltAPIHandler(SaltAPIHandler):
             self.redirect('/login')
             return
 
-        self.disbatch('local_async')
+        return self.disbatch('local_async')
 
 
 class JobsSaltAPIHandler(SaltAPIHandler):
@@ -942,7 +1375,7 @@ class JobsSaltAPIHandler(SaltAPIHandler):
                 'jid': jid,
             })
 
-        self.disbatch('runner')
+        return self.disbatch('runner')
 
 
 class RunSaltAPIHandler(SaltAPIHandler):
@@ -953,7 +1386,7 @@ class RunSaltAPIHandler(SaltAPIHandler):
     def post(self):
         client = self.get_arguments('client')[0]
         self._verify_client(client)
-        self.disbatch(client)
+        return self.disbatch(client)
 
 
 class EventsSaltAPIHandler(SaltAPIHandler):
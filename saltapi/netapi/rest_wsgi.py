@@ -16,9 +16,15 @@ Please read this introductory section in entirety before deploying this module.
     file. All available options are detailed below.
 
     port
-        **Required**
+        **Required** unless ``socket_path`` is set
 
         The port for the webserver to listen on.
+    socket_path
+        Listen on a Unix socket at this path instead of ``port``, e.g. for a
+        reverse proxy on the same machine. A socket file left behind by an
+        earlier run is removed.
+    socket_mode : ``0660``
+        The permissions of the ``socket_path`` file.
 
     Example configuration:
 
@@ -30,9 +36,10 @@ Please read this introductory section in entirety before deploying this module.
 This API is not very "RESTful"; please note the following:
 
 * All requests must be sent to the root URL (``/``).
-* All requests must be sent as a POST request with JSON content in the request
-  body.
-* All responses are in JSON.
+* All requests must be sent as a POST request with JSON or MessagePack
+  (``application/msgpack``) content in the request body.
+* All responses are in JSON, or in MessagePack if the :mailheader:`Accept`
+  header asks for ``application/msgpack``.
 
 .. seealso:: :py:mod:`rest_cherrypy <saltapi.netapi.rest_cherrypy.app>`
 
@@ -133,10 +140,13 @@ import errno
 import json
 import logging
 import os
+import socket
 
 # Import salt libs
 import salt
+import salt.payload
 import saltapi
+import saltapi.scheduler
 
 # HTTP response codes to response headers map
 H = {
@@ -147,8 +157,14 @@ H = {
     405: '405 METHOD NOT ALLOWED',
     406: '406 NOT ACCEPTABLE',
     500: '500 INTERNAL SERVER ERROR',
+    503: '503 SERVICE UNAVAILABLE',
 }
 
+# Salt's own msgpack serializer
+serial = salt.payload.Serial('msgpack')
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
 __virtualname__ = 'rest_wsgi'
 
 logger = logging.getLogger(__virtualname__)
@@ -156,7 +172,7 @@ logger = logging.getLogger(__virtualname__)
 def __virtual__():
     mod_opts = __opts__.get(__virtualname__, {})
 
-    if 'port' in mod_opts:
+    if 'port' in mod_opts or 'socket_path' in mod_opts:
         return __virtualname__
 
     return False
@@ -192,17 +208,34 @@ def read_body(environ):
 
 def get_json(environ):
     '''
-    Return the request body as JSON
+    Return the request body as JSON, or MessagePack if that is its
+    Content-Type
     '''
     content_type = environ.get('CONTENT_TYPE', '')
-    if content_type != 'application/json':
+    if content_type in MSGPACK_TYPES:
+        loads = serial.loads
+    elif content_type == 'application/json':
+        loads = json.loads
+    else:
         raise HTTPError(406, 'JSON required')
 
     try:
-        return json.loads(read_body(environ))
+        return loads(read_body(environ))
     except ValueError as exc:
         raise HTTPError(400, exc)
 
+def get_serializer(environ):
+    '''
+    Return the Content-Type and serializer for the response: MessagePack if
+    the Accept header asks for it, JSON otherwise
+    '''
+    accept = environ.get('HTTP_ACCEPT', '')
+    for content_type in MSGPACK_TYPES:
+        if content_type in accept:
+            return content_type, serial.dumps
+
+    return 'application/json', json.dumps
+
 def get_headers(data, extra_headers=None):
     '''
     Takes the response data as well as any additional headers and returns a
@@ -220,12 +253,12 @@ def get_headers(data, extra_headers=None):
 def run_chunk(environ, lowstate):
     '''
     Expects a list of lowstate dictionaries that are executed and returned in
-    order
+    order (see :py:meth:`saltapi.APIClient.run_many`)
     '''
     client = environ['SALT_APIClient']
 
-    for chunk in lowstate:
-        yield client.run(chunk)
+    for ret in client.run_many(lowstate):
+        yield ret
 
 def dispatch(environ):
     '''
@@ -247,22 +280,26 @@ def saltenviron(environ):
     '''
     Make Salt's opts dict and the APIClient available in the WSGI environ
     '''
-    if not '__opts__' in locals():
-        import salt.config
-        __opts__ = salt.config.client_config(
-                os.environ.get('SALT_MASTER_CONFIG', '/etc/salt/master'))
+    # Read the config on the first request only
+    if not '__opts__' in globals():
+        globals()['__opts__'] = get_opts()
 
     environ['SALT_OPTS'] = __opts__
     environ['SALT_APIClient'] = saltapi.APIClient(__opts__)
 
 def application(environ, start_response):
     '''
-    Process the request and return a JSON response. Catch errors and return the
-    appropriate HTTP code.
+    Process the request and return a JSON (or MessagePack) response. Catch
+    errors and return the appropriate HTTP code.
     '''
     # Instantiate APIClient once for the whole app
     saltenviron(environ)
 
+    content_type, dumps = get_serializer(environ)
+    headers = {
+        'Content-Type': content_type,
+    }
+
     # Call the dispatcher
     try:
         resp = list(dispatch(environ))
@@ -273,37 +310,76 @@ def application(environ, start_response):
     except salt.exceptions.EauthAuthenticationError as exc:
         code = 401
         resp = str(exc)
+    except saltapi.scheduler.Overloaded as exc:
+        code = 503
+        resp = str(exc)
+        headers['Retry-After'] = str(exc.retry_after)
     except Exception as exc:
         code = 500
         resp = str(exc)
 
-    # Convert the response to JSON
+    # Convert the response to JSON or MessagePack
     try:
-        ret = json.dumps({'return': resp})
+        ret = dumps({'return': resp})
     except TypeError as exc:
         code = 500
         ret = str(exc)
 
     # Return the response
-    start_response(H[code], get_headers(ret, {
-        'Content-Type': 'application/json',
-    }))
+    start_response(H[code], get_headers(ret, headers))
     return (ret,)
 
 def get_opts():
     '''
     Return the Salt master config as __opts__
     '''
-    import salt.config
+    import saltapi.config
 
-    return salt.config.client_config(
+    return saltapi.config.client_config(
             os.environ.get('SALT_MASTER_CONFIG', '/etc/salt/master'))
 
+def make_unix_server(path, mode, app):
+    '''
+    Return a simple_server WSGI server listening on a Unix socket
+    '''
+    from wsgiref.simple_server import (make_server, WSGIServer,
+            WSGIRequestHandler)
+    import saltapi.netutil
+
+    class UnixWSGIServer(WSGIServer):
+        address_family = socket.AF_UNIX
+
+        def server_bind(self):
+            self.socket.close()
+            self.socket = saltapi.netutil.bind_unix_socket(path, mode,
+                    self.request_queue_size)
+            # There is no host or port for the WSGI environ
+            self.server_name = 'localhost'
+            self.server_port = ''
+            self.setup_environ()
+
+        def server_activate(self):
+            # Already listening
+            pass
+
+        def get_request(self):
+            conn, _ = self.socket.accept()
+            return conn, (path, 0)
+
+    class UnixWSGIRequestHandler(WSGIRequestHandler):
+        def address_string(self):
+            return path
+
+    return make_server(path, 0, app, server_class=UnixWSGIServer,
+            handler_class=UnixWSGIRequestHandler)
+
 def start():
     '''
     Start simple_server()
     '''
     from wsgiref.simple_server import make_server
+    import saltapi.client
+    import saltapi.procpool
 
     # When started outside of salt-api __opts__ will not be injected
     if not '__opts__' in globals():
@@ -314,13 +390,24 @@ def start():
 
     mod_opts = __opts__.get(__virtualname__, {})
 
+    # Fork the runner and wheel workers while this is the only thread
+    saltapi.procpool.get_process_pool(__opts__)
+
     # pylint: disable-msg=C0103
-    httpd = make_server('localhost', mod_opts['port'], application)
+    if 'socket_path' in mod_opts:
+        httpd = make_unix_server(mod_opts['socket_path'],
+                mod_opts.get('socket_mode', 0660), application)
+    else:
+        httpd = make_server('localhost', mod_opts['port'], application)
+    saltapi.client.notify_ready()
 
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         raise SystemExit(0)
+    finally:
+        if 'socket_path' in mod_opts:
+            os.remove(mod_opts['socket_path'])
 
 if __name__ == '__main__':
     start()
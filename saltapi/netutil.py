@@ -0,0 +1,162 @@
+'''
+Networking helpers shared by the netapi modules
+'''
+# Import python libs
+import errno
+import os
+import socket
+import ssl
+import stat
+import threading
+
+# Forward secrecy first; the server's order is used over the client's
+DEFAULT_CIPHERS = ('ECDHE+AESGCM:ECDHE+CHACHA20:ECDHE+AES:DHE+AESGCM:DHE+AES:'
+        '!aNULL:!eNULL:!MD5:!DSS:!RC4:!3DES')
+
+# Not defined by Python 2's ssl module
+OP_NO_TICKET = getattr(ssl, 'OP_NO_TICKET', 0x4000)
+
+# (certfile, keyfile, ciphers, tickets, mtimes) -> SSLContext
+_ssl_contexts = {}
+_ssl_contexts_lock = threading.Lock()
+
+
+def bind_socket(host, port, backlog=128):
+    '''
+    Create a TCP socket listening on ``host`` and ``port``
+
+    The socket is created by a parent process and inherited by worker
+    processes that all accept connections from it.
+
+    :return: the listening socket
+    '''
+    info = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+            socket.SOCK_STREAM, 0, socket.AI_PASSIVE)
+    family, socktype, proto, _, addr = info[0]
+
+    sock = socket.socket(family, socktype, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    # Listen on IPv4 as well when bound to the IPv6 any address
+    if family == socket.AF_INET6 and host in ('::', '::0', '::0.0.0.0'):
+        try:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        except (AttributeError, socket.error):
+            pass
+
+    sock.bind(addr)
+    sock.listen(backlog)
+    return sock
+
+
+def file_mode(mode):
+    '''
+    Return file permissions given as a number or an octal string such as
+    ``'0660'`` as a number
+    '''
+    if isinstance(mode, basestring):
+        return int(mode, 8)
+    return mode
+
+
+def remove_stale_socket(path):
+    '''
+    Remove a Unix socket file left behind by a process that is no longer
+    running
+
+    :raises socket.error: if ``path`` is not a socket or another process is
+        listening on it
+    '''
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise socket.error(errno.EEXIST,
+                '{0} exists and is not a socket'.format(path))
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as exc:
+        if exc.errno != errno.ECONNREFUSED:
+            raise
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+
+    raise socket.error(errno.EADDRINUSE,
+            'Another process is listening on {0}'.format(path))
+
+
+def bind_unix_socket(path, mode=0600, backlog=128):
+    '''
+    Create a Unix socket listening on ``path``
+
+    A socket file left behind by an earlier run is removed first.
+
+    :param mode: the permissions of the socket file, as a number or an octal
+        string such as ``'0660'``
+    :return: the listening socket
+    '''
+    remove_stale_socket(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, file_mode(mode))
+
+    sock.listen(backlog)
+    return sock
+
+
+def ssl_context(certfile, keyfile=None, ciphers=None, tickets=True):
+    '''
+    Return a server :py:class:`ssl.SSLContext` for a certificate and key
+
+    The context keeps a cache of TLS sessions and issues session tickets so
+    that a client reconnecting can resume its session rather than make a full
+    handshake. Only ECDHE and DHE ciphers are offered by default and the
+    server picks the cipher.
+
+    One context is built per certificate and settings and is reused until the
+    certificate or key file changes. Worker processes forked after the
+    context is built share its session ticket keys, so a ticket issued by one
+    worker is accepted by the others.
+
+    :param ciphers: an OpenSSL cipher list; :py:data:`DEFAULT_CIPHERS` if
+        not given
+    :param tickets: whether to issue session tickets
+    :return: the context, or ``None`` if this Python has no
+        :py:class:`ssl.SSLContext`
+    '''
+    if not hasattr(ssl, 'SSLContext'):
+        return None
+
+    mtimes = tuple(os.stat(i).st_mtime for i in (certfile, keyfile) if i)
+    key = (certfile, keyfile, ciphers, tickets, mtimes)
+
+    with _ssl_contexts_lock:
+        context = _ssl_contexts.get(key)
+        if context is not None:
+            return context
+
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.options |= (ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+                | ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+                | ssl.OP_SINGLE_DH_USE | ssl.OP_SINGLE_ECDH_USE)
+        if tickets:
+            context.options &= ~OP_NO_TICKET
+        else:
+            context.options |= OP_NO_TICKET
+
+        context.set_ciphers(ciphers or DEFAULT_CIPHERS)
+        context.load_cert_chain(certfile, keyfile)
+
+        # Contexts for a replaced certificate are not needed any more
+        for old in [i for i in _ssl_contexts if i[:4] == key[:4]]:
+            del _ssl_contexts[old]
+
+        _ssl_contexts[key] = context
+        return context
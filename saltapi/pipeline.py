@@ -0,0 +1,172 @@
+'''
+Lowstate pipelines: chunks that use the results of earlier chunks
+
+A workflow such as "find the minions whose grains match, run a state on just
+those, then look up the job" would otherwise take one HTTP round trip per
+step. Instead, a chunk may refer to the results of chunks before it in the
+same request and the whole chain runs server-side.
+
+Any value in a chunk may be a reference to an earlier result:
+
+``{"$ref": "<index>.<key>.<key>..."}``
+    The result of the chunk at ``<index>`` in the lowstate (counting from
+    zero), optionally followed by keys or list indexes to look up inside it.
+    Use a list, e.g. ``{"$ref": [0, "web1.example.com"]}``, for keys that
+    contain dots.
+
+A chunk may also take its target from the minions in an earlier result:
+
+``"tgt_from": <reference>``
+    Target the minions that returned a true value in the referenced result.
+``"tgt_from": {"chunk": <reference>, "match": <value>}``
+    Target the minions whose return equals ``<value>``.
+
+Either form sets ``tgt`` to a list of minion IDs and ``expr_form`` to
+``list``. For example:
+
+.. code-block:: json
+
+    [{
+        "client": "local",
+        "tgt": "*",
+        "fun": "grains.get",
+        "arg": ["roles:web"]
+    },
+    {
+        "client": "local_async",
+        "tgt_from": 0,
+        "fun": "state.sls",
+        "arg": ["nginx"]
+    },
+    {
+        "client": "runner",
+        "fun": "jobs.lookup_jid",
+        "jid": {"$ref": "1.jid"}
+    }]
+
+A chunk with references runs only after every chunk before it has finished.
+'''
+# Import salt libs
+from salt.exceptions import SaltInvocationError
+
+REF = '$ref'
+
+
+def _is_ref(value):
+    '''
+    Whether a value is a reference
+    '''
+    return isinstance(value, dict) and len(value) == 1 and REF in value
+
+
+def _contains_ref(value):
+    '''
+    Whether a value is or contains a reference
+    '''
+    if _is_ref(value):
+        return True
+    elif isinstance(value, dict):
+        return any(_contains_ref(i) for i in value.values())
+    elif isinstance(value, list):
+        return any(_contains_ref(i) for i in value)
+
+    return False
+
+
+def has_refs(chunk):
+    '''
+    Whether a lowstate chunk uses the results of earlier chunks
+    '''
+    return 'tgt_from' in chunk or _contains_ref(chunk)
+
+
+def lookup(path, results):
+    '''
+    Return the value a reference path points to
+
+    :param path: a chunk index, a dotted string or a list of a chunk index
+        followed by keys
+    :param results: the results of the chunks run so far, by chunk index
+    :raises SaltInvocationError: if the path does not point to a value
+    '''
+    if isinstance(path, basestring):
+        parts = path.split('.')
+    elif isinstance(path, list):
+        parts = list(path)
+    else:
+        parts = [path]
+
+    try:
+        index = int(parts[0])
+    except (IndexError, TypeError, ValueError):
+        raise SaltInvocationError(
+                'Invalid reference {0!r}: it must start with the index of an '
+                'earlier chunk'.format(path))
+
+    if not 0 <= index < len(results):
+        raise SaltInvocationError(
+                'Invalid reference {0!r}: chunk {1} has not run yet'
+                .format(path, index))
+
+    value = results[index]
+    for key in parts[1:]:
+        try:
+            if isinstance(value, list):
+                key = int(key)
+            value = value[key]
+        except (IndexError, KeyError, TypeError, ValueError):
+            raise SaltInvocationError(
+                    'Invalid reference {0!r}: {1!r} not found'
+                    .format(path, key))
+
+    return value
+
+
+def _substitute(value, results):
+    '''
+    Replace every reference in a value with what it points to
+    '''
+    if _is_ref(value):
+        return lookup(value[REF], results)
+    elif isinstance(value, dict):
+        return dict((key, _substitute(val, results))
+                for key, val in value.items())
+    elif isinstance(value, list):
+        return [_substitute(i, results) for i in value]
+
+    return value
+
+
+def resolve(chunk, results):
+    '''
+    Return a copy of a lowstate chunk with its references replaced by the
+    results of earlier chunks
+
+    :param results: the results of the chunks run so far, by chunk index
+    :raises SaltInvocationError: if a reference is invalid
+    '''
+    chunk = _substitute(chunk, results)
+
+    tgt_from = chunk.pop('tgt_from', None)
+    if tgt_from is None:
+        return chunk
+
+    if isinstance(tgt_from, dict):
+        path = tgt_from.get('chunk')
+        matches = lambda ret: ret == tgt_from['match']
+        if 'match' not in tgt_from:
+            matches = bool
+    else:
+        path = tgt_from
+        matches = bool
+
+    minion_rets = lookup(path, results)
+    if not isinstance(minion_rets, dict):
+        raise SaltInvocationError(
+                'Invalid tgt_from {0!r}: it must refer to a dictionary of '
+                'minion returns'.format(path))
+
+    chunk['tgt'] = sorted(minion for minion, ret in minion_rets.items()
+            if matches(ret))
+    chunk['expr_form'] = 'list'
+    return chunk
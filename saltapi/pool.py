@@ -0,0 +1,261 @@
+'''
+Reusable Salt client instances shared by everything in a salt-api process
+
+Building a :py:class:`~salt.client.LocalClient` re-reads the master config and
+opens new sockets to the master; building a
+:py:class:`~salt.runner.RunnerClient` or :py:class:`~salt.wheel.WheelClient`
+runs the loader. The :py:class:`ClientPool` keeps finished clients around so
+that cost is paid once per client rather than once per request.
+
+Pool behavior is configured in the Salt master config:
+
+api_client_pool_size : ``10``
+    The number of idle clients of each type to keep around.
+api_client_max_age : ``3600``
+    Seconds after which a client is discarded rather than reused. This bounds
+    how long a client that has silently lost its master connection can linger.
+api_thread_pool_size : ``10``
+    The number of threads rest_tornado uses to run blocking calls, such as
+    salt-ssh, off its IOLoop.
+
+A client is also discarded when the master config file has changed since it
+was built or when its connection to the master event bus has been closed.
+Discarded clients are closed so their sockets are released right away.
+'''
+# Import python libs
+import collections
+import contextlib
+import logging
+import multiprocessing.pool
+import os
+import threading
+import time
+
+# Import salt libs
+import salt.client
+import salt.runner
+import salt.wheel
+from salt.exceptions import (SaltException, EauthAuthenticationError,
+        SaltInvocationError)
+
+logger = logging.getLogger(__name__)
+
+# Pooled client type -> the Salt client class it is an instance of
+CLIENT_CLASSES = {
+    'local': salt.client.LocalClient,
+    'runner': salt.runner.RunnerClient,
+    'wheel': salt.wheel.Wheel,
+}
+
+# Errors that are caused by the request rather than by the client. A client
+# that raises one of these is still healthy and goes back into the pool.
+REQUEST_ERRORS = (EauthAuthenticationError, SaltInvocationError)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(opts):
+    '''
+    Return the :py:class:`ClientPool` for the master config in ``opts``
+
+    Pools are shared process-wide and keyed by the path of the master config
+    file. A pool inherited across a fork is never reused since the clients in
+    it hold sockets belonging to the parent process.
+    '''
+    key = opts.get('conf_file')
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ClientPool(opts)
+
+    return pool
+
+
+class _Pooled(object):
+    '''
+    A pooled client and what its health is judged by
+    '''
+    __slots__ = ('client', 'created', 'config_mtime')
+
+    def __init__(self, client, config_mtime):
+        self.client = client
+        self.created = time.time()
+        self.config_mtime = config_mtime
+
+
+class ClientPool(object):
+    '''
+    A thread-safe pool of Salt client instances
+
+    A client is checked out for the duration of a single call and is never
+    used by two threads at once:
+
+    >>> pool = get_pool(__opts__)
+    >>> with pool.client('local') as local:
+    ...     local.cmd('*', 'test.ping')
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.size = opts.get('api_client_pool_size', 10)
+        self.max_age = opts.get('api_client_max_age', 3600)
+        self.pid = os.getpid()
+
+        # client type -> list of _Pooled
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _create(self, kind):
+        '''
+        Build a new client of the given type
+        '''
+        logger.debug("Creating a new '%s' client", kind)
+
+        if kind == 'local':
+            client = salt.client.get_local_client(self.opts['conf_file'])
+        elif kind in CLIENT_CLASSES:
+            client = CLIENT_CLASSES[kind](self.opts)
+        else:
+            raise SaltException("Unknown client type '{0}'".format(kind))
+
+        return _Pooled(client, self._config_mtime())
+
+    def _config_mtime(self):
+        '''
+        The modification time of the master config file, or ``None``
+        '''
+        try:
+            return os.stat(self.opts['conf_file']).st_mtime
+        except (KeyError, OSError):
+            return None
+
+    def _healthy(self, kind, pooled):
+        '''
+        Health check for an idle client before it is handed out again
+        '''
+        if time.time() - pooled.created >= self.max_age:
+            logger.debug("Discarding expired '%s' client", kind)
+            return False
+
+        if self._config_mtime() != pooled.config_mtime:
+            logger.debug("Discarding '%s' client built from an older master "
+                    "config", kind)
+            return False
+
+        sub = getattr(getattr(pooled.client, 'event', None), 'sub', None)
+        if getattr(sub, 'closed', False):
+            logger.debug("Discarding '%s' client whose event bus connection "
+                    "is closed", kind)
+            return False
+
+        return True
+
+    def _close(self, kind, pooled):
+        '''
+        Release the sockets of a client that is being discarded
+        '''
+        event = getattr(pooled.client, 'event', None)
+        if event is None or not hasattr(event, 'destroy'):
+            return
+
+        try:
+            event.destroy()
+        except Exception:
+            logger.debug("Error closing a discarded '%s' client", kind,
+                    exc_info=True)
+
+    def checkout(self, kind):
+        '''
+        Take a healthy idle client out of the pool or create one
+
+        :return: a :py:class:`_Pooled` client
+        '''
+        discarded = []
+        try:
+            with self._lock:
+                idle = self._idle[kind]
+                while idle:
+                    pooled = idle.pop()
+                    if self._healthy(kind, pooled):
+                        return pooled
+                    discarded.append(pooled)
+        finally:
+            for pooled in discarded:
+                self._close(kind, pooled)
+
+        return self._create(kind)
+
+    def checkin(self, kind, pooled):
+        '''
+        Return a client to the pool; extra clients beyond the pool size are
+        closed
+        '''
+        with self._lock:
+            idle = self._idle[kind]
+            if len(idle) < self.size and self._healthy(kind, pooled):
+                idle.append(pooled)
+                return
+
+        self._close(kind, pooled)
+
+    @contextlib.contextmanager
+    def client(self, kind):
+        '''
+        Check out a client for the duration of a ``with`` block
+
+        A client whose call fails with anything other than a request error
+        (bad credentials, bad arguments) may have lost its connection to the
+        master so it is closed; the next checkout reconnects. A generator
+        that is closed before it finishes gives its client back as usual.
+        '''
+        pooled = self.checkout(kind)
+
+        try:
+            yield pooled.client
+        except REQUEST_ERRORS:
+            self.checkin(kind, pooled)
+            raise
+        except Exception:
+            logger.debug("Discarding '%s' client after an error", kind,
+                    exc_info=True)
+            self._close(kind, pooled)
+            raise
+        except GeneratorExit:
+            self.checkin(kind, pooled)
+            raise
+        else:
+            self.checkin(kind, pooled)
+
+    def clear(self):
+        '''
+        Close and drop all idle clients
+        '''
+        with self._lock:
+            idle, self._idle = self._idle, collections.defaultdict(list)
+
+        for kind, clients in idle.items():
+            for pooled in clients:
+                self._close(kind, pooled)
+
+
+_thread_pool = None
+_thread_pool_lock = threading.Lock()
+
+
+def get_thread_pool(opts):
+    '''
+    Return the process-wide thread pool used to run blocking calls off the
+    rest_tornado IOLoop
+
+    The pool size is set by ``api_thread_pool_size`` (default ``10``) the
+    first time it is requested in a process.
+    '''
+    global _thread_pool
+
+    with _thread_pool_lock:
+        if _thread_pool is None or _thread_pool[0] != os.getpid():
+            size = opts.get('api_thread_pool_size', 10)
+            _thread_pool = (os.getpid(), multiprocessing.pool.ThreadPool(size))
+
+    return _thread_pool[1]
@@ -0,0 +1,325 @@
+'''
+Run runner and wheel functions in a pool of worker processes
+
+Runner and wheel functions run in the master-side API process itself, and
+CPU-heavy ones (e.g. ``jobs.list_jobs`` over a large job cache or
+``manage.status``) hold the GIL for their whole run, slowing down every other
+request the process is serving. With the process pool enabled those calls are
+handed to a fixed set of pre-forked worker processes instead and the API
+threads only wait on a pipe.
+
+Each worker builds its :py:class:`~salt.runner.RunnerClient` and
+:py:class:`~salt.wheel.Wheel` once, so the loaders stay warm between calls. A
+worker is replaced after a configurable number of calls to bound the memory
+it can accumulate, and a call that runs past its timeout has its worker
+killed and replaced.
+
+Servers start the pool before they start any threads, so the workers are not
+forked while another thread may hold a lock. The workers are not daemonic, so
+runner and wheel functions may start processes of their own. The pool stops
+them when the server process exits, and a worker whose server process is gone
+(e.g. killed by its supervisor) exits on its own.
+
+A call waits up to ``queue_timeout`` seconds for a free worker; after that it
+is turned away with :py:exc:`~saltapi.scheduler.Overloaded`, which the
+servers answer with ``503 Service Unavailable``.
+
+The pool is configured in the Salt master config:
+
+.. code-block:: yaml
+
+    api_process_pool:
+      # Optional settings and their defaults
+      size: 4
+      # Seconds a single call may run; 0 for no limit
+      timeout: 300
+      # Calls a worker serves before it is replaced; 0 for no limit
+      max_tasks: 1000
+      # Seconds a call waits for a free worker
+      queue_timeout: 30
+'''
+# Import python libs
+import atexit
+import logging
+import multiprocessing
+import os
+import pickle
+import Queue
+import signal
+import threading
+import time
+
+# Import salt libs
+import salt.runner
+import salt.wheel
+from salt.exceptions import SaltException
+
+# Import salt-api libs
+import saltapi.scheduler
+
+logger = logging.getLogger(__name__)
+
+# The client types run in the pool
+CLIENTS = ('runner', 'wheel')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_process_pool(opts):
+    '''
+    Return the :py:class:`ProcessPool` for the master config in ``opts`` or
+    ``None`` if the process pool is not configured
+
+    The workers are started the first time the pool is requested in a
+    process; a server requests it before it starts any threads.
+    '''
+    pool_opts = opts.get('api_process_pool')
+    if not pool_opts:
+        return None
+
+    if not isinstance(pool_opts, dict):
+        pool_opts = {}
+
+    key = opts.get('conf_file')
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ProcessPool(opts, pool_opts)
+            atexit.register(pool.close)
+
+    return pool
+
+
+def _call(clients, kind, fun, kwargs):
+    '''
+    Run a function with the worker's warm client of the given type
+    '''
+    if kind == 'runner':
+        return clients['runner'].low(fun, kwargs)
+    elif kind == 'wheel':
+        return clients['wheel'].master_call(fun=fun, **kwargs)
+
+    raise SaltException("Unknown client type '{0}'".format(kind))
+
+
+def _picklable(exc):
+    '''
+    Return ``exc`` if it survives the trip back to the API process, otherwise
+    a plain :py:exc:`~salt.exceptions.SaltException` describing it
+    '''
+    try:
+        pickle.loads(pickle.dumps(exc))
+        return exc
+    except Exception:
+        return SaltException('{0}: {1}'.format(type(exc).__name__, exc))
+
+
+def _reset_logging_locks():
+    '''
+    Replace the logging locks, which a thread of the API process may have
+    held when a replacement worker was forked
+    '''
+    logging._lock = threading.RLock()
+    for ref in logging._handlerList:
+        handler = ref()
+        if handler is not None:
+            handler.createLock()
+
+
+def _serve(opts, conn, parent):
+    '''
+    The worker process main loop: run calls sent down the pipe until told to
+    stop or until the API process goes away
+    '''
+    _reset_logging_locks()
+
+    # Interrupts are handled by the API process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    clients = {
+        'runner': salt.runner.RunnerClient(opts),
+        'wheel': salt.wheel.Wheel(opts),
+    }
+
+    while True:
+        try:
+            # Other workers hold the parent end of this pipe too, so it is
+            # not closed when the API process dies
+            while not conn.poll(5):
+                if os.getppid() != parent:
+                    return
+            task = conn.recv()
+        except (EOFError, IOError):
+            break
+
+        if task is None:
+            break
+
+        try:
+            ret = ('ok', _call(clients, *task))
+        except Exception as exc:
+            ret = ('error', _picklable(exc))
+
+        try:
+            conn.send(ret)
+        except Exception as exc:
+            conn.send(('error', SaltException(
+                    'Unable to return the result: {0}'.format(exc))))
+
+
+class _Worker(object):
+    '''
+    A worker process and the parent end of its pipe
+    '''
+    def __init__(self, opts):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.tasks = 0
+
+        self.process = multiprocessing.Process(target=_serve,
+                args=(opts, child_conn, os.getpid()), name='api-pool-worker')
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        '''
+        Ask the worker to exit after any call in progress
+        '''
+        try:
+            self.conn.send(None)
+        except (EOFError, IOError):
+            pass
+        self.conn.close()
+
+    def kill(self):
+        '''
+        Kill the worker right away
+        '''
+        self.conn.close()
+        self.process.terminate()
+        self.process.join()
+
+
+class ProcessPool(object):
+    '''
+    A fixed-size pool of worker processes running runner and wheel calls
+
+    Calls block until a worker is free:
+
+    >>> pool = get_process_pool(__opts__)
+    >>> pool.run('runner', 'manage.status', {})
+    '''
+    def __init__(self, opts, pool_opts):
+        self.opts = opts
+        self.pid = os.getpid()
+
+        self.size = pool_opts.get('size', 4)
+        self.timeout = pool_opts.get('timeout', 300) or None
+        self.max_tasks = pool_opts.get('max_tasks', 1000)
+        self.queue_timeout = pool_opts.get('queue_timeout', 30)
+
+        # Every live worker, idle or busy, so close() can stop them all
+        self._workers = set()
+        self.closed = False
+        self._idle = Queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        '''
+        Start a worker and keep track of it
+        '''
+        worker = _Worker(self.opts)
+        self._workers.add(worker)
+        return worker
+
+    def _discard(self, worker, kill=False):
+        '''
+        Stop tracking a worker and stop or kill it
+        '''
+        self._workers.discard(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def run(self, kind, fun, kwargs):
+        '''
+        Run ``fun`` with a client of the given type in a worker and return its
+        return or raise its exception
+
+        :raises SaltException: if the call timed out or the worker died
+        :raises Overloaded: if no worker became free within
+            ``queue_timeout`` seconds
+        '''
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except Queue.Empty:
+            raise saltapi.scheduler.Overloaded('No process pool worker was '
+                    'free for {0} seconds'.format(self.queue_timeout))
+
+        try:
+            worker.conn.send((kind, fun, kwargs))
+
+            if not worker.conn.poll(self.timeout):
+                logger.error("Killing worker %s after '%s' ran for more than "
+                        "%s seconds", worker.process.pid, fun, self.timeout)
+                self._discard(worker, kill=True)
+                worker = None
+                raise SaltException("'{0}' timed out after {1} seconds"
+                        .format(fun, self.timeout))
+
+            status, ret = worker.conn.recv()
+        except (EOFError, IOError):
+            logger.error('Worker %s died running %s', worker.process.pid, fun)
+            self._discard(worker, kill=True)
+            worker = None
+            raise SaltException("The worker running '{0}' died".format(fun))
+        finally:
+            self._recycle(worker)
+
+        if status == 'error':
+            raise ret
+
+        return ret
+
+    def _recycle(self, worker):
+        '''
+        Put a worker back in the pool, replacing it if it was killed
+        (``None``) or once it has served ``max_tasks`` calls
+        '''
+        if worker is not None:
+            worker.tasks += 1
+            if self.max_tasks and worker.tasks >= self.max_tasks:
+                logger.debug('Replacing worker %s after %s calls',
+                        worker.process.pid, self.max_tasks)
+                self._discard(worker)
+                worker = None
+
+        if self.closed:
+            if worker is not None:
+                self._discard(worker)
+            return
+
+        self._idle.put(worker or self._spawn())
+
+    def close(self, timeout=1):
+        '''
+        Stop every worker, killing any that has not exited after ``timeout``
+        seconds
+        '''
+        if self.pid != os.getpid():
+            return
+
+        self.closed = True
+        workers, self._workers = list(self._workers), set()
+        for worker in workers:
+            worker.stop()
+
+        deadline = time.time() + timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.time(), 0))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
@@ -0,0 +1,271 @@
+'''
+Protect the master from bursts of API traffic
+
+Every call from :py:class:`~saltapi.APIClient` to a Salt client goes through
+the dispatch scheduler before it reaches the master. The scheduler enforces:
+
+* A token-bucket pacer on publishes (``local``, ``local_async`` and
+  ``local_batch`` calls) so a burst of jobs is spread out rather than handed
+  to the master's publisher and job cache all at once.
+* Separate concurrency limits for ``local``, ``runner`` and ``wheel`` calls.
+* A bounded queue of callers waiting for either of the above. A caller that
+  finds the queue full, or that waits longer than the queue timeout, is
+  turned away with an :py:exc:`Overloaded` error which the netapi modules
+  return as ``503 Service Unavailable`` with a :mailheader:`Retry-After`
+  header.
+
+The scheduler is configured in the Salt master config; any limit that is not
+set is not enforced:
+
+.. code-block:: yaml
+
+    api_dispatch:
+      # Publishes per second and the largest burst allowed
+      publish_rate: 20
+      publish_burst: 50
+      # Calls allowed to run at once per client type
+      concurrency:
+        local: 50
+        runner: 10
+        wheel: 10
+      # Callers allowed to wait and for how many seconds
+      queue_size: 100
+      queue_timeout: 10
+'''
+# Import python libs
+import collections
+import math
+import os
+import threading
+import time
+
+# Import salt libs
+from salt.exceptions import SaltException
+
+# The client types that publish jobs to minions
+PUBLISHERS = ('local',)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class Overloaded(SaltException):
+    '''
+    Raised when a call is turned away by the dispatch scheduler
+    '''
+    def __init__(self, message, retry_after=1):
+        SaltException.__init__(self, message)
+        self.retry_after = retry_after
+
+
+def client_type(client):
+    '''
+    Return the client type the scheduler limits a client interface under,
+    e.g. ``local`` for ``local_async``
+    '''
+    return client.split('_', 1)[0]
+
+
+def get_scheduler(opts):
+    '''
+    Return the :py:class:`Scheduler` for the master config in ``opts`` or
+    ``None`` if dispatch scheduling is not configured
+    '''
+    dispatch_opts = opts.get('api_dispatch')
+    if not dispatch_opts:
+        return None
+
+    key = opts.get('conf_file')
+
+    with _schedulers_lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None or scheduler.pid != os.getpid():
+            scheduler = _schedulers[key] = Scheduler(dispatch_opts)
+
+    return scheduler
+
+
+class TokenBucket(object):
+    '''
+    A token bucket that refills at ``rate`` tokens a second up to ``burst``
+    tokens. Not thread-safe on its own.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def take(self):
+        '''
+        Take a token
+
+        :return: ``0`` if a token was taken, otherwise the number of seconds
+            until one will be available
+        '''
+        now = time.time()
+        self.tokens = min(self.burst,
+                self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+class Scheduler(object):
+    '''
+    Admit calls to Salt clients subject to the pacer, the concurrency limits
+    and the wait queue
+    '''
+    def __init__(self, dispatch_opts):
+        self.pid = os.getpid()
+
+        self.limits = dict(dispatch_opts.get('concurrency', {}))
+        self.queue_size = dispatch_opts.get('queue_size', 100)
+        self.queue_timeout = dispatch_opts.get('queue_timeout', 10)
+
+        rate = dispatch_opts.get('publish_rate')
+        self.bucket = None
+        if rate:
+            self.bucket = TokenBucket(rate,
+                    dispatch_opts.get('publish_burst', rate))
+
+        self.running = collections.defaultdict(int)
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def _admit(self, kind):
+        '''
+        Try to admit a call; the lock must be held
+
+        :return: ``0`` if admitted, otherwise the number of seconds worth
+            waiting before trying again or ``None`` to wait for a release
+        '''
+        limit = self.limits.get(kind)
+        if limit is not None and self.running[kind] >= limit:
+            return None
+
+        if kind in PUBLISHERS and self.bucket is not None:
+            delay = self.bucket.take()
+            if delay:
+                return delay
+
+        self.running[kind] += 1
+        return 0
+
+    def acquire(self, kind, block=True):
+        '''
+        Wait for permission to run a call of the given client type
+
+        :param block: queue for up to the queue timeout if the call cannot
+            run right away; non-blocking callers are turned away instead
+        :raises Overloaded: if the call was turned away
+        '''
+        deadline = time.time() + self.queue_timeout
+        queued = False
+
+        with self._cond:
+            try:
+                while True:
+                    delay = self._admit(kind)
+                    if delay == 0:
+                        return
+
+                    retry_after = max(1, int(math.ceil(delay or 1)))
+
+                    if not block:
+                        raise Overloaded('Too many {0} requests'.format(kind),
+                                retry_after)
+
+                    if not queued:
+                        if self.waiting >= self.queue_size:
+                            raise Overloaded('Request queue is full',
+                                    retry_after)
+                        self.waiting += 1
+                        queued = True
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise Overloaded('Timed out waiting in the request '
+                                'queue', retry_after)
+
+                    self._cond.wait(min(delay or remaining, remaining))
+            finally:
+                if queued:
+                    self.waiting -= 1
+
+    def release(self, kind):
+        '''
+        Mark a call of the given client type as finished
+        '''
+        with self._cond:
+            self.running[kind] -= 1
+            self._cond.notify_all()
+
+    def call(self, client, fun, args=(), kwargs=None, block=True):
+        '''
+        Call ``fun`` once a call to the client interface ``client`` is
+        admitted and return its return
+
+        A return that is an iterator (e.g. from ``local_batch`` or ``ssh``)
+        does its work as it is iterated, so the call is held until the
+        iterator is used up or closed rather than until ``fun`` returns.
+        '''
+        kind = client_type(client)
+        self.acquire(kind, block)
+
+        held = False
+        try:
+            ret = fun(*args, **(kwargs or {}))
+            if isinstance(ret, collections.Iterator):
+                ret = HeldIterator(self, kind, ret)
+                held = True
+            return ret
+        finally:
+            if not held:
+                self.release(kind)
+
+
+class HeldIterator(object):
+    '''
+    An iterator that holds a call admitted by a :py:class:`Scheduler` until
+    the iterator it wraps is used up or closed
+    '''
+    def __init__(self, scheduler, kind, iterator):
+        self.scheduler = scheduler
+        self.kind = kind
+        self.iterator = iterator
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.released:
+            raise StopIteration
+
+        try:
+            return next(self.iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        '''
+        Close the wrapped iterator and release the call
+        '''
+        if self.released:
+            return
+        self.released = True
+
+        try:
+            if hasattr(self.iterator, 'close'):
+                self.iterator.close()
+        finally:
+            self.scheduler.release(self.kind)
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,89 @@
+'''
+Utility functions used throughout salt-api
+'''
+# Import python libs
+import inspect
+
+# Import salt libs
+import salt.utils
+from salt.exceptions import SaltInvocationError
+
+# (function, is a method) -> ArgBinder
+_binders = {}
+
+
+class ArgBinder(object):
+    '''
+    The signature of a function, inspected once, for mapping lowstate
+    dictionaries onto calls to that function
+
+    Binding produces the same result as :py:func:`salt.utils.format_call`
+    without inspecting the function on every call.
+    '''
+    def __init__(self, fun):
+        aspec = salt.utils.get_function_argspec(fun)
+
+        self.name = fun.__name__
+        self.defaults = dict(zip(reversed(aspec.args),
+            reversed(aspec.defaults or ())))
+        self.args = tuple(i for i in aspec.args if i not in self.defaults)
+        self.accepts_kwargs = bool(aspec.keywords)
+
+    def bind(self, data):
+        '''
+        Return a dictionary of ``args`` and ``kwargs`` for calling the
+        function with the values in ``data``
+
+        :raises SaltInvocationError: if ``data`` is missing a required
+            positional argument
+        '''
+        data = data.copy()
+
+        kwargs = {}
+        for key, default in self.defaults.items():
+            kwargs[key] = data.pop(key, default)
+
+        args = []
+        missing = []
+        for arg in self.args:
+            if arg in data:
+                args.append(data.pop(arg))
+            else:
+                missing.append(arg)
+
+        if missing:
+            count = len(args) + len(missing)
+            raise SaltInvocationError(
+                '{0} takes at least {1} argument{2} ({3} given)'.format(
+                    self.name, count, count > 1 and 's' or '', len(args)))
+
+        # Unexpected keys are only passed along if the function takes
+        # **kwargs; format_call drops them otherwise
+        if self.accepts_kwargs:
+            kwargs.update(data)
+
+        return {'args': args, 'kwargs': kwargs}
+
+
+def get_binder(fun):
+    '''
+    Return the memoized :py:class:`ArgBinder` for a function or method
+
+    Bound methods share the binder of the function they wrap so a new client
+    instance does not mean a new inspection.
+    '''
+    is_method = inspect.ismethod(fun)
+    key = (getattr(fun, '__func__', fun), is_method)
+
+    binder = _binders.get(key)
+    if binder is None:
+        binder = _binders[key] = ArgBinder(fun)
+
+    return binder
+
+
+def format_call(fun, data):
+    '''
+    A memoized drop-in for :py:func:`salt.utils.format_call`
+    '''
+    return get_binder(fun).bind(data)
@@ -0,0 +1,103 @@
+'''
+Warm up a server process before it accepts requests
+
+The first requests a new process serves would otherwise each pay for
+connecting to the master, running the runner and wheel loaders, reading eauth
+tokens and listing the minions. A netapi module with ``warmup`` enabled in its
+config section runs :py:func:`warm_up` in every server process before that
+process starts accepting connections:
+
+.. code-block:: yaml
+
+    rest_cherrypy:
+      port: 8000
+      warmup: True
+
+Warming up fills the process-wide :py:mod:`client pool <saltapi.pool>`
+and starts the shared thread pool, process pool, event collector, result
+cache and dispatch scheduler where they are configured. It also compiles the
+:py:mod:`permissions <saltapi.acl>` of every unexpired eauth token and reads
+the list of accepted minions.
+'''
+# Import python libs
+import logging
+import os
+import time
+
+# Import salt libs
+import salt.utils.minions
+from salt.exceptions import EauthAuthenticationError
+
+# Import salt-api libs
+import saltapi.acl
+import saltapi.cache
+import saltapi.collector
+import saltapi.pool
+import saltapi.procpool
+import saltapi.scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def connect_clients(opts):
+    '''
+    Build one pooled client of each type and start the shared pools
+    '''
+    pool = saltapi.pool.get_pool(opts)
+    for kind in sorted(saltapi.pool.CLIENT_CLASSES):
+        with pool.client(kind):
+            pass
+
+    saltapi.pool.get_thread_pool(opts)
+    saltapi.procpool.get_process_pool(opts)
+    saltapi.cache.get_cache(opts)
+    saltapi.scheduler.get_scheduler(opts)
+
+    if opts.get('api_return_collector'):
+        saltapi.collector.get_collector(opts)
+
+
+def load_tokens(opts):
+    '''
+    Compile the permissions of every unexpired eauth token
+    '''
+    token_dir = opts.get('token_dir')
+    if not token_dir or not os.path.isdir(token_dir):
+        return
+
+    tokens = sorted(os.listdir(token_dir))[:saltapi.acl.MAX_TOKENS]
+    for token in tokens:
+        try:
+            saltapi.acl.get_permissions(opts, {'token': token})
+        except EauthAuthenticationError:
+            # expired, or the user no longer has permissions
+            pass
+
+    logger.debug('Loaded %s eauth tokens', len(tokens))
+
+
+def list_minions(opts):
+    '''
+    Read the accepted minion keys that targets are matched against
+    '''
+    salt.utils.minions.CkMinions(opts).check_minions('*')
+
+
+STEPS = (connect_clients, load_tokens, list_minions)
+
+
+def warm_up(opts):
+    '''
+    Run every warm-up step; a step that fails is logged and skipped since
+    the process can still serve requests without it
+    '''
+    start = time.time()
+
+    for step in STEPS:
+        try:
+            step(opts)
+        except Exception:
+            logger.warning('Warm-up step %s failed', step.__name__,
+                    exc_info=True)
+
+    logger.info('Warmed up in %.2f seconds', time.time() - start)
@@ -0,0 +1,107 @@
+'''
+Measure the per-request cost of getting a Salt client with and without the
+client pool
+
+Without the pool every request builds its client the way salt-api used to:
+:py:func:`salt.client.get_local_client` for ``local`` calls and a new
+:py:class:`~salt.runner.RunnerClient` or :py:class:`~salt.wheel.Wheel` for
+``runner`` and ``wheel`` calls. With the pool a client is checked out and back
+in. No master needs to be running since no call is made.
+
+Usage::
+
+    python tests/bench/bench_client_pool.py [-c /etc/salt/master] [-n 200]
+
+A throwaway master config is written to a temporary directory when ``-c`` is
+not given.
+'''
+# Import python libs
+import optparse
+import os
+import shutil
+import tempfile
+import time
+
+# Import salt libs
+import salt.client
+import salt.runner
+import salt.wheel
+
+# Import salt-api libs
+import saltapi.config
+import saltapi.pool
+
+
+def temp_config():
+    '''
+    Write a minimal master config to a temporary directory
+    '''
+    root = tempfile.mkdtemp()
+    conf_file = os.path.join(root, 'master')
+    with open(conf_file, 'w') as fp_:
+        for key in ('cachedir', 'sock_dir', 'pki_dir'):
+            fp_.write('{0}: {1}\n'.format(key, os.path.join(root, key)))
+            os.makedirs(os.path.join(root, key))
+        fp_.write('log_file: {0}\n'.format(os.path.join(root, 'log')))
+    return root, conf_file
+
+
+def unpooled(opts, kind):
+    '''
+    Build a client as salt-api did for every request before the pool
+    '''
+    if kind == 'local':
+        return salt.client.get_local_client(opts['conf_file'])
+    elif kind == 'runner':
+        return salt.runner.RunnerClient(opts)
+    return salt.wheel.Wheel(opts)
+
+
+def pooled(opts, kind):
+    '''
+    Check a client out of the pool and back in
+    '''
+    with saltapi.pool.get_pool(opts).client(kind) as client:
+        return client
+
+
+def measure(fun, opts, kind, num):
+    '''
+    Return the mean seconds a call of ``fun`` takes
+    '''
+    fun(opts, kind)
+    start = time.time()
+    for _ in range(num):
+        fun(opts, kind)
+    return (time.time() - start) / num
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--config', help='the master config file')
+    parser.add_option('-n', '--num', type='int', default=200,
+            help='requests to time per client type')
+    options, _ = parser.parse_args()
+
+    root = None
+    conf_file = options.config
+    if conf_file is None:
+        root, conf_file = temp_config()
+
+    try:
+        opts = saltapi.config.api_config(conf_file)
+
+        print '{0:8} {1:>14} {2:>14} {3:>9}'.format('client', 'unpooled',
+                'pooled', 'speedup')
+        for kind in ('local', 'runner', 'wheel'):
+            before = measure(unpooled, opts, kind, options.num)
+            after = measure(pooled, opts, kind, options.num)
+            print '{0:8} {1:>11.1f} us {2:>11.1f} us {3:>8.0f}x'.format(kind,
+                    before * 1e6, after * 1e6, before / after)
+    finally:
+        if root is not None:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''
+Measure mapping lowstate chunks onto client calls with and without the
+memoized argument binding
+
+Times :py:func:`salt.utils.format_call`, which inspects the function on every
+call, against :py:func:`saltapi.utils.format_call` for ``local_async``
+chunks as :py:meth:`saltapi.APIClient.run` binds them and as rest_tornado
+binds them to :py:meth:`salt.client.LocalClient.run_job`.
+
+Usage::
+
+    python tests/bench/bench_format_call.py [-n 100000]
+'''
+# Import python libs
+import optparse
+import time
+
+# Import salt libs
+import salt.client
+import salt.utils
+
+# Import salt-api libs
+import saltapi
+import saltapi.utils
+
+
+def measure(format_call, fun, chunks):
+    '''
+    Return the seconds taken to bind every chunk
+    '''
+    start = time.time()
+    for chunk in chunks:
+        format_call(fun, chunk)
+    return time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--num', type='int', default=100000,
+            help='chunks to bind')
+    options, _ = parser.parse_args()
+
+    chunks = [{'client': 'local_async', 'tgt': 'web{0}'.format(num),
+                'fun': 'test.ping', 'arg': [], 'token': 'abc'}
+            for num in range(options.num)]
+
+    targets = (
+        ('APIClient.local_async', saltapi.APIClient({}).local_async),
+        ('LocalClient.run_job', salt.client.LocalClient.run_job),
+    )
+
+    print '{0:24} {1:>12} {2:>12} {3:>9}'.format('function',
+            'format_call', 'memoized', 'speedup')
+    for name, fun in targets:
+        before = measure(salt.utils.format_call, fun, chunks)
+        after = measure(saltapi.utils.format_call, fun, chunks)
+        print '{0:24} {1:>10.2f} s {2:>10.2f} s {3:>8.1f}x'.format(name,
+                before, after, before / after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Compare the size and the encode and decode times of MessagePack, JSON and
+YAML responses
+
+Encodes a ``{'return': [...]}`` response holding one lowstate return of
+grains-like data per minion with the serializers the netapi modules use:
+:py:func:`json.dumps`, :py:func:`yaml.safe_dump` and
+:py:class:`salt.payload.Serial`. Decoding uses :py:func:`json.loads`,
+:py:func:`yaml.safe_load` and the same ``Serial``, as request bodies are
+decoded.
+
+Usage::
+
+    python tests/bench/bench_serialization.py [-m 1000,8000] [--no-yaml]
+
+YAML is very slow for thousands of minions; ``--no-yaml`` leaves it out.
+'''
+# Import python libs
+import functools
+import json
+import optparse
+import time
+
+# Import third party libs
+import yaml
+
+# Import salt libs
+import salt.payload
+
+
+def grains(num):
+    '''
+    Return grains-like data for one minion
+    '''
+    return {
+        'id': 'minion{0}.example.com'.format(num),
+        'os': 'Debian',
+        'os_family': 'Debian',
+        'osrelease': '7.5',
+        'kernelrelease': '3.2.0-4-amd64',
+        'num_cpus': 4,
+        'mem_total': 7982,
+        'ipv4': ['10.0.{0}.{1}'.format(num // 256 % 256, num % 256),
+            '127.0.0.1'],
+        'fqdn_ip4': ['10.0.{0}.{1}'.format(num // 256 % 256, num % 256)],
+        'roles': ['web', 'cache'] if num % 2 else ['db'],
+        'saltversion': '2014.7.0',
+        'saltversioninfo': [2014, 7, 0, 0],
+        'cpu_flags': ['fpu', 'vme', 'de', 'pse', 'tsc', 'msr', 'pae', 'mce',
+            'cx8', 'apic', 'sep', 'mtrr', 'pge', 'mca', 'cmov', 'pat',
+            'pse36', 'clflush', 'mmx', 'fxsr', 'sse', 'sse2', 'ht', 'syscall',
+            'nx', 'lm', 'constant_tsc', 'pni', 'ssse3', 'cx16', 'sse4_1',
+            'sse4_2', 'popcnt', 'aes', 'hypervisor', 'lahf_lm'],
+        'virtual': 'kvm',
+        'localhost': 'minion{0}'.format(num),
+        'path': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin',
+        'pythonversion': [2, 7, 3, 'final', 0],
+        'shell': '/bin/sh',
+        'master': 'salt.example.com',
+        'gpus': [{'model': 'GD 5446', 'vendor': 'unknown'}],
+    }
+
+
+def response(minions):
+    '''
+    Return a response of one lowstate return from ``minions`` minions
+    '''
+    return {'return': [dict(('minion{0}.example.com'.format(num),
+        grains(num)) for num in range(minions))]}
+
+
+def measure(fun, arg):
+    '''
+    Return the result of a call and the seconds it took
+    '''
+    start = time.time()
+    ret = fun(arg)
+    return ret, time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-m', '--minions', default='1000,8000',
+            help='comma-separated numbers of minions in a response')
+    parser.add_option('--no-yaml', action='store_true', default=False,
+            help='leave YAML out')
+    options, _ = parser.parse_args()
+
+    serial = salt.payload.Serial('msgpack')
+    formats = [
+        ('json', json.dumps, json.loads),
+        ('msgpack', serial.dumps, serial.loads),
+    ]
+    if not options.no_yaml:
+        formats.append(('yaml', functools.partial(yaml.safe_dump,
+            default_flow_style=False), yaml.safe_load))
+
+    print '{0:>8} {1:8} {2:>10} {3:>10} {4:>10}'.format('minions', 'format',
+            'size', 'encode', 'decode')
+    for minions in [int(i) for i in options.minions.split(',')]:
+        data = response(minions)
+        for name, dumps, loads in formats:
+            blob, encode = measure(dumps, data)
+            ret, decode = measure(loads, blob)
+            assert ret == data
+            print '{0:>8} {1:8} {2:>7.2f} MB {3:>8.3f} s {4:>8.3f} s'.format(
+                    minions, name, len(blob) / 1e6, encode, decode)
+
+
+if __name__ == '__main__':
+    main()
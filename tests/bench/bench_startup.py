@@ -0,0 +1,154 @@
+'''
+Measure how long a netapi module takes from process start to its first
+answered request
+
+Each run starts a fresh Python process, so nothing is imported yet, that
+loads the master config and serves the module on one worker the way
+``salt-api`` starts a worker process. The time is taken from starting the
+process to the first ``GET /`` that is answered with ``200``. The time to
+import the module's request handlers in a fresh process is measured on its
+own as well. No master needs to be running unless ``--warmup`` is given.
+
+Usage::
+
+    python tests/bench/bench_startup.py [-m rest_tornado,rest_cherrypy] [-n 5]
+        [--warmup]
+'''
+# Import python libs
+import httplib
+import optparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from bench_client_pool import temp_config
+
+# Module -> the code a worker process runs to serve it on ``port``
+SERVE = {
+    'rest_tornado': '''
+import tornado.netutil
+import saltapi.config
+from saltapi.netapi import rest_tornado
+opts = saltapi.config.api_config({conf_file!r})
+sockets = tornado.netutil.bind_sockets({port}, '127.0.0.1')
+rest_tornado.serve(sockets, opts, {{}})
+''',
+    'rest_cherrypy': '''
+import saltapi.config
+import saltapi.netutil
+from saltapi.netapi.rest_cherrypy import app, server
+opts = saltapi.config.api_config({conf_file!r})
+root, apiopts, conf = app.get_app(opts)
+sock = saltapi.netutil.bind_socket('127.0.0.1', {port})
+server.serve(sock, root, '/', conf, opts, apiopts.get('warmup', False))
+''',
+}
+
+# Module -> the module holding its request handlers
+HANDLERS = {
+    'rest_tornado': 'saltapi.netapi.rest_tornado.saltnado',
+    'rest_cherrypy': 'saltapi.netapi.rest_cherrypy.app',
+}
+
+IMPORT = '''
+import time
+start = time.time()
+import {0}
+print time.time() - start
+'''
+
+
+def free_port():
+    '''
+    Return a TCP port that nothing is listening on
+    '''
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def answered(port):
+    '''
+    Whether ``GET /`` is answered with ``200``
+    '''
+    try:
+        conn = httplib.HTTPConnection('127.0.0.1', port, timeout=5)
+        conn.request('GET', '/', headers={'Accept': 'application/json'})
+        status = conn.getresponse().status
+        conn.close()
+    except (socket.error, httplib.HTTPException):
+        return False
+    return status == 200
+
+
+def time_to_first_request(module, conf_file, timeout=60):
+    '''
+    Return the seconds from starting a worker process to its first answer
+    '''
+    port = free_port()
+    code = SERVE[module].format(conf_file=conf_file, port=port)
+
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, '-c', code])
+    try:
+        while not answered(port):
+            if proc.poll() is not None:
+                raise Exception('{0} exited with {1}'.format(module,
+                    proc.returncode))
+            if time.time() - start > timeout:
+                raise Exception('{0} did not answer'.format(module))
+            time.sleep(0.005)
+        return time.time() - start
+    finally:
+        if proc.poll() is None:
+            os.kill(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+
+def import_time(module):
+    '''
+    Return the seconds a fresh process takes to import a module
+    '''
+    out = subprocess.check_output([sys.executable, '-c',
+        IMPORT.format(HANDLERS[module])])
+    return float(out.split()[-1])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-m', '--modules', default='rest_tornado,rest_cherrypy',
+            help='comma-separated netapi modules to measure')
+    parser.add_option('-n', '--num', type='int', default=5,
+            help='process starts to time per module')
+    parser.add_option('--warmup', action='store_true', default=False,
+            help='warm up each process before it accepts requests; needs a '
+                'running master')
+    options, _ = parser.parse_args()
+
+    root, conf_file = temp_config()
+    with open(conf_file, 'a') as fp_:
+        for module in SERVE:
+            fp_.write('{0}:\n  port: 0\n  disable_ssl: True\n  debug: False\n'
+                    '  warmup: {1}\n'.format(module, options.warmup))
+
+    try:
+        print '{0:14} {1:>10} {2:>12} {3:>12}'.format('module', 'import',
+                'first (min)', 'first (mean)')
+        for module in options.modules.split(','):
+            imported = min(import_time(module) for _ in range(options.num))
+            times = [time_to_first_request(module, conf_file)
+                    for _ in range(options.num)]
+            print '{0:14} {1:>8.3f} s {2:>10.3f} s {3:>10.3f} s'.format(module,
+                    imported, min(times), sum(times) / len(times))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
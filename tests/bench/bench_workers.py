@@ -0,0 +1,143 @@
+'''
+Measure rest_cherrypy request throughput with one or more worker processes
+
+For each worker count the app is loaded once, a listening socket is bound and
+that many worker processes serve the app from it with
+:py:func:`saltapi.netapi.rest_cherrypy.server.serve`, as the ``workers``
+setting does. Several client processes then send ``GET /`` requests over
+keep-alive connections for a fixed time. No master needs to be running since
+the index page makes no Salt call.
+
+Usage::
+
+    python tests/bench/bench_workers.py [-w 1,2,4] [-c 8] [-t 5]
+
+The numbers depend on the number of cores; a worker count above it will not
+help.
+'''
+# Import python libs
+import httplib
+import multiprocessing
+import optparse
+import os
+import shutil
+import signal
+import time
+
+# Import salt-api libs
+import saltapi.config
+import saltapi.netutil
+
+from bench_client_pool import temp_config
+
+
+def client(port, seconds, counts):
+    '''
+    Send requests over one connection until ``seconds`` have passed and add
+    the number sent to ``counts``
+    '''
+    conn = httplib.HTTPConnection('127.0.0.1', port)
+    deadline = time.time() + seconds
+    num = 0
+    while time.time() < deadline:
+        conn.request('GET', '/', headers={'Accept': 'application/json'})
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status != 200:
+            raise Exception('Unexpected status {0}'.format(resp.status))
+        num += 1
+    conn.close()
+
+    with counts.get_lock():
+        counts.value += num
+
+
+def wait_for(port, timeout=30):
+    '''
+    Wait until the server answers
+    '''
+    deadline = time.time() + timeout
+    while True:
+        try:
+            conn = httplib.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/', headers={'Accept': 'application/json'})
+            conn.getresponse().read()
+            conn.close()
+            return
+        except Exception:
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.1)
+
+
+def measure(opts, workers, clients, seconds):
+    '''
+    Return the requests per second served by ``workers`` processes
+    '''
+    from saltapi.netapi.rest_cherrypy import app, server
+
+    root, apiopts, conf = app.get_app(opts)
+    sock = saltapi.netutil.bind_socket('127.0.0.1', 0)
+    port = sock.getsockname()[1]
+
+    procs = [multiprocessing.Process(target=server.serve,
+                args=(sock, root, apiopts.get('root_prefix', '/'), conf,
+                    opts))
+            for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    try:
+        wait_for(port)
+
+        counts = multiprocessing.Value('i', 0)
+        loaders = [multiprocessing.Process(target=client,
+                    args=(port, seconds, counts))
+                for _ in range(clients)]
+        start = time.time()
+        for loader in loaders:
+            loader.start()
+        for loader in loaders:
+            loader.join()
+        elapsed = time.time() - start
+    finally:
+        for proc in procs:
+            os.kill(proc.pid, signal.SIGTERM)
+        for proc in procs:
+            proc.join()
+        sock.close()
+
+    return counts.value / elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-w', '--workers', default='1,2,4',
+            help='comma-separated worker counts to measure')
+    parser.add_option('-c', '--clients', type='int', default=8,
+            help='client processes sending requests')
+    parser.add_option('-t', '--time', type='float', default=5,
+            help='seconds to send requests for per worker count')
+    options, _ = parser.parse_args()
+
+    root, conf_file = temp_config()
+    with open(conf_file, 'a') as fp_:
+        fp_.write('rest_cherrypy:\n  port: 0\n  disable_ssl: True\n')
+
+    try:
+        opts = saltapi.config.api_config(conf_file)
+
+        print '{0:>8} {1:>12} {2:>9}'.format('workers', 'requests/s',
+                'speedup')
+        base = None
+        for workers in [int(i) for i in options.workers.split(',')]:
+            rate = measure(opts, workers, options.clients, options.time)
+            base = base or rate
+            print '{0:>8} {1:>12.0f} {2:>8.1f}x'.format(workers, rate,
+                    rate / base)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+'''
+Tests for saltapi.acl
+'''
+# Import python libs
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# Import salt libs
+import salt.auth
+import salt.config
+import salt.payload
+from salt.exceptions import EauthAuthenticationError
+
+# Import salt-api libs
+import saltapi.acl
+
+
+class PermissionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.perms = saltapi.acl.Permissions([
+            'test.*',
+            {'web*': ['pkg.list_pkgs', 'service.*']},
+            {'db1': 'mysql.query'},
+            '@wheel',
+            {'@jobs': ['lookup_jid', 'list_.*']},
+            '@manage',
+            '[invalid',
+        ])
+
+    def test_funs(self):
+        self.assertTrue(self.perms.may_allow_local('test.ping'))
+        self.assertTrue(self.perms.allows_targets('test.ping', ['any']))
+        self.assertFalse(self.perms.may_allow_local('cmd.run'))
+
+    def test_regex_anchored_at_start(self):
+        self.assertFalse(self.perms.may_allow_local('mytest.ping'))
+        self.assertFalse(self.perms.may_allow_local('[invalid'))
+
+    def test_compound(self):
+        self.assertTrue(self.perms.may_allow_local(['cmd.run', 'test.ping']))
+        self.assertFalse(self.perms.may_allow_local(['cmd.run', 'cp.get']))
+
+    def test_scoped(self):
+        self.assertTrue(self.perms.may_allow_local('service.restart'))
+        self.assertTrue(self.perms.allows_targets('service.restart',
+            ['web1', 'web2']))
+        self.assertFalse(self.perms.allows_targets('service.restart',
+            ['web1', 'db1']))
+        self.assertTrue(self.perms.allows_targets('mysql.query', ['db1']))
+        self.assertFalse(self.perms.allows_targets('mysql.query', ['db2']))
+        self.assertFalse(self.perms.allows_targets('mysql.query', ['web1']))
+
+    def test_specials(self):
+        self.assertTrue(self.perms.allows_wheel('key.list_all'))
+        self.assertTrue(self.perms.allows_runner('manage.up'))
+        self.assertFalse(self.perms.allows_runner('cache.grains'))
+        self.assertFalse(self.perms.allows_runner('manage'))
+
+    def test_special_funs(self):
+        self.assertTrue(self.perms.allows_runner('jobs.lookup_jid'))
+        self.assertTrue(self.perms.allows_runner('jobs.list_jobs'))
+        self.assertFalse(self.perms.allows_runner('jobs.active'))
+
+    def test_runner_kind(self):
+        perms = saltapi.acl.Permissions(['@runner'])
+        self.assertTrue(perms.allows_runner('cache.grains'))
+        self.assertFalse(perms.allows_wheel('key.list_all'))
+        self.assertFalse(perms.may_allow_local('test.ping'))
+
+
+class CheckTestCase(unittest.TestCase):
+    def setUp(self):
+        self.opts = {'external_auth': {'pam': {
+            'fred': ['test.*', {'@jobs': ['lookup_jid']}],
+        }}}
+        self.low = {'eauth': 'pam', 'username': 'fred', 'password': 'x'}
+
+    def check(self, **kwargs):
+        saltapi.acl.check(self.opts, dict(self.low, **kwargs))
+
+    def test_allowed(self):
+        self.check(client='local', tgt='*', fun='test.ping')
+        self.check(client='local_async', tgt='*', fun=['test.ping'])
+        self.check(client='runner', fun='jobs.lookup_jid')
+
+    def test_denied(self):
+        self.assertRaises(EauthAuthenticationError, self.check,
+                client='local', tgt='*', fun='cmd.run')
+        self.assertRaises(EauthAuthenticationError, self.check,
+                client='runner', fun='jobs.active')
+        self.assertRaises(EauthAuthenticationError, self.check,
+                client='wheel', fun='key.list_all')
+
+    def test_unknown_user(self):
+        self.low['username'] = 'barney'
+        self.assertRaises(EauthAuthenticationError, self.check,
+                client='local', tgt='*', fun='test.ping')
+
+    def test_invalid_fun_denied(self):
+        for fun in ({'$ref': '0.fun'}, {'name': 'test.ping'}, 1, None,
+                [{'$ref': '0'}]):
+            self.assertRaises(EauthAuthenticationError, self.check,
+                    client='local', tgt='*', fun=fun)
+        self.assertRaises(EauthAuthenticationError, self.check,
+                client='runner', fun=['jobs.lookup_jid'])
+
+    def test_unknown_client_denied(self):
+        for client in ('run_many', '_dispatch', None, {'$ref': '0'}):
+            self.assertRaises(EauthAuthenticationError, self.check,
+                    client=client, fun='test.ping')
+
+    def test_unresolved(self):
+        # Only let through for a caller that checks again once resolved
+        low = dict(self.low, client='runner', fun={'$ref': '0.fun'})
+        saltapi.acl.check(self.opts, low, resolved=False)
+        self.assertRaises(EauthAuthenticationError, saltapi.acl.check,
+                self.opts, low)
+
+        low['fun'] = {'name': 'manage.up'}
+        self.assertRaises(EauthAuthenticationError, saltapi.acl.check,
+                self.opts, low, resolved=False)
+
+
+class GroupsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = salt.config.master_config(
+                os.path.join(self.tmp, 'master'))
+        self.opts.update(cachedir=self.tmp, token_dir=self.tmp,
+                external_auth={'auto': {
+                    'fred': ['test.*'],
+                    'admins%': ['cmd.*', '@runner'],
+                    'web%': [{'web*': ['pkg.*']}],
+                }})
+
+        self.get_groups = salt.auth.LoadAuth.get_groups
+        salt.auth.LoadAuth.get_groups = lambda self, load: {
+            'fred': ['admins', 'users'],
+            'wilma': ['web'],
+        }.get(load['username'], [])
+
+    def tearDown(self):
+        salt.auth.LoadAuth.get_groups = self.get_groups
+        shutil.rmtree(self.tmp)
+
+    def check(self, name, **kwargs):
+        low = dict(kwargs, eauth='auto', username=name, password='x')
+        saltapi.acl.check(self.opts, low)
+
+    def test_merged(self):
+        self.check('fred', client='local', tgt='*', fun='test.ping')
+        self.check('fred', client='local', tgt='*', fun='cmd.run')
+        self.check('fred', client='runner', fun='jobs.active')
+        self.assertRaises(EauthAuthenticationError, self.check, 'fred',
+                client='wheel', fun='key.list_all')
+
+    def test_group_only(self):
+        self.check('wilma', client='local', tgt='web1', fun='pkg.install')
+        self.assertRaises(EauthAuthenticationError, self.check, 'wilma',
+                client='local', tgt='*', fun='test.ping')
+
+    def test_token(self):
+        serial = salt.payload.Serial(self.opts)
+        with open(os.path.join(self.tmp, 'abc123'), 'wb') as fp_:
+            fp_.write(serial.dumps({'name': 'wilma', 'eauth': 'auto',
+                'expire': time.time() + 60}))
+
+        perms = saltapi.acl.get_permissions(self.opts, {'token': 'abc123'})
+        self.assertTrue(perms.allows_targets('pkg.install', ['web1']))
+
+    def test_catchall_not_merged(self):
+        self.opts['external_auth']['auto']['*'] = ['.*']
+        self.assertRaises(EauthAuthenticationError, self.check, 'wilma',
+                client='local', tgt='*', fun='test.ping')
+        self.check('barney', client='local', tgt='*', fun='test.ping')
+
+    def test_unknown_user(self):
+        self.assertRaises(EauthAuthenticationError, self.check, 'barney',
+                client='local', tgt='*', fun='test.ping')
+
+    def test_in_db(self):
+        # Only the master can look up ^ entries so the call is let through
+        self.opts['external_auth']['auto']['^model'] = {}
+        self.check('barney', client='local', tgt='*', fun='test.ping')
+        self.assertRaises(EauthAuthenticationError, self.check, 'fred',
+                client='wheel', fun='key.list_all')
+
+
+class GetUserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = salt.config.master_config(
+                os.path.join(self.tmp, 'master'))
+        self.opts.update(cachedir=self.tmp, token_dir=self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _token(self, name, expire):
+        serial = salt.payload.Serial(self.opts)
+        with open(os.path.join(self.tmp, 'abc123'), 'wb') as fp_:
+            fp_.write(serial.dumps({'name': name, 'eauth': 'auto',
+                'expire': expire}))
+        return 'abc123'
+
+    def test_token(self):
+        token = self._token('fred', time.time() + 60)
+        low = {'token': token, 'username': 'root'}
+        self.assertEqual(saltapi.acl.get_user(self.opts, low), 'fred')
+
+    def test_expired_token(self):
+        token = self._token('fred', time.time() - 1)
+        self.assertRaises(EauthAuthenticationError, saltapi.acl.get_user,
+                self.opts, {'token': token})
+
+    def test_unknown_token(self):
+        self.assertRaises(EauthAuthenticationError, saltapi.acl.get_user,
+                self.opts, {'token': 'nope', 'username': 'root'})
+
+    def test_eauth(self):
+        low = {'eauth': 'auto', 'username': 'fred', 'password': 'x'}
+        self.assertEqual(saltapi.acl.get_user(self.opts, low), 'fred')
+
+    def test_no_credentials(self):
+        self.assertRaises(EauthAuthenticationError, saltapi.acl.get_user,
+                self.opts, {'username': 'root'})
+
+
+if __name__ == '__main__':
+    unittest.main()
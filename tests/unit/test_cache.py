@@ -0,0 +1,79 @@
+'''
+Tests for saltapi.cache
+'''
+# Import python libs
+import unittest
+
+# Import salt-api libs
+import saltapi.cache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = saltapi.cache.ResultCache({}, {
+            'functions': {'grains.items': 300, 'pkg.list_pkgs': 600},
+            'invalidate': {'pkg.list_pkgs': ['cmd.run']},
+        })
+        self.ret = {'web1': {'os': 'Debian'}, 'web2': {'os': 'Debian'}}
+
+    def test_get_set(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.assertEqual(self.cache.get('key'), self.ret)
+        self.assertIsNone(self.cache.get('other'))
+
+    def test_returns_copy(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.ret['web1']['os'] = 'changed'
+        first = self.cache.get('key')
+        self.assertEqual(first['web1']['os'], 'Debian')
+        first['web1']['os'] = 'changed'
+        self.assertEqual(self.cache.get('key')['web1']['os'], 'Debian')
+
+    def test_same_module_invalidates(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.cache.handle_event('salt/job/1/ret/web1',
+                {'id': 'web1', 'fun': 'grains.setval', 'return': True})
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_other_minion_kept(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.cache.invalidate('db1', 'grains.setval')
+        self.assertEqual(self.cache.get('key'), self.ret)
+
+    def test_read_only_kept(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.cache.invalidate('web1', 'grains.get')
+        self.cache.invalidate('web1', 'grains.item')
+        self.cache.invalidate('web1', 'test.ping')
+        self.assertEqual(self.cache.get('key'), self.ret)
+
+    def test_extra_invalidators(self):
+        self.cache.set('key', 'pkg.list_pkgs', self.ret)
+        self.cache.invalidate('web1', 'cmd.run')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_key_event_clears(self):
+        self.cache.set('key', 'grains.items', self.ret)
+        self.cache.handle_event('salt/key', {'act': 'accept', 'id': 'web3'})
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_stale_generation_not_stored(self):
+        generation = self.cache.generation
+        self.cache.invalidate('web1', 'saltutil.refresh_grains')
+        self.cache.set('key', 'grains.items', self.ret, generation)
+        self.assertIsNone(self.cache.get('key'))
+
+        self.cache.set('key', 'grains.items', self.ret,
+                self.cache.generation)
+        self.assertEqual(self.cache.get('key'), self.ret)
+
+    def test_max_entries(self):
+        self.cache.max_entries = 2
+        for num in range(3):
+            self.cache.set(num, 'grains.items', self.ret)
+        self.assertIsNone(self.cache.get(0))
+        self.assertEqual(self.cache.get(2), self.ret)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+'''
+Tests for saltapi.coalesce
+'''
+# Import python libs
+import threading
+import time
+import unittest
+
+# Import salt-api libs
+import saltapi.coalesce
+
+
+class RequestKeyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.opts = {'conf_file': '/etc/salt/master'}
+        self.low = {'client': 'local', 'tgt': '*', 'fun': 'test.ping',
+                'token': 'abc123'}
+
+    def key(self, low):
+        return saltapi.coalesce.request_key(low, self.opts)
+
+    def test_defaults(self):
+        low = dict(self.low, expr_form='glob', arg=[], kwarg={})
+        self.assertEqual(self.key(self.low), self.key(low))
+
+    def test_list_target_order(self):
+        low1 = dict(self.low, expr_form='list', tgt=['web1', 'web2'])
+        low2 = dict(self.low, expr_form='list', tgt=['web2', 'web1'])
+        self.assertEqual(self.key(low1), self.key(low2))
+
+    def test_different_job(self):
+        low = dict(self.low, fun='grains.items')
+        self.assertNotEqual(self.key(self.low), self.key(low))
+
+    def test_different_auth(self):
+        low = dict(self.low, token='def456')
+        self.assertNotEqual(self.key(self.low), self.key(low))
+
+        low1 = {'client': 'local', 'tgt': '*', 'fun': 'test.ping',
+                'eauth': 'pam', 'username': 'fred', 'password': 'x'}
+        low2 = dict(low1, username='barney')
+        self.assertNotEqual(self.key(low1), self.key(low2))
+
+    def test_different_master(self):
+        key = saltapi.coalesce.request_key(self.low,
+                {'conf_file': '/etc/salt/master2'})
+        self.assertNotEqual(self.key(self.low), key)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.flight = saltapi.coalesce.SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def _start(self, num, fun):
+        '''
+        Start ``num`` threads calling ``fun`` under one key; return the
+        threads and the list their outcomes are appended to
+        '''
+        outcomes = []
+
+        def run():
+            try:
+                outcomes.append(('ret', self.flight.do('key', fun)))
+            except Exception as exc:
+                outcomes.append(('error', exc))
+
+        threads = [threading.Thread(target=run) for _ in range(num)]
+        for thread in threads:
+            thread.start()
+
+        # Let every thread reach the call before the leader finishes it
+        while len(self.calls) < 1 or len(self.flight._calls) < 1:
+            time.sleep(0.001)
+        time.sleep(0.05)
+
+        return threads, outcomes
+
+    def test_concurrent_calls_run_once(self):
+        def fun():
+            self.calls.append(1)
+            self.release.wait()
+            return {'web1': True}
+
+        threads, outcomes = self._start(5, fun)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(outcomes, [('ret', {'web1': True})] * 5)
+        self.assertEqual(self.flight._calls, {})
+
+    def test_exception_passed_to_waiters(self):
+        error = ValueError('boom')
+
+        def fun():
+            self.calls.append(1)
+            self.release.wait()
+            raise error
+
+        threads, outcomes = self._start(5, fun)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(outcomes, [('error', error)] * 5)
+
+    def test_sequential_calls_run_again(self):
+        def fun():
+            self.calls.append(1)
+            return len(self.calls)
+
+        self.assertEqual(self.flight.do('key', fun), 1)
+        self.assertEqual(self.flight.do('key', fun), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
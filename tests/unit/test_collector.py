@@ -0,0 +1,83 @@
+'''
+Tests for saltapi.collector
+'''
+# Import python libs
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# Import salt libs
+import salt.utils.event
+
+# Import salt-api libs
+import saltapi.collector
+
+
+def _ret(jid, minion):
+    return {'jid': jid, 'id': minion, 'return': True}
+
+
+class EventCollectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collector = saltapi.collector.EventCollector({})
+        self.max_returns = saltapi.collector.EARLY_MAX_RETURNS
+
+    def tearDown(self):
+        saltapi.collector.EARLY_MAX_RETURNS = self.max_returns
+
+    def test_early_returns_kept(self):
+        self.collector._route('salt/job/1/ret/web1', _ret('1', 'web1'))
+        ret = self.collector.wait('1', ['web1'], 0)
+        self.assertEqual(ret, {'web1': True})
+        self.assertEqual(self.collector._early_returns, 0)
+
+    def test_early_returns_capped(self):
+        saltapi.collector.EARLY_MAX_RETURNS = 3
+        for minion in ('web1', 'web2'):
+            self.collector._route_return(_ret('1', minion))
+        for minion in ('db1', 'db2'):
+            self.collector._route_return(_ret('2', minion))
+
+        # The oldest job is dropped once the total goes over the cap
+        self.assertEqual(list(self.collector._early), ['2'])
+        self.assertEqual(self.collector._early_returns, 2)
+        self.assertEqual(self.collector.wait('1', ['web1'], 0), {})
+
+    def test_timeout_returns_partial(self):
+        self.collector._route_return(_ret('1', 'web1'))
+        ret = self.collector.wait('1', ['web1', 'web2'], 0.01)
+        self.assertEqual(ret, {'web1': True})
+
+
+class EventBusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmp}
+
+        self.publisher = salt.utils.event.EventPublisher(self.opts)
+        self.publisher.start()
+        pub_sock = os.path.join(self.tmp, 'master_event_pub.ipc')
+        while not os.path.exists(pub_sock):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.publisher.terminate()
+        self.publisher.join()
+        shutil.rmtree(self.tmp)
+
+    def test_return_right_after_start(self):
+        # Connect the sending side first so the return goes out at once
+        event = salt.utils.event.get_event('master', opts=self.opts)
+        event.fire_event({}, 'salt/test/connect')
+
+        collector = saltapi.collector.EventCollector(self.opts)
+        collector.start()
+        event.fire_event(_ret('1', 'web1'), 'salt/job/1/ret/web1')
+
+        self.assertEqual(collector.wait('1', ['web1'], 5), {'web1': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
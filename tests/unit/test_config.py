@@ -0,0 +1,132 @@
+'''
+Tests for saltapi.config
+'''
+# Import python libs
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import salt-api libs
+import saltapi.config
+import saltapi.version
+
+
+class GetConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.conf_file = os.path.join(self.tmp, 'master')
+        with open(self.conf_file, 'w') as fp_:
+            fp_.write('cachedir: {0}\n'.format(self.tmp))
+
+        self.snapshot_dir = saltapi.config.SNAPSHOT_DIR
+        saltapi.config.SNAPSHOT_DIR = os.path.join(self.tmp, 'api_config')
+
+        self.parser = saltapi.config.PARSERS['master']
+        self.parsed = []
+
+        def parse(path):
+            self.parsed.append(path)
+            return self.parser(path)
+        saltapi.config.PARSERS['master'] = parse
+
+    def tearDown(self):
+        saltapi.config.SNAPSHOT_DIR = self.snapshot_dir
+        saltapi.config.PARSERS['master'] = self.parser
+        saltapi.config._snapshots.clear()
+        shutil.rmtree(self.tmp)
+
+    def get(self):
+        '''
+        Get the config as a new process would, from the snapshot on disk
+        '''
+        saltapi.config._snapshots.clear()
+        return saltapi.config.api_config(self.conf_file)
+
+    def snapshot_path(self):
+        return saltapi.config._snapshot_path('master', self.conf_file)
+
+    def touch(self, path):
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+    def test_shared_in_process(self):
+        opts = saltapi.config.api_config(self.conf_file)
+        self.assertIs(saltapi.config.api_config(self.conf_file), opts)
+        self.assertEqual(len(self.parsed), 1)
+        self.assertEqual(opts['cachedir'], self.tmp)
+
+    def test_snapshot_reused(self):
+        opts = self.get()
+        self.assertTrue(os.path.isfile(self.snapshot_path()))
+        self.assertEqual(self.get(), opts)
+        self.assertEqual(len(self.parsed), 1)
+
+    def test_changed_mtime(self):
+        self.get()
+        self.touch(self.conf_file)
+        self.get()
+        self.assertEqual(len(self.parsed), 2)
+
+        # The new snapshot is used from then on
+        self.get()
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_changed_mtime_in_process(self):
+        saltapi.config.api_config(self.conf_file)
+        self.touch(self.conf_file)
+        saltapi.config.api_config(self.conf_file)
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_changed_include(self):
+        include_dir = os.path.join(self.tmp, 'master.d')
+        os.mkdir(include_dir)
+        with open(self.conf_file, 'a') as fp_:
+            fp_.write('default_include: master.d/*.conf\n')
+
+        self.get()
+        with open(os.path.join(include_dir, 'api.conf'), 'w') as fp_:
+            fp_.write('api_single_flight: True\n')
+        self.touch(include_dir)
+
+        self.assertTrue(self.get()['api_single_flight'])
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_writable_by_others(self):
+        self.get()
+        os.chmod(self.snapshot_path(), 0666)
+        self.get()
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_owned_by_other_user(self):
+        self.get()
+
+        getuid = os.getuid
+        os.getuid = lambda: getuid() + 1
+        try:
+            self.get()
+        finally:
+            os.getuid = getuid
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_other_version(self):
+        self.get()
+
+        version = saltapi.version.__version__
+        saltapi.version.__version__ = version + '.1'
+        try:
+            self.get()
+        finally:
+            saltapi.version.__version__ = version
+        self.assertEqual(len(self.parsed), 2)
+
+    def test_invalid_snapshot(self):
+        self.get()
+        with open(self.snapshot_path(), 'wb') as fp_:
+            fp_.write('not a pickle')
+        self.assertEqual(self.get()['cachedir'], self.tmp)
+        self.assertEqual(len(self.parsed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
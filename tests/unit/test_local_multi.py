@@ -0,0 +1,124 @@
+'''
+Tests for saltapi.APIClient.local_multi
+'''
+# Import python libs
+import unittest
+
+# Import salt libs
+from salt.exceptions import EauthAuthenticationError, SaltClientError
+
+# Import salt-api libs
+import saltapi
+import saltapi.pool
+
+MASTERS = ['/etc/salt/master1', '/etc/salt/master2']
+
+
+class FakeLocalClient(object):
+    '''
+    Return the canned returns of one master and record the calls made
+    '''
+    def __init__(self, returns, calls):
+        self.returns = returns
+        self.calls = calls
+
+    def cmd(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        if isinstance(self.returns, Exception):
+            raise self.returns
+        return self.returns
+
+
+class FakePool(saltapi.pool.ClientPool):
+    def __init__(self, opts, returns):
+        super(FakePool, self).__init__(opts)
+        self.returns = returns
+        self.calls = []
+
+    def _create(self, kind):
+        return saltapi.pool._Pooled(FakeLocalClient(self.returns, self.calls),
+                self._config_mtime())
+
+
+class LocalMultiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.opts = {'conf_file': MASTERS[0], 'api_multi_masters': MASTERS}
+        self.creds = {'eauth': 'pam', 'username': 'fred', 'password': 'x'}
+
+    def tearDown(self):
+        for conf_file in MASTERS:
+            saltapi.pool._pools.pop(conf_file, None)
+
+    def _pools(self, *returns):
+        pools = []
+        for conf_file, ret in zip(MASTERS, returns):
+            pool = FakePool({'conf_file': conf_file}, ret)
+            saltapi.pool._pools[conf_file] = pool
+            pools.append(pool)
+        return pools
+
+    def test_fan_out_and_merge(self):
+        pools = self._pools({'web1': 'master1', 'web2': 'master1'},
+                {'web2': 'master2', 'db1': 'master2'})
+
+        ret = saltapi.APIClient(self.opts).local_multi('*', 'test.ping',
+                token='abc123', **self.creds)
+
+        for pool in pools:
+            self.assertEqual(len(pool.calls), 1)
+            args, kwargs = pool.calls[0]
+            self.assertEqual(args, ('*', 'test.ping'))
+            self.assertNotIn('token', kwargs)
+            self.assertEqual(kwargs['username'], 'fred')
+
+        # A minion on both masters keeps the return from the first one
+        self.assertEqual(ret['minions'], {'web1': 'master1',
+            'web2': 'master1', 'db1': 'master2'})
+        self.assertEqual(ret['masters'][MASTERS[0]]['minions'],
+                ['web1', 'web2'])
+        self.assertEqual(ret['masters'][MASTERS[1]]['minions'],
+                ['db1', 'web2'])
+
+    def test_one_master_fails(self):
+        self._pools({'web1': True}, SaltClientError('down'))
+
+        ret = saltapi.APIClient(self.opts).local_multi('*', 'test.ping',
+                **self.creds)
+
+        self.assertEqual(ret['minions'], {'web1': True})
+        self.assertEqual(ret['masters'][MASTERS[1]]['error'],
+                'SaltClientError: down')
+        self.assertNotIn('minions', ret['masters'][MASTERS[1]])
+
+    def test_every_master_fails(self):
+        self._pools(SaltClientError('down'), SaltClientError('down'))
+
+        self.assertRaises(SaltClientError,
+                saltapi.APIClient(self.opts).local_multi, '*', 'test.ping',
+                **self.creds)
+
+    def test_token_refused(self):
+        pools = self._pools({'web1': True}, {'db1': True})
+
+        self.assertRaises(EauthAuthenticationError,
+                saltapi.APIClient(self.opts).local_multi, '*', 'test.ping',
+                token='abc123')
+        self.assertRaises(EauthAuthenticationError,
+                saltapi.APIClient(self.opts).local_multi, '*', 'test.ping',
+                eauth='pam', username='fred')
+
+        self.assertEqual([len(pool.calls) for pool in pools], [0, 0])
+
+    def test_single_master_keeps_token(self):
+        opts = {'conf_file': MASTERS[0]}
+        pool = self._pools({'web1': True})[0]
+
+        ret = saltapi.APIClient(opts).local_multi('*', 'test.ping',
+                token='abc123')
+
+        self.assertEqual(ret['minions'], {'web1': True})
+        self.assertEqual(pool.calls[0][1], {'token': 'abc123'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+'''
+Tests for saltapi.pipeline
+'''
+# Import python libs
+import time
+import unittest
+
+# Import salt libs
+from salt.exceptions import EauthAuthenticationError, SaltInvocationError
+
+# Import salt-api libs
+import saltapi
+import saltapi.acl
+import saltapi.pipeline
+
+OPTS = {'external_auth': {'pam': {
+    'fred': ['test.*', 'grains.*', {'@jobs': ['lookup_jid']}],
+}}}
+CREDS = {'eauth': 'pam', 'username': 'fred', 'password': 'x'}
+
+
+class ResolveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.results = [{'web1': True, 'web2': False, 'db1': 'x'},
+                {'jid': '20140101', 'minions': ['web1']}]
+
+    def test_ref(self):
+        chunk = {'fun': 'jobs.lookup_jid', 'jid': {'$ref': '1.jid'},
+                'arg': [{'$ref': [1, 'minions', 0]}]}
+        ret = saltapi.pipeline.resolve(chunk, self.results)
+        self.assertEqual(ret['jid'], '20140101')
+        self.assertEqual(ret['arg'], ['web1'])
+        self.assertEqual(chunk['jid'], {'$ref': '1.jid'})
+
+    def test_tgt_from(self):
+        ret = saltapi.pipeline.resolve({'tgt_from': 0}, self.results)
+        self.assertEqual(ret, {'tgt': ['db1', 'web1'], 'expr_form': 'list'})
+
+        ret = saltapi.pipeline.resolve({'tgt_from': {'chunk': 0,
+            'match': 'x'}}, self.results)
+        self.assertEqual(ret['tgt'], ['db1'])
+
+    def test_invalid(self):
+        for ref in ('2', 'a', '1.nope', [1, 'minions', 5]):
+            self.assertRaises(SaltInvocationError, saltapi.pipeline.resolve,
+                    {'jid': {'$ref': ref}}, self.results)
+
+
+class FakeAPIClient(saltapi.APIClient):
+    def local(self, *args, **kwargs):
+        return {'web1': 'jobs.active'}
+
+    def runner(self, fun, **kwargs):
+        return fun
+
+
+class RunManyTestCase(unittest.TestCase):
+    def test_ref_fun_checked(self):
+        client = FakeAPIClient(OPTS)
+        lowstate = [dict(CREDS, client='local', tgt='*', fun='test.ping'),
+                dict(CREDS, client='runner', fun={'$ref': '0.web1'})]
+        self.assertRaises(EauthAuthenticationError, client.run_many,
+                lowstate)
+
+        lowstate[1]['fun'] = 'jobs.lookup_jid'
+        self.assertEqual(client.run_many(lowstate),
+                [{'web1': 'jobs.active'}, 'jobs.lookup_jid'])
+
+
+try:
+    import saltapi.netapi.rest_tornado.saltnado as saltnado
+    import tornado.web
+except ImportError:
+    saltnado = None
+
+
+class FakeRequest(object):
+    def __init__(self, token):
+        self.headers = {'X-Auth-Token': token}
+
+
+class FakeApplication(object):
+    opts = OPTS
+
+
+@unittest.skipIf(saltnado is None, 'tornado is not installed')
+class SaltnadoResolveTestCase(unittest.TestCase):
+    def setUp(self):
+        saltapi.acl.remember('abc123', OPTS['external_auth']['pam']['fred'],
+                time.time() + 60)
+
+        self.handler = saltnado.SaltAPIHandler.__new__(
+                saltnado.SaltAPIHandler)
+        self.handler.application = FakeApplication()
+        self.handler.request = FakeRequest('abc123')
+        self.handler.client = 'runner'
+
+    def tearDown(self):
+        saltapi.acl._tokens.pop('abc123', None)
+
+    def test_ref_fun_refused(self):
+        chunk = {'fun': {'$ref': '0.web1'}}
+
+        # Let through before it is resolved...
+        saltapi.acl.check(OPTS, dict(chunk, client='runner', token='abc123'),
+                resolved=False)
+
+        # ...but refused once it names a runner outside the permissions
+        with self.assertRaises(tornado.web.HTTPError) as ctx:
+            self.handler._resolve(chunk, [{'web1': 'jobs.active'}])
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_ref_fun_allowed(self):
+        chunk = {'fun': {'$ref': '0.web1'}}
+        ret = self.handler._resolve(chunk, [{'web1': 'jobs.lookup_jid'}])
+        self.assertEqual(ret, {'fun': 'jobs.lookup_jid'})
+
+    def test_invalid_ref(self):
+        with self.assertRaises(tornado.web.HTTPError) as ctx:
+            self.handler._resolve({'fun': {'$ref': '1'}}, [])
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+Tests for saltapi.pool
+'''
+# Import python libs
+import os
+import tempfile
+import unittest
+
+# Import salt libs
+from salt.exceptions import EauthAuthenticationError
+
+# Import salt-api libs
+import saltapi
+import saltapi.pool
+
+
+class FakeSocket(object):
+    closed = False
+
+
+class FakeEvent(object):
+    def __init__(self):
+        self.sub = FakeSocket()
+        self.destroyed = False
+
+    def destroy(self):
+        self.destroyed = True
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.event = FakeEvent()
+
+    def cmd_batch(self, *args, **kwargs):
+        for num in range(3):
+            yield {'minion{0}'.format(num): True}
+
+
+class FakePool(saltapi.pool.ClientPool):
+    def _create(self, kind):
+        return saltapi.pool._Pooled(FakeClient(), self._config_mtime())
+
+
+class ClientPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        fd_, self.conf_file = tempfile.mkstemp()
+        os.close(fd_)
+        self.opts = {'conf_file': self.conf_file, 'api_client_pool_size': 1}
+        self.pool = FakePool(self.opts)
+
+    def tearDown(self):
+        os.remove(self.conf_file)
+        saltapi.pool._pools.pop(self.conf_file, None)
+
+    def test_reuse(self):
+        with self.pool.client('local') as first:
+            pass
+        with self.pool.client('local') as second:
+            pass
+        self.assertIs(first, second)
+        self.assertFalse(first.event.destroyed)
+
+    def test_extra_clients_closed(self):
+        with self.pool.client('local') as first:
+            with self.pool.client('local') as second:
+                pass
+            self.assertFalse(second.event.destroyed)
+        self.assertTrue(first.event.destroyed)
+
+    def test_error_closes(self):
+        try:
+            with self.pool.client('local') as client:
+                raise IOError('lost the master')
+        except IOError:
+            pass
+        self.assertTrue(client.event.destroyed)
+        self.assertEqual(self.pool._idle['local'], [])
+
+    def test_request_error_keeps(self):
+        try:
+            with self.pool.client('local') as client:
+                raise EauthAuthenticationError('bad token')
+        except EauthAuthenticationError:
+            pass
+        self.assertFalse(client.event.destroyed)
+        self.assertEqual(len(self.pool._idle['local']), 1)
+
+    def test_config_change_discards(self):
+        with self.pool.client('local') as first:
+            pass
+        mtime = os.stat(self.conf_file).st_mtime
+        os.utime(self.conf_file, (mtime + 10, mtime + 10))
+
+        with self.pool.client('local') as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.event.destroyed)
+
+    def test_closed_event_discards(self):
+        with self.pool.client('local') as first:
+            pass
+        first.event.sub.closed = True
+
+        with self.pool.client('local') as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.event.destroyed)
+
+    def test_clear_closes(self):
+        with self.pool.client('local') as client:
+            pass
+        self.pool.clear()
+        self.assertTrue(client.event.destroyed)
+
+    def test_local_batch_holds_client(self):
+        saltapi.pool._pools[self.conf_file] = self.pool
+        client = saltapi.APIClient(self.opts)
+
+        batches = client.local_batch('*', 'test.ping', batch='1')
+        self.assertEqual(next(batches), {'minion0': True})
+        # Still iterating, so the client is not back in the pool
+        self.assertEqual(self.pool._idle['local'], [])
+
+        self.assertEqual(len(list(batches)), 2)
+        self.assertEqual(len(self.pool._idle['local']), 1)
+
+    def test_closed_generator_returns_client(self):
+        saltapi.pool._pools[self.conf_file] = self.pool
+        client = saltapi.APIClient(self.opts)
+
+        batches = client.local_batch('*', 'test.ping', batch='1')
+        next(batches)
+        batches.close()
+        self.assertEqual(len(self.pool._idle['local']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
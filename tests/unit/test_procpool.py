@@ -0,0 +1,86 @@
+'''
+Tests for saltapi.procpool
+'''
+# Import python libs
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import salt libs
+import salt.config
+
+# Import salt-api libs
+import saltapi.procpool
+import saltapi.scheduler
+
+
+def _call(clients, kind, fun, kwargs):
+    return [kind, fun, kwargs]
+
+
+class ProcessPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        # The workers are forked with the fake in place
+        self._orig_call = saltapi.procpool._call
+        saltapi.procpool._call = _call
+
+        self.tmp = tempfile.mkdtemp()
+        self.opts = salt.config.master_config(
+                os.path.join(self.tmp, 'master'))
+        self.opts.update(cachedir=self.tmp, sock_dir=self.tmp,
+                pki_dir=self.tmp)
+        self.pool = None
+
+    def tearDown(self):
+        saltapi.procpool._call = self._orig_call
+        if self.pool is not None:
+            self.pool.close()
+        shutil.rmtree(self.tmp)
+
+    def _pool(self, **pool_opts):
+        self.pool = saltapi.procpool.ProcessPool(self.opts, pool_opts)
+        return self.pool
+
+    def test_run(self):
+        pool = self._pool(size=1)
+        ret = pool.run('runner', 'jobs.list_jobs', {'search': 'x'})
+        self.assertEqual(ret, ['runner', 'jobs.list_jobs', {'search': 'x'}])
+
+        # Workers may start processes of their own
+        worker, = pool._workers
+        self.assertFalse(worker.process.daemon)
+
+    def test_replaced_after_max_tasks(self):
+        pool = self._pool(size=1, max_tasks=1)
+        worker, = pool._workers
+        pool.run('runner', 'jobs.list_jobs', {})
+
+        replacement, = pool._workers
+        self.assertIsNot(replacement, worker)
+        worker.process.join(5)
+        self.assertFalse(worker.process.is_alive())
+
+    def test_queue_timeout(self):
+        pool = self._pool(size=1, queue_timeout=0.01)
+        worker = pool._idle.get()
+        try:
+            self.assertRaises(saltapi.scheduler.Overloaded, pool.run,
+                    'runner', 'jobs.list_jobs', {})
+        finally:
+            pool._idle.put(worker)
+
+    def test_close_stops_busy_workers(self):
+        pool = self._pool(size=2)
+        workers = list(pool._workers)
+        # One worker checked out as if a call were running
+        pool._idle.get()
+
+        pool.close()
+        for worker in workers:
+            self.assertFalse(worker.process.is_alive())
+        self.pool = None
+
+
+if __name__ == '__main__':
+    unittest.main()
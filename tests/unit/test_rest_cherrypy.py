@@ -0,0 +1,123 @@
+'''
+Tests for saltapi.netapi.rest_cherrypy.app
+'''
+# Import python libs
+import json
+import threading
+import time
+import unittest
+
+# Import third party libs
+import yaml
+
+try:
+    import saltapi.netapi.rest_cherrypy.app as app
+    import saltapi.netapi.rest_cherrypy.wsgi as wsgi
+except ImportError:
+    app = wsgi = None
+
+# A scalar long enough to be wrapped in YAML
+LONG = ' '.join('word{0}'.format(num) for num in range(40))
+
+
+def responses():
+    '''
+    Return responses with lowstate returns of mixed shapes and key types
+    '''
+    return [
+        {'return': [
+            {'web1': {'os': 'Debian', 'num_cpus': 4}, 'web2': True},
+            {1: 'a', None: 2, 2.5: 'f', 'db1': [1, 2]},
+            {False: {'x': None}, u'caf\xe9': u'na\xefve'},
+            {},
+            'not a dict',
+            [1, 'two', {'three': 3}],
+        ]},
+        {'return': [], 'status': 200},
+        {'return': [{'web1': True}], 404: 'not found'},
+        {'return': [
+            {'web1': {'out': LONG, 'lines': [LONG, {'nested': LONG}]},
+                'web2': LONG},
+            [LONG],
+            LONG,
+        ], 'comment': LONG},
+    ]
+
+
+@unittest.skipIf(app is None, 'CherryPy is not installed')
+class StreamTestCase(unittest.TestCase):
+    def test_json(self):
+        for ret in responses():
+            self.assertEqual(''.join(app.json_stream(ret)), json.dumps(ret))
+
+    def test_json_iterator(self):
+        for ret in responses():
+            expected = json.dumps(ret)
+            ret['return'] = iter(ret['return'])
+            self.assertEqual(''.join(app.json_stream(ret)), expected)
+
+    def test_json_unserializable_key(self):
+        ret = {'return': [{('web1', 'web2'): True}]}
+        self.assertRaises(TypeError, json.dumps, ret)
+        self.assertRaises(TypeError, ''.join, app.json_stream(ret))
+
+    def test_yaml(self):
+        for ret in responses():
+            self.assertEqual(''.join(app.yaml_stream(ret)),
+                    yaml.safe_dump(ret, default_flow_style=False))
+
+    def test_msgpack(self):
+        for ret in responses():
+            self.assertEqual(''.join(app.msgpack_stream(ret)),
+                    app.serial.dumps(ret))
+
+    def test_msgpack_large(self):
+        ret = {'return': [dict(('web{0}'.format(num), num)
+            for num in range(70000))] * 17}
+        self.assertEqual(''.join(app.msgpack_stream(ret)),
+                app.serial.dumps(ret))
+
+
+class FakeCherryPy(object):
+    '''
+    Count the mounts of the WSGI app
+    '''
+    def __init__(self):
+        self.mounts = 0
+        self.tree = self
+        self.config = {}
+
+    def mount(self, root, script_name, conf):
+        time.sleep(0.05)
+        self.mounts += 1
+
+    def __call__(self, environ, start_response):
+        return ['ok']
+
+
+@unittest.skipIf(wsgi is None, 'CherryPy is not installed')
+class WSGITestCase(unittest.TestCase):
+    def setUp(self):
+        self.cherrypy = wsgi.cherrypy
+        wsgi.cherrypy = FakeCherryPy()
+
+    def tearDown(self):
+        wsgi.cherrypy = self.cherrypy
+
+    def test_mounted_once(self):
+        wsgi_app = wsgi.get_application(object(), {}, {})
+        rets = []
+        threads = [threading.Thread(
+            target=lambda: rets.append(wsgi_app({}, None)))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(wsgi.cherrypy.mounts, 1)
+        self.assertEqual(rets, [['ok']] * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+'''
+Tests for saltapi.APIClient.run_many and run_iter
+'''
+# Import python libs
+import threading
+import time
+import unittest
+
+# Import salt-api libs
+import saltapi
+
+
+class FakeAPIClient(saltapi.APIClient):
+    '''
+    Return each chunk's ``fun`` after sleeping ``delay`` seconds and record
+    how many chunks ran at the same time
+    '''
+    def __init__(self, opts):
+        super(FakeAPIClient, self).__init__(opts)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+        self.started = []
+
+    def run(self, low):
+        with self.lock:
+            self.started.append(low['fun'])
+            self.running += 1
+            self.most = max(self.most, self.running)
+        try:
+            time.sleep(low.get('delay', 0))
+            if low.get('fail'):
+                raise ValueError(low['fun'])
+            return low['fun']
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class RunManyTestCase(unittest.TestCase):
+    def test_sequential_by_default(self):
+        client = FakeAPIClient({})
+        lowstate = [{'fun': 'a', 'delay': 0.05}, {'fun': 'b'}, {'fun': 'c'}]
+        self.assertEqual(client.run_many(lowstate), ['a', 'b', 'c'])
+        self.assertEqual(client.most, 1)
+
+    def test_concurrent_keeps_order(self):
+        client = FakeAPIClient({'api_run_many_threads': 2})
+        lowstate = [{'fun': 'a', 'delay': 0.1}, {'fun': 'b', 'delay': 0.1},
+                {'fun': 'c'}]
+        self.assertEqual(client.run_many(lowstate), ['a', 'b', 'c'])
+        self.assertEqual(client.most, 2)
+
+    def test_ordered_waits(self):
+        client = FakeAPIClient({'api_run_many_threads': 4})
+        lowstate = [{'fun': 'a', 'delay': 0.05},
+                {'fun': 'b', 'ordered': True}, {'fun': 'c'}]
+        self.assertEqual(client.run_many(lowstate), ['a', 'b', 'c'])
+        self.assertEqual(client.most, 1)
+
+    def test_error_skips_pending(self):
+        client = FakeAPIClient({'api_run_many_threads': 1})
+        lowstate = [{'fun': 'a'}, {'fun': 'b', 'fail': True}, {'fun': 'c'},
+                {'fun': 'd'}]
+        self.assertRaises(ValueError, client.run_many, lowstate)
+        self.assertEqual(client.started, ['a', 'b'])
+
+    def test_iter_yields_as_chunks_finish(self):
+        client = FakeAPIClient({})
+        lowstate = [{'fun': 'a'}, {'fun': 'b', 'delay': 0.2}]
+        start = time.time()
+        ret = client.run_iter(lowstate)
+
+        self.assertEqual(next(ret), 'a')
+        self.assertLess(time.time() - start, 0.1)
+        self.assertEqual(client.started, ['a'])
+
+        self.assertEqual(list(ret), ['b'])
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_iter_concurrent_keeps_order(self):
+        client = FakeAPIClient({'api_run_many_threads': 2})
+        lowstate = [{'fun': 'a', 'delay': 0.1}, {'fun': 'b', 'delay': 0.3},
+                {'fun': 'c'}]
+        start = time.time()
+        ret = client.run_iter(lowstate)
+
+        # 'a' is yielded once it finishes, without waiting for 'b'
+        self.assertEqual(next(ret), 'a')
+        self.assertLess(time.time() - start, 0.25)
+        self.assertEqual(list(ret), ['b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
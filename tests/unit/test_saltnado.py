@@ -0,0 +1,87 @@
+'''
+Tests for saltapi.netapi.rest_tornado.saltnado
+'''
+# Import python libs
+import unittest
+
+# Import salt libs
+import salt.payload
+
+try:
+    from saltapi.netapi.rest_tornado import event_hub, saltnado
+except ImportError:
+    saltnado = None
+
+
+class FakeStream(object):
+    '''
+    Record the messages written to the event hub
+    '''
+    def __init__(self):
+        self.msgs = []
+
+    def write(self, data):
+        msgs, _ = event_hub.unpack(salt.payload.Serial('msgpack'), data)
+        self.msgs.extend(msgs)
+
+
+@unittest.skipIf(saltnado is None, 'Tornado is not installed')
+class HubEventListenerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.listener = saltnado.HubEventListener({}, {}, '/nonexistent')
+        self.listener.stream = FakeStream()
+        self.listener.connected = True
+        self.request = object()
+        self.tag = 'salt/job/20141016000000000000/ret'
+
+    def event(self, minion):
+        return {'tag': '{0}/{1}'.format(self.tag, minion),
+                'data': {'id': minion}}
+
+    def test_subscribed_while_held(self):
+        self.listener.hold(self.request, self.tag)
+        self.assertEqual(self.listener.stream.msgs, [['sub', self.tag]])
+
+        # Resolving a future does not unsubscribe a held prefix
+        future = self.listener.get_event(self.request, tag=self.tag)
+        self.listener.dispatch(self.event('web1'))
+        self.assertEqual(future.result()['data']['id'], 'web1')
+        self.assertEqual(self.listener.stream.msgs, [['sub', self.tag]])
+
+        self.listener.clean_timeout_futures(self.request)
+        self.assertEqual(self.listener.stream.msgs,
+                [['sub', self.tag], ['unsub', self.tag]])
+
+    def test_returns_kept_until_waited_on(self):
+        self.listener.hold(self.request, self.tag)
+        self.listener.dispatch(self.event('web1'))
+        self.listener.dispatch(self.event('web2'))
+
+        ids = [self.listener.get_event(self.request,
+            tag=self.tag).result()['data']['id'] for _ in range(2)]
+        self.assertEqual(ids, ['web1', 'web2'])
+        self.assertFalse(self.listener.get_event(self.request,
+            tag=self.tag).done())
+
+    def test_released(self):
+        other = object()
+        self.listener.hold(self.request, self.tag)
+        self.listener.hold(other, self.tag)
+        self.listener.dispatch(self.event('web1'))
+
+        # Still held by the other request
+        self.listener.release(self.request)
+        self.assertEqual(self.listener.stream.msgs, [['sub', self.tag]])
+
+        self.listener.release(other)
+        self.assertEqual(self.listener.stream.msgs,
+                [['sub', self.tag], ['unsub', self.tag]])
+        self.assertFalse(self.listener.pending)
+
+    def test_not_held(self):
+        self.listener.dispatch(self.event('web1'))
+        self.assertFalse(self.listener.pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+'''
+Tests for saltapi.scheduler
+'''
+# Import python libs
+import time
+import unittest
+
+# Import salt-api libs
+import saltapi.scheduler
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_burst(self):
+        bucket = saltapi.scheduler.TokenBucket(1, 3)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertGreater(bucket.take(), 0)
+
+    def test_refill(self):
+        bucket = saltapi.scheduler.TokenBucket(10, 2)
+        bucket.take()
+        bucket.take()
+
+        delay = bucket.take()
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 0.1)
+
+        # Half a second at 10 tokens a second refills the bucket to its burst
+        bucket.stamp -= 0.5
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_retry_after(self):
+        scheduler = saltapi.scheduler.Scheduler({'publish_rate': 0.25,
+            'publish_burst': 1})
+        scheduler.acquire('local')
+        scheduler.release('local')
+
+        # The next token is four seconds away
+        with self.assertRaises(saltapi.scheduler.Overloaded) as ctx:
+            scheduler.acquire('local', block=False)
+        self.assertEqual(ctx.exception.retry_after, 4)
+
+    def test_retry_after_concurrency(self):
+        scheduler = saltapi.scheduler.Scheduler({'concurrency': {'runner': 1}})
+        scheduler.acquire('runner')
+
+        with self.assertRaises(saltapi.scheduler.Overloaded) as ctx:
+            scheduler.acquire('runner', block=False)
+        self.assertEqual(ctx.exception.retry_after, 1)
+
+    def test_queue_timeout(self):
+        scheduler = saltapi.scheduler.Scheduler({'concurrency': {'runner': 1},
+            'queue_timeout': 0.05})
+        scheduler.acquire('runner')
+
+        start = time.time()
+        self.assertRaises(saltapi.scheduler.Overloaded, scheduler.acquire,
+                'runner')
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_call_releases(self):
+        scheduler = saltapi.scheduler.Scheduler({'concurrency': {'local': 1}})
+        self.assertEqual(scheduler.call('local_async', lambda: 'jid'), 'jid')
+        self.assertEqual(scheduler.running['local'], 0)
+
+        def fail():
+            raise ValueError()
+        self.assertRaises(ValueError, scheduler.call, 'local', fail)
+        self.assertEqual(scheduler.running['local'], 0)
+
+    def test_iterator_held_until_used_up(self):
+        scheduler = saltapi.scheduler.Scheduler({'concurrency': {'local': 1}})
+
+        def batches():
+            yield {'web1': True}
+            yield {'web2': True}
+
+        ret = scheduler.call('local_batch', batches)
+        self.assertEqual(scheduler.running['local'], 1)
+        self.assertRaises(saltapi.scheduler.Overloaded, scheduler.acquire,
+                'local', False)
+
+        self.assertEqual(list(ret), [{'web1': True}, {'web2': True}])
+        self.assertEqual(scheduler.running['local'], 0)
+
+    def test_iterator_held_until_closed(self):
+        scheduler = saltapi.scheduler.Scheduler({'concurrency': {'local': 1}})
+
+        ret = scheduler.call('local_batch', lambda: iter([1, 2, 3]))
+        self.assertEqual(next(ret), 1)
+        self.assertEqual(scheduler.running['local'], 1)
+
+        ret.close()
+        ret.close()
+        self.assertEqual(scheduler.running['local'], 0)
+        self.assertEqual(list(ret), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
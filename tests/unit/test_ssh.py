@@ -0,0 +1,127 @@
+'''
+Tests for saltapi.APIClient.ssh
+'''
+# Import python libs
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import salt libs
+import salt.client.ssh
+import salt.config
+import salt.utils.thin
+from salt.exceptions import EauthAuthenticationError, SaltClientError
+
+# Import salt-api libs
+import saltapi
+
+ROSTER = '''
+web1: 10.0.0.1
+web2: 10.0.0.2
+db1: 10.0.0.3
+'''
+
+
+class FakeSingle(object):
+    '''
+    Stand in for :py:class:`salt.client.ssh.Single`; instead of connecting
+    to the host it returns what it was asked to run
+    '''
+    def __init__(self, opts, argv, id_, **kwargs):
+        self.id = id_
+        self.argv = argv
+        self.timeout = kwargs.get('timeout')
+
+    def run(self):
+        ret = {'local': {'argv': self.argv, 'timeout': self.timeout}}
+        return json.dumps(ret), '', 0
+
+
+class SSHTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = salt.config.master_config(
+                os.path.join(self.tmp, 'master'))
+
+        roster_file = os.path.join(self.tmp, 'roster')
+        with open(roster_file, 'w') as fp_:
+            fp_.write(ROSTER)
+        # An existing key keeps salt-ssh from generating one
+        ssh_priv = os.path.join(self.tmp, 'salt-ssh.rsa')
+        open(ssh_priv, 'w').close()
+
+        self.opts.update(cachedir=self.tmp, token_dir=self.tmp,
+                sock_dir=self.tmp, pki_dir=self.tmp, roster_file=roster_file,
+                ssh_priv=ssh_priv, file_roots={'base': [self.tmp]},
+                timeout=5, ssh_timeout=60,
+                external_auth={'auto': {'fred': [{'web*': ['test.*']}],
+                    'admin': ['.*']}})
+
+        self.single = salt.client.ssh.Single
+        self.gen_thin = salt.utils.thin.gen_thin
+        salt.client.ssh.Single = FakeSingle
+        salt.utils.thin.gen_thin = lambda cachedir: os.path.join(cachedir,
+                'thin.tgz')
+
+        self.client = saltapi.APIClient(self.opts)
+
+    def tearDown(self):
+        salt.client.ssh.Single = self.single
+        salt.utils.thin.gen_thin = self.gen_thin
+        shutil.rmtree(self.tmp)
+
+    def creds(self, name):
+        return {'eauth': 'auto', 'username': name, 'password': 'x'}
+
+    def test_return(self):
+        ret = self.client.ssh('web*', 'test.echo', arg='hello world',
+                timeout=10, **self.creds('fred'))
+
+        ret = sorted(ret)
+        self.assertEqual(ret, [
+            {'web1': {'argv': ['test.echo', 'hello world'], 'timeout': 15}},
+            {'web2': {'argv': ['test.echo', 'hello world'], 'timeout': 15}},
+        ])
+
+        # The shared opts are not changed by the call
+        self.assertNotIn('argv', self.opts)
+        self.assertEqual(self.opts['ssh_timeout'], 60)
+
+    def test_run(self):
+        low = dict(self.creds('admin'), client='ssh', tgt='db.*',
+                expr_form='pcre', fun='cmd.run', arg=['uptime', 'x'])
+        self.assertEqual(list(self.client.run(low)),
+                [{'db1': {'argv': ['cmd.run', 'uptime', 'x'],
+                    'timeout': 65}}])
+
+    def test_target_not_allowed(self):
+        self.assertRaises(EauthAuthenticationError, self.client.ssh,
+                '*', 'test.ping', **self.creds('fred'))
+
+    def test_regex_target_not_allowed(self):
+        # The regex is matched against the roster, not the permission glob
+        self.assertRaises(EauthAuthenticationError, self.client.ssh,
+                'web.*|db.*', 'test.ping', expr_form='pcre',
+                **self.creds('fred'))
+
+    def test_function_not_allowed(self):
+        self.assertRaises(EauthAuthenticationError, self.client.ssh,
+                'web1', 'cmd.run', **self.creds('fred'))
+
+    def test_no_hosts(self):
+        self.assertRaises(SaltClientError, self.client.ssh, 'mail*',
+                'test.ping', **self.creds('admin'))
+
+    def test_unknown_user(self):
+        self.assertRaises(EauthAuthenticationError, self.client.ssh,
+                'web1', 'test.ping', **self.creds('barney'))
+
+    def test_invalid_token(self):
+        self.assertRaises(EauthAuthenticationError, self.client.ssh,
+                'web1', 'test.ping', token='nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+'''
+Tests for saltapi.utils
+'''
+# Import python libs
+import unittest
+
+# Import salt libs
+import salt.client
+import salt.runner
+import salt.utils
+from salt.exceptions import SaltInvocationError
+
+# Import salt-api libs
+import saltapi
+import saltapi.utils
+
+
+def positional(tgt, fun, arg=(), timeout=None):
+    pass
+
+
+def with_kwargs(fun, **kwargs):
+    pass
+
+
+class ArgBinderTestCase(unittest.TestCase):
+    def assertSameAsFormatCall(self, fun, data):
+        expected = salt.utils.format_call(fun, data)
+        bound = saltapi.utils.format_call(fun, data)
+        self.assertEqual(bound['args'], expected['args'])
+        self.assertEqual(bound['kwargs'], expected['kwargs'])
+
+    def test_functions(self):
+        self.assertSameAsFormatCall(positional,
+                {'tgt': '*', 'fun': 'test.ping'})
+        self.assertSameAsFormatCall(positional,
+                {'tgt': '*', 'fun': 'test.arg', 'arg': [1], 'timeout': 5})
+        self.assertSameAsFormatCall(with_kwargs,
+                {'fun': 'jobs.lookup_jid', 'jid': '20140101000000000000'})
+
+    def test_salt_client_methods(self):
+        chunk = {'client': 'local_async', 'tgt': 'web*', 'fun': 'test.ping',
+                'arg': [], 'expr_form': 'glob', 'token': 'abc'}
+        self.assertSameAsFormatCall(salt.client.LocalClient.run_job, chunk)
+        self.assertSameAsFormatCall(salt.client.LocalClient.cmd_batch,
+                dict(chunk, batch='10%'))
+        self.assertSameAsFormatCall(salt.runner.RunnerClient.async,
+                {'fun': 'jobs.list_jobs', 'low': {}})
+
+    def test_api_client_methods(self):
+        client = saltapi.APIClient({})
+        chunk = {'client': 'local', 'tgt': '*', 'fun': 'test.ping',
+                'token': 'abc'}
+        self.assertSameAsFormatCall(client.local, chunk)
+        self.assertSameAsFormatCall(client.runner,
+                {'client': 'runner', 'fun': 'jobs.list_jobs'})
+
+    def test_data_not_changed(self):
+        data = {'tgt': '*', 'fun': 'test.ping', 'arg': [1]}
+        saltapi.utils.format_call(positional, data)
+        self.assertEqual(data, {'tgt': '*', 'fun': 'test.ping', 'arg': [1]})
+
+    def test_missing_argument(self):
+        self.assertRaises(SaltInvocationError, saltapi.utils.format_call,
+                positional, {'tgt': '*'})
+
+    def test_extra_keys_dropped(self):
+        ret = saltapi.utils.format_call(positional,
+                {'tgt': '*', 'fun': 'test.ping', 'client': 'local'})
+        self.assertEqual(ret, {'args': ['*', 'test.ping'],
+            'kwargs': {'arg': (), 'timeout': None}})
+
+    def test_binder_memoized(self):
+        first = saltapi.APIClient({})
+        second = saltapi.APIClient({})
+        self.assertIs(saltapi.utils.get_binder(first.local),
+                saltapi.utils.get_binder(second.local))
+
+
+if __name__ == '__main__':
+    unittest.main()